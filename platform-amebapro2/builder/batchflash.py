@@ -0,0 +1,61 @@
+# 產線多片同時燒錄：每個 port 一個 worker（數量有上限），各自重試、各自記 log 與耗時，最後印總表
+# 燒錄本身由呼叫端的 flash_one(port, log) 負責，這裡只管排程；配上 pty 與假的燒錄工具即可在一般 Linux 上測
+import glob
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def expand_ports(spec):
+    # "COM3 COM4" / "COM3,COM4" / "/dev/ttyUSB*" / list 都可以；glob 展開後去重並保持順序
+    items = spec.replace(",", " ").split() if isinstance(spec, str) else list(spec)
+    out = []
+    for item in items:
+        for p in (sorted(glob.glob(item)) if glob.has_magic(item) else [item]):
+            if p not in out:
+                out.append(p)
+    return out
+
+class Result:
+    __slots__ = ("port", "ok", "attempts", "seconds", "log_path", "error")
+
+    def __init__(self, port, ok, attempts, seconds, log_path, error):
+        self.port, self.ok, self.attempts = port, ok, attempts
+        self.seconds, self.log_path, self.error = seconds, log_path, error
+
+def _flash(port, flash_one, log_dir, retries):
+    path = os.path.join(log_dir, re.sub(r"[^A-Za-z0-9._-]", "_", port) + ".log")
+    t0 = time.monotonic()
+    ok, error, attempts = False, None, 0
+    with open(path, "w", encoding="utf-8") as f:
+        def log(*args):
+            f.write(" ".join(str(a) for a in args) + "\n")
+            f.flush()
+        for attempts in range(1, retries + 2):
+            log(f">>> [{port}] attempt {attempts}")
+            try:
+                ok, error = bool(flash_one(port, log)), None
+            except Exception as e:  # 單一 port 的錯誤不能拖垮整批
+                ok, error = False, str(e)
+                log("!!!", error)
+            if ok:
+                break
+        log(f">>> [{port}] {'PASS' if ok else 'FAIL'} after {attempts} attempt(s), {time.monotonic() - t0:.1f}s")
+    return Result(port, ok, attempts, time.monotonic() - t0, path, error)
+
+def run(ports, flash_one, log_dir, jobs=4, retries=1):
+    # flash_one(port, log) 回傳 True / False（或丟例外）；回傳順序跟 ports 相同
+    os.makedirs(log_dir, exist_ok=True)
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(ports)))) as pool:
+        return list(pool.map(lambda p: _flash(p, flash_one, log_dir, retries), ports))
+
+def table(results):
+    width = max([len(r.port) for r in results] + [4])
+    lines = [f"{'port':<{width}}  result  tries     time  log", "-" * (width + 40)]
+    for r in results:
+        lines.append(f"{r.port:<{width}}  {'PASS' if r.ok else 'FAIL':<6}  {r.attempts:>5}  {r.seconds:>6.1f}s  {r.log_path}")
+    passed = sum(r.ok for r in results)
+    lines.append(f"{passed}/{len(results)} passed")
+    return "\n".join(lines)
@@ -0,0 +1,104 @@
+# build 時間量測：_run()、SCons action、編譯 / 連結指令與檔案複製都記成事件（指令、cwd、wall / CPU 時間、
+# exit code、寫出的 bytes），build 結束時寫成 Chrome trace 格式（chrome://tracing 或 ui.perfetto.dev 開啟），
+# 並印出最慢的幾個步驟
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+_events = []
+_lock = threading.Lock()
+_t0 = time.perf_counter()
+_enabled = False
+
+def _cpu():
+    # 本行程 + 已結束子行程的 user + sys；多個 job 同時跑時 CPU 時間只是近似值
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def file_bytes(paths):
+    total = 0
+    for p in paths:
+        try:
+            total += os.path.getsize(str(p))
+        except OSError:
+            pass
+    return total
+
+class span:
+    # with span("elf2bin convert", "run", cmd=..., cwd=...) as args: ...; args 裡可再補 exit / bytes
+    def __init__(self, name, cat, **args):
+        self.name, self.cat, self.args = name, cat, args
+
+    def __enter__(self):
+        self._wall, self._cpu = time.perf_counter(), _cpu()
+        return self.args
+
+    def __exit__(self, exc_type, exc, tb):
+        if not _enabled:
+            return False
+        end = time.perf_counter()
+        if exc is not None:
+            self.args.setdefault("error", str(exc))
+        self.args["cpu_s"] = round(_cpu() - self._cpu, 3)
+        event = {
+            "name": self.name, "cat": self.cat, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": int((self._wall - _t0) * 1e6), "dur": int((end - self._wall) * 1e6), "args": self.args,
+        }
+        with _lock:
+            _events.append(event)
+        return False
+
+def action(fn, label=None):
+    # 包 SCons 的 Python action：事件名稱 = label + 第一個 target，bytes = 所有 target 的大小
+    label = label or fn.__name__.strip("_")
+
+    @functools.wraps(fn)
+    def _traced(target, source, env):
+        with span(f"{label} {os.path.basename(str(target[0]))}", "action") as args:
+            rc = fn(target=target, source=source, env=env)
+            args["exit"] = rc or 0
+            args["bytes"] = file_bytes(target)
+        return rc
+    return _traced
+
+def spawn(orig):
+    # 包 SCons 的 SPAWN：編譯 / 連結 / ar 等外部指令
+    def _spawn(sh, escape, cmd, args, env):
+        with span(os.path.basename(cmd), "spawn", cmd=" ".join(args)) as ev:
+            rc = orig(sh, escape, cmd, args, env)
+            ev["exit"] = rc
+        return rc
+    return _spawn
+
+def summary(top=10):
+    with _lock:
+        events = sorted(_events, key=lambda e: e["dur"], reverse=True)[:top]
+    lines = [f"{'seconds':>9}  {'cpu':>7}  step"]
+    for e in events:
+        lines.append(f"{e['dur'] / 1e6:>9.2f}  {e['args'].get('cpu_s', 0):>7.2f}  [{e['cat']}] {e['name']}")
+    return "\n".join(lines)
+
+def write(path):
+    with _lock:
+        events = list(_events)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    os.replace(tmp, path)
+
+def install(path, top=10):
+    # 開始記錄；行程結束時（SCons 跑完所有 target）寫檔並印出最慢的 top 個步驟
+    global _enabled
+    _enabled = True
+
+    def _finish():
+        if not _events:
+            return
+        write(path)
+        print(f">>> build trace: {path} ({len(_events)} events); slowest steps:")
+        print(summary(top))
+    atexit.register(_finish)
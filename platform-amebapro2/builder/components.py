@@ -0,0 +1,117 @@
+# SDK 元件清單：每組 source 宣告控制它的 config macro，macro 沒開就整組不編
+# macro 取自專案的 platform_opts.h / platform_opts_bt.h / lwipopts.h / mbedTLS config（gcc -dM -E）
+import fnmatch
+import subprocess
+
+# requires 裡的 macro 都要 defined 且非 0；sources 是相對 SDK 根目錄的 glob
+# 只寫每個檔案本身最外層 #if 用到的條件，關掉時跟編一個空的 .o 等價
+COMPONENT_MANIFEST = [
+    {"name": "bt",               "requires": ["CONFIG_BT"],
+     "sources": ["component/bluetooth/*"]},
+
+    {"name": "lwip_ppp",         "requires": ["PPP_SUPPORT"],
+     "sources": ["component/lwip/lwip_*/src/netif/ppp/*"]},
+    {"name": "lwip_ipv6",        "requires": ["LWIP_IPV6"],
+     "sources": ["component/lwip/lwip_*/src/core/ipv6/*",
+                 "component/lwip/lwip_*/src/netif/lowpan6*.c",
+                 "component/lwip/lwip_*/src/netif/zepif.c"]},
+    {"name": "lwip_slipif",      "requires": ["LWIP_HAVE_SLIPIF"],
+     "sources": ["component/lwip/lwip_*/src/netif/slipif.c"]},
+
+    {"name": "mbedtls_aesni",    "requires": ["MBEDTLS_AESNI_C"],    "sources": ["component/ssl/mbedtls-*/library/aesni.c"]},
+    {"name": "mbedtls_arc4",     "requires": ["MBEDTLS_ARC4_C"],     "sources": ["component/ssl/mbedtls-*/library/arc4.c"]},
+    {"name": "mbedtls_aria",     "requires": ["MBEDTLS_ARIA_C"],     "sources": ["component/ssl/mbedtls-*/library/aria.c"]},
+    {"name": "mbedtls_blowfish", "requires": ["MBEDTLS_BLOWFISH_C"], "sources": ["component/ssl/mbedtls-*/library/blowfish.c"]},
+    {"name": "mbedtls_camellia", "requires": ["MBEDTLS_CAMELLIA_C"], "sources": ["component/ssl/mbedtls-*/library/camellia.c"]},
+    {"name": "mbedtls_ccm",      "requires": ["MBEDTLS_CCM_C"],      "sources": ["component/ssl/mbedtls-*/library/ccm.c"]},
+    {"name": "mbedtls_chacha20", "requires": ["MBEDTLS_CHACHA20_C"], "sources": ["component/ssl/mbedtls-*/library/chacha20.c"]},
+    {"name": "mbedtls_chachapoly", "requires": ["MBEDTLS_CHACHAPOLY_C"], "sources": ["component/ssl/mbedtls-*/library/chachapoly.c"]},
+    {"name": "mbedtls_cmac",     "requires": ["MBEDTLS_CMAC_C"],     "sources": ["component/ssl/mbedtls-*/library/cmac.c"]},
+    {"name": "mbedtls_des",      "requires": ["MBEDTLS_DES_C"],      "sources": ["component/ssl/mbedtls-*/library/des.c"]},
+    {"name": "mbedtls_ecjpake",  "requires": ["MBEDTLS_ECJPAKE_C"],  "sources": ["component/ssl/mbedtls-*/library/ecjpake.c"]},
+    {"name": "mbedtls_havege",   "requires": ["MBEDTLS_HAVEGE_C"],   "sources": ["component/ssl/mbedtls-*/library/havege.c"]},
+    {"name": "mbedtls_md2",      "requires": ["MBEDTLS_MD2_C"],      "sources": ["component/ssl/mbedtls-*/library/md2.c"]},
+    {"name": "mbedtls_md4",      "requires": ["MBEDTLS_MD4_C"],      "sources": ["component/ssl/mbedtls-*/library/md4.c"]},
+    {"name": "mbedtls_memory_buffer_alloc", "requires": ["MBEDTLS_MEMORY_BUFFER_ALLOC_C"],
+     "sources": ["component/ssl/mbedtls-*/library/memory_buffer_alloc.c"]},
+    {"name": "mbedtls_nist_kw",  "requires": ["MBEDTLS_NIST_KW_C"],  "sources": ["component/ssl/mbedtls-*/library/nist_kw.c"]},
+    {"name": "mbedtls_padlock",  "requires": ["MBEDTLS_PADLOCK_C"],  "sources": ["component/ssl/mbedtls-*/library/padlock.c"]},
+    {"name": "mbedtls_pkcs11",   "requires": ["MBEDTLS_PKCS11_C"],   "sources": ["component/ssl/mbedtls-*/library/pkcs11.c"]},
+    {"name": "mbedtls_poly1305", "requires": ["MBEDTLS_POLY1305_C"], "sources": ["component/ssl/mbedtls-*/library/poly1305.c"]},
+    {"name": "mbedtls_psa",      "requires": ["MBEDTLS_PSA_CRYPTO_C"],
+     "sources": ["component/ssl/mbedtls-*/library/psa_crypto.c",
+                 "component/ssl/mbedtls-*/library/psa_crypto_[!c]*.c"]},
+    {"name": "mbedtls_psa_client", "requires": ["MBEDTLS_PSA_CRYPTO_CLIENT"],
+     "sources": ["component/ssl/mbedtls-*/library/psa_crypto_client.c"]},
+    {"name": "mbedtls_psa_its",  "requires": ["MBEDTLS_PSA_ITS_FILE_C"],
+     "sources": ["component/ssl/mbedtls-*/library/psa_its_file.c"]},
+    {"name": "mbedtls_ripemd160", "requires": ["MBEDTLS_RIPEMD160_C"], "sources": ["component/ssl/mbedtls-*/library/ripemd160.c"]},
+    {"name": "mbedtls_tls13",    "requires": ["MBEDTLS_SSL_PROTO_TLS1_3_EXPERIMENTAL"],
+     "sources": ["component/ssl/mbedtls-*/library/mps_*.c",
+                 "component/ssl/mbedtls-*/library/ssl_tls13_keys.c"]},
+    {"name": "mbedtls_xtea",     "requires": ["MBEDTLS_XTEA_C"],     "sources": ["component/ssl/mbedtls-*/library/xtea.c"]},
+]
+
+# 跟 mbedTLS library/common.h 一樣的 config 選法；沒有的 header 就略過
+PROBE_SOURCE = """
+#if __has_include("platform_opts.h")
+#include "platform_opts.h"
+#endif
+#if __has_include("platform_opts_bt.h")
+#include "platform_opts_bt.h"
+#endif
+#if __has_include("lwipopts.h")
+#include "lwipopts.h"
+#endif
+#if __has_include("lwip/opt.h")
+#include "lwip/opt.h"
+#endif
+#if defined(MBEDTLS_CONFIG_FILE)
+#include MBEDTLS_CONFIG_FILE
+#elif __has_include("mbedtls/config.h")
+#include "mbedtls/config.h"
+#endif
+"""
+
+def probe_macros(args, env=None):
+    # args: [cc, 旗標...]（含 -I / -D）；失敗回傳 None，呼叫端就不做裁剪
+    try:
+        r = subprocess.run(list(args) + ["-dM", "-E", "-x", "c", "-"], input=PROBE_SOURCE,
+                           capture_output=True, text=True, env=env)
+    except OSError:
+        # compiler 不存在 / 不能執行
+        return None
+    if r.returncode != 0:
+        return None
+    macros = {}
+    for line in r.stdout.splitlines():
+        parts = line.split(None, 2)
+        if len(parts) >= 2 and parts[0] == "#define" and "(" not in parts[1]:
+            macros[parts[1]] = parts[2] if len(parts) > 2 else ""
+    return macros
+
+def _enabled(macros, name):
+    if name not in macros:
+        return False
+    value = macros[name].strip().strip("()").rstrip("uUlL")
+    try:
+        return int(value, 0) != 0
+    except ValueError:
+        # 空值或其他運算式：有 define 就算開
+        return True
+
+def disabled_groups(macros):
+    return [g for g in COMPONENT_MANIFEST if not all(_enabled(macros, m) for m in g["requires"])]
+
+def prune(srcs, rel, macros):
+    # rel: src -> 相對 SDK 根目錄的路徑；回傳 (保留的 src, 被關掉的 group 名稱)
+    off = disabled_groups(macros)
+    kept, dropped = [], set()
+    for s in srcs:
+        r = rel(s)
+        hit = next((g for g in off if any(fnmatch.fnmatch(r, p) for p in g["sources"])), None)
+        if hit:
+            dropped.add(hit["name"])
+        else:
+            kept.append(s)
+    return kept, sorted(dropped)
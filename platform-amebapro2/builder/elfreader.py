@@ -0,0 +1,180 @@
+# 純 Python 的 ELF32 (little-endian / ARM) 讀取器，取代 nm -n / size 的 subprocess
+# 一個 ELF 只 parse 一次（以 path + size + mtime 快取），nm map / .symbols / section 大小都從同一份結果輸出
+import mmap
+import os
+import struct
+import threading
+
+SHT_NOBITS = 8
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+
+SHN_UNDEF = 0
+SHN_ABS = 0xFFF1
+SHN_COMMON = 0xFFF2
+
+STB_LOCAL, STB_GLOBAL, STB_WEAK, STB_GNU_UNIQUE = 0, 1, 2, 10
+STT_OBJECT, STT_FUNC, STT_SECTION, STT_FILE, STT_GNU_IFUNC = 1, 2, 3, 4, 10
+
+EM_ARM = 40
+
+class ELFError(Exception):
+    pass
+
+class Section:
+    __slots__ = ("name", "type", "flags", "addr", "offset", "size", "link", "entsize")
+
+    def __init__(self, name, type, flags, addr, offset, size, link, entsize):
+        self.name, self.type, self.flags, self.addr = name, type, flags, addr
+        self.offset, self.size, self.link, self.entsize = offset, size, link, entsize
+
+class Symbol:
+    __slots__ = ("name", "value", "size", "bind", "type", "shndx")
+
+    def __init__(self, name, value, size, bind, type, shndx):
+        self.name, self.value, self.size = name, value, size
+        self.bind, self.type, self.shndx = bind, type, shndx
+
+def _cstr(buf, off):
+    end = buf.find(b"\0", off)
+    return buf[off:end].decode("latin-1")
+
+class ELFFile:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse(buf)
+        finally:
+            buf.close()
+
+    def _parse(self, buf):
+        if len(buf) < 52 or buf[:4] != b"\x7fELF":
+            raise ELFError(f"{self.path}: not an ELF file")
+        if buf[4] != 1 or buf[5] != 1:
+            raise ELFError(f"{self.path}: only ELF32 little-endian is supported")
+        (_, _, self.machine, _, self.entry, _, shoff, _, _, _, _,
+         shentsize, shnum, shstrndx) = struct.unpack_from("<16sHHIIIIIHHHHHH", buf, 0)
+
+        raw = [struct.unpack_from("<10I", buf, shoff + i * shentsize) for i in range(shnum)]
+        strtab_off = raw[shstrndx][4] if shstrndx < shnum else None
+        self.sections = [
+            Section(_cstr(buf, strtab_off + r[0]) if strtab_off is not None else "",
+                    r[1], r[2], r[3], r[4], r[5], r[6], r[9])
+            for r in raw
+        ]
+
+        self.symbols = []
+        for sec in self.sections:
+            if sec.type != 2:  # SHT_SYMTAB
+                continue
+            names = self.sections[sec.link].offset
+            for off in range(sec.offset + sec.entsize, sec.offset + sec.size, sec.entsize):
+                st_name, value, size, info, _, shndx = struct.unpack_from("<IIIBBH", buf, off)
+                bind, typ = info >> 4, info & 0xF
+                # ARM 的 Thumb 函式在 symtab 裡 bit0 = 1，nm 顯示時會清掉
+                if self.machine == EM_ARM and typ in (STT_FUNC, STT_GNU_IFUNC):
+                    value &= ~1
+                self.symbols.append(Symbol(_cstr(buf, names + st_name), value, size, bind, typ, shndx))
+
+    # ---- nm ----
+    def _nm_type(self, sym):
+        if sym.shndx == SHN_COMMON:
+            return "C"
+        if sym.shndx == SHN_UNDEF:
+            if sym.bind == STB_WEAK:
+                return "v" if sym.type == STT_OBJECT else "w"
+            return "U"
+        if sym.type == STT_GNU_IFUNC:
+            return "i"
+        if sym.bind == STB_WEAK:
+            return "V" if sym.type == STT_OBJECT else "W"
+        if sym.bind == STB_GNU_UNIQUE:
+            return "u"
+        if sym.shndx == SHN_ABS:
+            c = "a"
+        elif sym.shndx < len(self.sections):
+            sec = self.sections[sym.shndx]
+            if sec.flags & SHF_EXECINSTR:
+                c = "t"
+            elif sec.flags & SHF_ALLOC:
+                if sec.type == SHT_NOBITS:
+                    c = "b"
+                else:
+                    c = "d" if sec.flags & SHF_WRITE else "r"
+            elif sec.name.startswith(".debug"):
+                c = "N"
+            else:
+                c = "n"
+        else:
+            c = "?"
+        return c.upper() if sym.bind == STB_GLOBAL else c
+
+    def nm_symbols(self):
+        # 跟 `nm -n` 一樣：不列 section / file 符號與 ARM mapping symbol（$a / $t / $d）；
+        # undefined 排最前面，其餘依位址、同位址依名稱
+        out = []
+        for sym in self.symbols:
+            if sym.type in (STT_SECTION, STT_FILE) or not sym.name:
+                continue
+            if sym.name[:2] in ("$a", "$t", "$d") and (len(sym.name) == 2 or sym.name[2] == "."):
+                continue
+            out.append((sym, self._nm_type(sym)))
+        out.sort(key=lambda e: (e[0].shndx != SHN_UNDEF, e[0].value, e[0].name))
+        return out
+
+    def nm_lines(self):
+        for sym, c in self.nm_symbols():
+            if c in ("U", "w", "v") and sym.shndx == SHN_UNDEF:
+                yield f"         {c} {sym.name}\n"
+            else:
+                yield f"{sym.value:08x} {c} {sym.name}\n"
+
+    def write_nm(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(self.nm_lines())
+
+    # ---- size ----
+    def section_sizes(self):
+        # [(name, size, addr)]，只列會載入的 section（同 `size -A` 的重點部分）
+        return [(s.name, s.size, s.addr) for s in self.sections if s.flags & SHF_ALLOC and s.size]
+
+    def size_summary(self):
+        text = data = bss = 0
+        for s in self.sections:
+            if not s.flags & SHF_ALLOC:
+                continue
+            if s.type == SHT_NOBITS:
+                bss += s.size
+            elif s.flags & SHF_WRITE:
+                data += s.size
+            else:
+                text += s.size
+        return {"text": text, "data": data, "bss": bss}
+
+    def write_sizes(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"{os.path.basename(self.path)}:\n")
+            f.write(f"{'section':<32}{'size':>12}{'addr':>12}\n")
+            for name, size, addr in self.section_sizes():
+                f.write(f"{name:<32}{size:>12}{addr:>#12x}\n")
+            s = self.size_summary()
+            f.write(f"\ntext={s['text']} data={s['data']} bss={s['bss']} "
+                    f"total={s['text'] + s['data'] + s['bss']}\n")
+
+_cache = {}
+_lock = threading.Lock()
+
+def load(path):
+    # 同一個 ELF（path + size + mtime 相同）在同一次 build 裡只 parse 一次，可跨 thread 共用
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _lock:
+        elf = _cache.get(key)
+    if elf is None:
+        elf = ELFFile(path)
+        with _lock:
+            _cache[key] = elf
+    return elf
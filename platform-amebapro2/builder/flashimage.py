@@ -0,0 +1,146 @@
+# flash image 的分區增量組裝
+# 第一次照常用 elf2bin combine 產出完整 image，並驗證 image 恰好等於「各分區原封不動放在 partition table
+# 的位址上，其餘全是 0xFF」；驗證過的 image 之後只就地改寫內容有變的分區，結果跟重新 combine 相同
+import hashlib
+import json
+import os
+
+ERASED = 0xFF
+
+def _int(v):
+    if isinstance(v, int):
+        return v
+    return int(str(v), 0)
+
+def load_layout(partitiontable_json):
+    # 回傳 {分區名稱: (起始位址, 長度)}；格式不認得的項目略過（找不到的分區呼叫端會退回完整 combine）
+    with open(partitiontable_json, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    layout = {}
+
+    def _walk(node, name=None):
+        if isinstance(node, dict):
+            start = next((node[k] for k in ("start_addr", "start", "offset", "addr") if k in node), None)
+            length = next((node[k] for k in ("length", "size", "len") if k in node), None)
+            label = node.get("type") or name
+            if start is not None and length is not None and isinstance(label, str):
+                try:
+                    layout[label] = (_int(start), _int(length))
+                except ValueError:
+                    pass
+            for k, v in node.items():
+                _walk(v, k)
+        elif isinstance(node, list):
+            for v in node:
+                _walk(v, name)
+
+    _walk(data)
+    return layout
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+class FlashImage:
+    def __init__(self, image, layout_key):
+        # layout_key：partition table json + elf2bin 的雜湊；變了就不能沿用舊的驗證結果
+        self.image = image
+        self.manifest_path = image + ".manifest.json"
+        self.layout_key = layout_key
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def valid_manifest(self):
+        # manifest 且 image 沒被 assembler 以外的流程改過（例如 hash / sign 重新 combine）
+        m = self.manifest()
+        try:
+            return m if m and m.get("image") == self._image_stat() else None
+        except OSError:
+            return None
+
+    def _image_stat(self):
+        st = os.stat(self.image)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _save(self, parts):
+        m = {"layout_key": self.layout_key, "image": self._image_stat(), "parts": parts}
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(m, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    def _drop(self):
+        try:
+            os.remove(self.manifest_path)
+        except OSError:
+            pass
+
+    def _verify(self, parts, layout):
+        # 完整 combine 之後：每個分區在 layout 位址上原封不動、分區以外全是 0xFF，才記錄成可增量的 manifest
+        with open(self.image, "rb") as f:
+            image = f.read()
+        recorded, regions = {}, []
+        for name, path in parts:
+            if name not in layout:
+                return None
+            offset, length = layout[name]
+            with open(path, "rb") as p:
+                data = p.read()
+            if len(data) > length or image[offset:offset + len(data)] != data:
+                return None
+            recorded[name] = {"offset": offset, "length": length, "size": len(data), "sha": _sha(data)}
+            regions.append((offset, offset + len(data)))
+        pos = 0
+        for start, end in sorted(regions) + [(len(image), len(image))]:
+            if start < pos:
+                return None  # 分區重疊
+            gap = image[pos:start]
+            if gap.count(ERASED) != len(gap):
+                return None
+            pos = end
+        return recorded
+
+    def assemble(self, parts, layout, full_combine):
+        # parts: [(分區名稱, 檔案路徑)]；full_combine() 用 elf2bin 產出完整 image
+        # 回傳 "unchanged" / "patched: ..." / "full"
+        m = self.manifest()
+        usable = (m is not None and os.path.exists(self.image) and m.get("layout_key") == self.layout_key
+                  and m.get("image") == self._image_stat() and set(m.get("parts", {})) == {n for n, _ in parts})
+        if usable:
+            changes = []
+            for name, path in parts:
+                with open(path, "rb") as p:
+                    data = p.read()
+                old = m["parts"][name]
+                if _sha(data) == old["sha"]:
+                    continue
+                # 超出分區、或最後一個分區大小改變（image 總長會跟 combine 不同）就整包重組
+                if len(data) > old["length"] or \
+                   (len(data) != old["size"] and old["offset"] + old["size"] == m["image"][0]):
+                    usable = False
+                    break
+                changes.append((name, data))
+            if usable and not changes:
+                return "unchanged"
+        if usable:
+            with open(self.image, "r+b") as f:
+                for name, data in changes:
+                    old = m["parts"][name]
+                    f.seek(old["offset"])
+                    f.write(data)
+                    if len(data) < old["size"]:
+                        f.write(bytes([ERASED]) * (old["size"] - len(data)))
+                    old.update(size=len(data), sha=_sha(data))
+            self._save(m["parts"])
+            return "patched: " + ", ".join(n for n, _ in changes)
+
+        self._drop()
+        full_combine()
+        recorded = self._verify(parts, layout) if os.path.exists(self.image) else None
+        if recorded is not None:
+            self._save(recorded)
+        return "full"
@@ -0,0 +1,150 @@
+# include 路徑索引：把 CPPPATH 底下的檔案一次列出來，#include 的解析變成查 set，不用每個 -I 目錄都 stat 一次
+# SDK store 的內容由 revision 決定，列表快取在 include_index.json；專案 include/ 與 build_flags 的 -I 每次重列，
+# 查詢時照常 stat（build 中產生的 header 不會漏掉）
+# 另外提供：刪掉解析不到任何東西的 -I 目錄、列出專案 header 蓋掉 SDK header 的情況
+import bisect
+import json
+import os
+
+def _norm(p):
+    return os.path.normcase(os.path.normpath(p))
+
+def _tops(dirs):
+    # 只需要走最上層的目錄；子目錄的檔案已經包含在內
+    out = []
+    for d in sorted({_norm(d) for d in dirs}):
+        if not any(d.startswith(t + os.sep) for t in out):
+            out.append(d)
+    return out
+
+def _walk(top):
+    files = []
+    for root, dirnames, names in os.walk(top):
+        dirnames[:] = [n for n in dirnames if not n.startswith(".")]
+        rel = os.path.relpath(root, top)
+        for n in names:
+            files.append(n if rel == "." else os.path.join(rel, n))
+    return files
+
+class HeaderIndex:
+    def __init__(self, dirs, cache_path, cache_key, stable_root):
+        # stable_root 底下（SDK store）的列表可以快取；其他目錄每次重列
+        self.cache_path = cache_path
+        self.files = set()
+        self.tops = _tops(d for d in dirs if os.path.isdir(d))
+        self._memo = {}
+        self.stable_root = stable_root = _norm(stable_root)
+        cache = self._load(cache_key)
+        dirty = False
+        for top in self.tops:
+            stable = self.stable(top)
+            listed = cache["tops"].get(top) if stable else None
+            if listed is None:
+                listed = _walk(top)
+                if stable:
+                    cache["tops"][top] = listed
+                    dirty = True
+            self.files.update(_norm(os.path.join(top, f)) for f in listed)
+        if dirty:
+            self._save(cache)
+        self._sorted = sorted(self.files)
+        self._covers = {}
+
+    def _load(self, key):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("key") == key:
+                return data
+        except (OSError, ValueError):
+            pass
+        return {"key": key, "tops": {}}
+
+    def _save(self, data):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp = self.cache_path + f".{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.cache_path)
+
+    def covers(self, d):
+        d = _norm(d)
+        if d not in self._covers:
+            self._covers[d] = any(d == t or d.startswith(t + os.sep) for t in self.tops)
+        return self._covers[d]
+
+    def stable(self, d):
+        d = _norm(d)
+        return d == self.stable_root or d.startswith(self.stable_root + os.sep)
+
+    def exists(self, path):
+        # 只有 SDK store 底下查 set；專案 include/、build_flags 的 -I 可能有 build 中才產生的 header，照常 stat
+        path = _norm(path)
+        d = os.path.dirname(path)
+        return path in self.files if self.stable(d) and self.covers(d) else os.path.isfile(path)
+
+    def resolve(self, name, dirs):
+        # 跟 GCC 的 -I 順序一樣，回傳第一個找得到 name 的完整路徑；找不到回傳 None
+        key = (name, dirs)
+        if key not in self._memo:
+            self._memo[key] = next((os.path.join(d, name) for d in dirs if self.exists(os.path.join(d, name))), None)
+        return self._memo[key]
+
+    def _under(self, d):
+        d = _norm(d) + os.sep
+        out = []
+        for f in self._sorted[bisect.bisect_left(self._sorted, d):]:
+            if not f.startswith(d):
+                break
+            out.append(f[len(d):])
+        return out
+
+    def prune(self, dirs):
+        # 回傳 (保留, [(刪掉的目錄, 原因)])：不存在、沒有任何檔案、或裡面每個檔案都會先在前面的目錄找到
+        # （前面那份有 #include_next 時不刪，因為它會接著往後找）；只刪 SDK store 底下的目錄，
+        # 專案 include/、build_flags 的 -I、build 目錄裡的 header 可能還沒產生，一律保留
+        kept, dropped = [], []
+        for d in dirs:
+            if not self.stable(d):
+                kept.append(d)
+                continue
+            if not os.path.isdir(d):
+                dropped.append((d, "missing"))
+                continue
+            if not self.covers(d):
+                kept.append(d)
+                continue
+            names = self._under(d)
+            if not names:
+                dropped.append((d, "empty"))
+                continue
+            earlier = tuple(kept)
+            shadows = [self.resolve(n, earlier) for n in names]
+            if all(shadows) and not any(_has_include_next(s) for s in shadows):
+                dropped.append((d, "shadowed"))
+                continue
+            kept.append(d)
+        return kept, dropped
+
+    def shadowed(self, project_dirs, dirs):
+        # 專案目錄的 header 蓋掉後面 SDK 目錄的同名 header：[(名稱, 專案那份, SDK 那份)]
+        out = []
+        project = [_norm(p) for p in project_dirs]
+        for p in project:
+            if not os.path.isdir(p):
+                continue
+            later = tuple(d for d in dirs if _norm(d) not in project)
+            for name in sorted(_walk(p)):
+                if not name.endswith((".h", ".hpp")):
+                    continue
+                other = self.resolve(name, later)
+                if other:
+                    out.append((name, os.path.join(p, name), other))
+        return out
+
+def _has_include_next(path):
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return "include_next" in f.read()
+    except OSError:
+        return False
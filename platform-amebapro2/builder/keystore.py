@@ -0,0 +1,57 @@
+# 簽章金鑰庫：同一份 key_cfg.json 只跑一次 elf2bin keygen，所有 environment / clean 之後都用同一組 key，
+# 簽章結果才可重現。每種 key_cfg 內容一個子目錄 <root>/<cfg 雜湊>/，換回舊設定時沿用當時的 key
+import hashlib
+import os
+import shutil
+import tempfile
+
+PUBLIC = "key_public.json"
+PRIVATE = "key_private.json"
+
+def cfg_hash(key_cfg):
+    with open(key_cfg, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class KeyStore:
+    def __init__(self, root):
+        self.root = root
+
+    def slot(self, key_cfg):
+        return os.path.join(self.root, cfg_hash(key_cfg)[:16])
+
+    def keys(self, key_cfg):
+        d = self.slot(key_cfg)
+        return os.path.join(d, PUBLIC), os.path.join(d, PRIVATE)
+
+    def fingerprint(self, key_cfg):
+        with open(self.keys(key_cfg)[0], "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+
+    def ensure(self, key_cfg, keygen):
+        # 回傳 (key_public.json, key_private.json, 是否新產生)；keygen(cwd) 要在 cwd 產出兩個 key 檔
+        # 在暫存目錄產生後整個目錄 rename 進去，並行的 build 只會有一份生效
+        public, private = self.keys(key_cfg)
+        if os.path.exists(public) and os.path.exists(private):
+            return public, private, False
+        os.makedirs(self.root, exist_ok=True)
+        work = tempfile.mkdtemp(prefix=".keygen-", dir=self.root)
+        try:
+            keygen(work)
+            if not all(os.path.exists(os.path.join(work, n)) for n in (PUBLIC, PRIVATE)):
+                raise RuntimeError(f"keygen did not produce {PUBLIC} / {PRIVATE}")
+            for name in os.listdir(work):
+                if name not in (PUBLIC, PRIVATE):
+                    os.remove(os.path.join(work, name))
+            os.chmod(os.path.join(work, PRIVATE), 0o600)
+            with open(os.path.join(work, "key_cfg.json"), "wb") as wf, open(key_cfg, "rb") as rf:
+                wf.write(rf.read())
+            try:
+                os.rename(work, self.slot(key_cfg))
+            except OSError:
+                # 別的 build 先放好了；用它的
+                if not os.path.exists(private):
+                    raise
+                return public, private, False
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+        return public, private, True
@@ -1,29 +1,70 @@
 import os
-from SCons.Script import DefaultEnvironment, AlwaysBuild, Alias
+import sys
+from SCons.Script import DefaultEnvironment, AlwaysBuild, Alias, Action, Return, COMMAND_LINE_TARGETS
+import SCons.Builder
+import SCons.Tool
+import SCons.Scanner
+import SCons.Util
 import glob
+import fnmatch
 import subprocess
 import re
 import struct
 import shutil
 import json
+import hashlib
+import atexit
+import copy
+import time
 
 MBEDTLS_VERSION = "2.28.1"
 LWIP_VERSION = "v2.1.2"
 
 env = DefaultEnvironment() # SDK 與 Toolchain 路徑
 
+# builder/ 底下的輔助模組
+sys.path.insert(0, os.path.join(env.PioPlatform().get_dir(), "builder"))
+from stampdb import StampDB
+from keystore import KeyStore
+from sigcache import SigCache
+from uploadstate import DeviceState, BaudCache, BAUD_LADDER, changed_partitions, region
+import sdkstore
+from objcache import ObjCache
+import components
+import elfreader
+from publish import publish
+from flashimage import FlashImage, load_layout
+import sparseimage
+import batchflash
+import buildtrace
+import runner
+import pch
+import incindex
+import unity
+import sizereport
+
 sdk_dir = os.path.join(env.subst("$PROJECT_DIR"), ".pio", "framework-ameba-rtos-pro2")
 
-if not os.path.exists(sdk_dir):
-    print(">>> Cloning Ameba Pro2 SDK ...")
-    subprocess.check_call([
-        "git", "clone", "--depth=1",
-        "https://github.com/Ameba-AIoT/ameba-rtos-pro2.git",
-        sdk_dir
-    ])
+# SDK 佈建：sdk_revision 固定 commit / tag；sdk_archive(+sdk_archive_sha256) 或 sdk_mirror 可完全離線
+# store 跨專案共用（預設 $PROJECT_CORE_DIR/.cache/amebapro2/sdk），專案內只放 hardlink checkout
+def _sdk_option(name, envvar):
+    return env.GetProjectOption(name, "") or os.environ.get(envvar, "")
+
+sdk_info = sdkstore.provision(
+    sdk_dir,
+    _sdk_option("sdk_store_dir", "AMEBAPRO2_SDK_STORE") or
+        os.path.join(env.subst("$PROJECT_CORE_DIR"), ".cache", "amebapro2", "sdk"),
+    revision=_sdk_option("sdk_revision", "AMEBAPRO2_SDK_REVISION") or None,
+    archive=_sdk_option("sdk_archive", "AMEBAPRO2_SDK_ARCHIVE") or None,
+    archive_sha256=_sdk_option("sdk_archive_sha256", "AMEBAPRO2_SDK_ARCHIVE_SHA256") or None,
+    mirror=_sdk_option("sdk_mirror", "AMEBAPRO2_SDK_MIRROR") or None,
+    offline=bool(int(_sdk_option("sdk_offline", "AMEBAPRO2_SDK_OFFLINE") or 0)),
+    pin_file=os.path.join(env.subst("$PROJECT_DIR"), "amebapro2_sdk.lock"),
+)
 
+# SDK 預設的 lwipopts.h 會蓋掉專案 include/ 那份（同目錄的 "lwipopts.h" 先找到），從專案 checkout 拿掉；
+# checkout 是 store 的 hardlink，刪掉的只是這個連結，store 不受影響
 sdk_lwipopts = os.path.join(sdk_dir, "component", "lwip", "api", "lwipopts.h")
-
 if os.path.exists(sdk_lwipopts):
     print(f">>> Removing default lwipopts.h: {sdk_lwipopts}")
     os.remove(sdk_lwipopts)
@@ -45,6 +86,68 @@ UNITEST    = int(env.GetProjectOption("unitest") or
 
 PRELOAD_NN = int(env.GetProjectOption("preload_nn") or os.environ.get("PRELOAD_NN", "1"))
 
+# 依 platform_opts*.h / lwipopts.h / mbedTLS config 裁掉沒開的 SDK 元件：prune_components = 0 關閉
+PRUNE_COMPONENTS = int(env.GetProjectOption("prune_components", "") or os.environ.get("AMEBAPRO2_PRUNE_COMPONENTS", "1"))
+
+# SDK 物件快取：obj_cache = 0 關閉；obj_cache_dir 可指到團隊共用目錄
+USE_OBJ_CACHE = int(env.GetProjectOption("obj_cache", "") or os.environ.get("AMEBAPRO2_OBJ_CACHE", "1"))
+OBJ_CACHE_DIR = (env.GetProjectOption("obj_cache_dir", "") or
+                 os.environ.get("AMEBAPRO2_OBJ_CACHE_DIR") or
+                 os.path.join(env.subst("$PROJECT_CORE_DIR"), ".cache", "amebapro2", "objcache"))
+# 快取上限（MB）：build 結束時從最久沒用到的物件 / archive 刪起，0 = 不限
+OBJ_CACHE_MAX_MB = float(env.GetProjectOption("obj_cache_max_mb", "") or os.environ.get("AMEBAPRO2_OBJ_CACHE_MAX_MB", "2048"))
+
+# 稀疏 flash image（只存非 0xFF 的 sector）：sparse_image = 1 時跟 flat image 一起產出並放進 output/
+SPARSE_IMAGE = int(env.GetProjectOption("sparse_image", "") or os.environ.get("AMEBAPRO2_SPARSE_IMAGE", "0"))
+
+# build 時間量測：build_trace = 0 關閉；結束時寫 build_trace.json（Chrome trace）並印出最慢的 build_trace_top 個步驟
+BUILD_TRACE = int(env.GetProjectOption("build_trace", "") or os.environ.get("AMEBAPRO2_BUILD_TRACE", "1"))
+BUILD_TRACE_TOP = int(env.GetProjectOption("build_trace_top", "") or os.environ.get("AMEBAPRO2_BUILD_TRACE_TOP", "10"))
+
+# precompiled header（env_application / env_bootloader 共用的 SDK header）：pch = 1 開啟
+USE_PCH = int(env.GetProjectOption("pch", "") or os.environ.get("AMEBAPRO2_PCH", "0"))
+
+# include 路徑索引（header 解析查表、刪掉沒用的 -I、提示被專案蓋掉的 SDK header）：include_index = 0 關閉
+USE_INCLUDE_INDEX = int(env.GetProjectOption("include_index", "") or os.environ.get("AMEBAPRO2_INCLUDE_INDEX", "1"))
+
+# unity build（lwIP / mbedTLS 的 .c 分批合併編譯）：unity_build = 1 開啟，unity_batch 為每批檔案數，
+# unity_exclude 可列一定要單獨編的檔案（相對 SDK 的 glob）
+UNITY_BUILD = int(env.GetProjectOption("unity_build", "") or os.environ.get("AMEBAPRO2_UNITY_BUILD", "0"))
+UNITY_BATCH = int(env.GetProjectOption("unity_batch", "") or os.environ.get("AMEBAPRO2_UNITY_BATCH", "16"))
+UNITY_EXCLUDE = (env.GetProjectOption("unity_exclude", "") or os.environ.get("AMEBAPRO2_UNITY_EXCLUDE", "")).split()
+
+# application 的最佳化 profile：amebapro2_profile = size（預設）| speed | lto | debug；bootloader 一律 -Os
+# lto 用 fat LTO 物件，快取的 SDK archive 不經 LTO 連結也能用
+PROFILES = {
+    "size":  {"ccflags": ["-Os"], "linkflags": []},
+    "speed": {"ccflags": ["-O2"], "linkflags": []},
+    "lto":   {"ccflags": ["-Os", "-flto", "-ffat-lto-objects"], "linkflags": ["-Os", "-flto"]},
+    "debug": {"ccflags": ["-Og", "-g3"], "linkflags": []},
+}
+PROFILE = (env.GetProjectOption("amebapro2_profile", "") or os.environ.get("AMEBAPRO2_PROFILE", "size")).strip().lower()
+if PROFILE not in PROFILES:
+    raise ValueError(f"amebapro2_profile = {PROFILE}: expected one of {', '.join(PROFILES)}")
+
+# 個別檔案的旗標覆寫：amebapro2_opt_overrides 每行 "<glob> = <旗標>"，glob 對 SDK（專案檔案對專案目錄）的相對路徑，
+# 沒有 / 的 glob 只比對檔名；旗標接在 profile 之後（後面的 -O 會蓋掉前面的）。符合的檔案不走 PCH / unity build
+OPT_OVERRIDES = []
+for _line in (env.GetProjectOption("amebapro2_opt_overrides", "") or
+              os.environ.get("AMEBAPRO2_OPT_OVERRIDES", "")).splitlines():
+    _pat, _eq, _flags = _line.partition("=")
+    if _line.strip() and not _eq:
+        raise ValueError(f"amebapro2_opt_overrides: expected '<glob> = <flags>', got {_line.strip()!r}")
+    if _pat.strip() and _flags.split():
+        OPT_OVERRIDES.append((_pat.strip(), _flags.split()))
+
+# 簽章金鑰庫：預設在專案的 .pio/amebapro2_keys（所有 environment 共用，pio run -t clean 不會刪）；
+# key_store 可指到團隊共用或版本控管的目錄，讓簽章在不同機器上也一致
+KEY_STORE_DIR = (env.GetProjectOption("key_store", "") or os.environ.get("AMEBAPRO2_KEY_STORE") or
+                 os.path.join(env.subst("$PROJECT_DIR"), ".pio", "amebapro2_keys"))
+
+# 簽章快取（hash / sign / sign_enc）：預設 .pio/amebapro2_sigcache，所有 environment 共用
+SIGN_CACHE_DIR = (env.GetProjectOption("sign_cache_dir", "") or os.environ.get("AMEBAPRO2_SIGN_CACHE_DIR") or
+                  os.path.join(env.subst("$PROJECT_DIR"), ".pio", "amebapro2_sigcache"))
+
 # 兼容多種格式
 flags = env.GetProjectOption("build_flags")
 if not flags:
@@ -113,6 +216,333 @@ build_dir = os.path.join(env.subst("$BUILD_DIR"), "amebapro2")
 if not os.path.exists(build_dir): 
     os.makedirs(build_dir) 
 
+# 跨 build 保留的快取（放在 .pio/ 下，`pio run -t clean` 不會清掉）
+project_cache_dir = os.path.join(env.subst("$PROJECT_DIR"), ".pio", "amebapro2_cache", env.subst("$PIOENV"))
+
+if BUILD_TRACE:
+    buildtrace.install(os.path.join(build_dir, "build_trace.json"), BUILD_TRACE_TOP)
+    if env.get("SPAWN"):
+        env["SPAWN"] = buildtrace.spawn(env["SPAWN"])
+
+# 外部工具（elf2bin / checksum / uartfwburn ...）逾時秒數，0 = 不限；併發上限跟 SCons -j 一致
+TOOL_TIMEOUT = float(env.GetProjectOption("tool_timeout", "") or os.environ.get("AMEBAPRO2_TOOL_TIMEOUT", "600"))
+runner.configure(env.GetOption("num_jobs") or 1)
+# 一次燒錄（整個 baud rate 階梯）最多花多久，0 = 不限；每次嘗試的逾時也不會超過剩下的時間
+UPLOAD_TIMEOUT = float(env.GetProjectOption("upload_timeout", "") or os.environ.get("AMEBAPRO2_UPLOAD_TIMEOUT", "300"))
+
+def _run(cmd, strict=True, cwd=None, log=print, timeout=None, limit=True, outputs=()):
+    # 支援 list 或字串；輸出逐行即時印出（前綴工具名稱），逾時砍掉整個 process tree
+    # log 可換成寫檔（批次燒錄時每個 port 各一份 log）；outputs 是這個工具寫出的檔案，trace 的 bytes 記它們的大小
+    argv = cmd.split() if isinstance(cmd, str) else cmd
+    name = " ".join([os.path.basename(argv[0])] + [a for a in argv[1:2] if not a.startswith("-")]) if argv else "run"
+    printable = cmd if isinstance(cmd, str) else " ".join(cmd)
+    timeout = TOOL_TIMEOUT if timeout is None else timeout
+    log(">>>", printable)
+    with buildtrace.span(name, "run", cmd=printable, cwd=cwd or os.getcwd()) as ev:
+        rc, ev["stdout_bytes"] = runner.run(cmd, cwd=cwd, timeout=timeout or None, prefix=f"    [{name}] ",
+                                             log=log, limit=limit)
+        ev["exit"] = rc
+        ev["bytes"] = buildtrace.file_bytes(outputs)
+    if strict and rc != 0:
+        reason = f" (timed out after {timeout:g}s)" if rc == runner.TIMEOUT_EXIT else ""
+        raise RuntimeError(f"Command failed{reason}: {printable}")
+    return rc
+
+def _remove_files(paths):
+    for p in paths:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+# --- Upload --- 
+UPLOAD_HINTS = (
+    "Hints: 1) 確認 platformio.ini 設定 upload_port=COMx；"
+    "2) 若板子不支援軟體進入下載模式，請按住 UART/Download 鍵再 Reset；"
+    "3) 已依序試過 baud rate 階梯上的速率（紀錄在 .pio/amebapro2_cache/<env>/upload/*.baud.json），"
+    "仍連不上請檢查 USB 線材 / 驅動，或用 upload_baud_ladder 加入更低的速率。"
+)
+
+def _pick_flash_image():
+    tgt = "flash_tz" if USE_TZ else "flash_ntz"
+    if USE_WLANMP:
+        tgt += "_mp"
+    for name in (f"{tgt}.nn.bin", f"{tgt}.bin"):
+        p = os.path.join(build_dir, name)
+        if os.path.exists(p):
+            return p
+    raise FileNotFoundError("no flash image found; please run `pio run -t flash` or `pio run -t flash_nn` first")
+
+def _upload_full_requested(env):
+    # 逃生口：upload_flags = --full、AMEBAPRO2_UPLOAD_FULL=1 或 `pio run -t upload_full`
+    flags = env.GetProjectOption("upload_flags", "") or ""
+    if isinstance(flags, str):
+        flags = flags.split()
+    return ("--full" in flags or os.environ.get("AMEBAPRO2_UPLOAD_FULL", "0") not in ("", "0")
+            or "upload_full" in COMMAND_LINE_TARGETS)
+
+def _upload_region_flags(env):
+    # uartfwburn 寫入指定位址所需的參數樣板（依工具版本而定），可用 {offset} {length} 佔位
+    # 沒設定就無法只燒部分分區，只能整包燒（全部分區都沒變時仍可略過）
+    flags = env.GetProjectOption("upload_region_flags", "") or os.environ.get("AMEBAPRO2_UPLOAD_REGION_FLAGS", "")
+    return flags.split() if isinstance(flags, str) else list(flags)
+
+def _upload_sparse(env):
+    # 整包燒錄時只寫 sparse image 的 chunk（跳過 0xFF padding）；需要 upload_region_flags。
+    # padding 不會被抹除，裝置上舊資料會留著，只適合空片或不在意 padding 內容的情況
+    v = env.GetProjectOption("upload_sparse", "") or os.environ.get("AMEBAPRO2_UPLOAD_SPARSE", "0")
+    return str(v) not in ("", "0")
+
+def _upload_differential(env):
+    # 差異燒錄（只燒有變的分區、全部沒變就略過）：要 upload_differential = 1 且有 upload_region_flags 才開；
+    # upload_full 一律整包。裝置紀錄只記得「上次經這個 port 燒了什麼」，換板子或在別處燒過就不準，所以預設關閉
+    v = env.GetProjectOption("upload_differential", "") or os.environ.get("AMEBAPRO2_UPLOAD_DIFFERENTIAL", "0")
+    return str(v) not in ("", "0") and bool(_upload_region_flags(env)) and not _upload_full_requested(env)
+
+def _upload_tool(env):
+    # 回傳 (燒錄工具, 工作目錄)；upload_tool / AMEBAPRO2_UPLOAD_TOOL 可換成別的工具（例如測試用的假工具）
+    tool_dir_src = os.path.join(sdk_dir, "tools/Pro2_PG_tool _v1.4.3")
+    flashloader_src = os.path.join(tool_dir_src, "flash_loader_nor.bin")
+    upload_tool = (env.GetProjectOption("upload_tool", "") or os.environ.get("AMEBAPRO2_UPLOAD_TOOL") or
+                   os.path.join(tool_dir_src, "uartfwburn.exe" if os.name == "nt" else "uartfwburn.linux"))
+
+    # 在 build_dir 下跑，讓程式能找到 flash_loader_nor.bin
+    tool_dir = build_dir
+    os.makedirs(tool_dir, exist_ok=True)
+    flashloader_dst = os.path.join(tool_dir, "flash_loader_nor.bin")
+    if not os.path.exists(flashloader_dst) and os.path.exists(flashloader_src):
+        shutil.copy(flashloader_src, flashloader_dst)
+        print(f">>> Copied flashloader to {flashloader_dst}")
+    return upload_tool, tool_dir
+
+def _upload_rates(env):
+    # 預設依 BAUD_LADDER 由快到慢自動嘗試（upload_baud_ladder 可自訂）；upload_adaptive_baud = 0 則固定用 upload_speed
+    speed = int(env.GetProjectOption("upload_speed") or os.environ.get("UPLOAD_SPEED") or 1500000)
+    adaptive = env.GetProjectOption("upload_adaptive_baud", "") or os.environ.get("AMEBAPRO2_UPLOAD_ADAPTIVE_BAUD", "1")
+    if str(adaptive) in ("", "0"):
+        return [speed]
+    ladder = env.GetProjectOption("upload_baud_ladder", "") or os.environ.get("AMEBAPRO2_UPLOAD_BAUD_LADDER", "")
+    return [int(r) for r in ladder.replace(",", " ").split()] if ladder else list(BAUD_LADDER)
+
+# 工具打不開 port（沒插、被佔用、沒權限）；換速率或模式都沒用，直接放棄
+_NO_DEVICE = re.compile(r"(?i)(open (com ?)?port\b.*\b(fail|error)|could not open|cannot open|no such file|"
+                        r"permission denied|access is denied|device not (found|configured))")
+
+def _no_device(port, output):
+    if port.startswith("/dev/") and not os.path.exists(port):
+        return True
+    return any(_NO_DEVICE.search(line) for line in output)
+
+def _burn(upload_tool, port, rates, image, tool_dir, extra=(), log=print):
+    # 從這個 port 已知可用的最高速率往下試；每個速率先試軟體進入下載模式（-d p2m），失敗再用手動模式
+    # 每次嘗試的速率 / 耗時 / bytes/s 記在 <port>.baud.json；找不到裝置就停，全部加起來不超過 UPLOAD_TIMEOUT
+    bauds = BaudCache(os.path.join(project_cache_dir, "upload"), port)
+    adaptive = len(rates) > 1
+    nbytes = os.path.getsize(image)
+    ladder = bauds.ladder(rates) if adaptive else list(rates)
+    deadline = time.monotonic() + UPLOAD_TIMEOUT if UPLOAD_TIMEOUT else None
+    for rate in ladder:
+        for mode in (["-d", "p2m"], []):
+            if _no_device(port, []):
+                log(f"!!! {port}: port does not exist; giving up")
+                return False
+            # 逾時：以 10 bit/byte 估算傳輸時間的兩倍，再加上握手 / 抹除的餘裕
+            timeout = 60 + nbytes * 20 / rate
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    log(f"!!! {port}: gave up after {UPLOAD_TIMEOUT:g}s (upload_timeout)")
+                    return False
+                timeout = min(timeout, left)
+            cmd = [upload_tool, "-p", port, "-b", str(rate), "-f", image] + list(extra) + ["-U", "-v", "pro2", "-r"] + mode
+            output = []
+
+            def _tee(*args):
+                output.append(" ".join(str(a) for a in args))
+                log(*args)
+
+            t0 = time.monotonic()
+            ok = _run(cmd, strict=False, cwd=tool_dir, log=_tee, timeout=timeout, limit=False) == 0
+            seconds = time.monotonic() - t0
+            if not ok and _no_device(port, output[1:]):
+                # 不記進 baud 紀錄：跟速率無關
+                log(f"!!! {port}: cannot open the port; giving up")
+                return False
+            bauds.record(rate, ok, nbytes, seconds, learn=adaptive)
+            if ok:
+                log(f">>> {port}: {nbytes} bytes @ {rate} baud in {seconds:.1f}s "
+                    f"({nbytes / max(seconds, 1e-3) / 1024:.1f} KiB/s)")
+                return True
+        if rate != ladder[-1]:
+            log(f">>> {port}: {rate} baud failed, trying a lower rate")
+    return False
+
+def _flash_port(env, port, rates, image, upload_tool, tool_dir, log=print):
+    # 燒一個 port；成功回傳 True。批次燒錄時多個 port 同時呼叫，暫存檔名要帶 port
+    tag = re.sub(r"[^A-Za-z0-9._-]", "_", port)
+
+    # 差異燒錄（upload_differential）：跟這個 port 上次成功燒錄的分區雜湊比較（分區資訊來自 flashimage 的 manifest）
+    device = DeviceState(os.path.join(project_cache_dir, "upload"), port)
+    manifest = FlashImage(image, None).valid_manifest()
+    last = device.load()
+    changed = changed_partitions(manifest, last) if _upload_differential(env) else None
+    region_flags = _upload_region_flags(env)
+
+    if changed == []:
+        log(f">>> {port}: all partitions match the last flash; nothing to upload (use --full to force)")
+        return True
+    if changed is not None:
+        log(f">>> {port}: writing changed partition(s) only: {', '.join(changed)}")
+        with open(image, "rb") as f:
+            for name in changed:
+                offset, length = region(manifest, last, name)
+                f.seek(offset)
+                part_file = os.path.join(build_dir, f"upload_{tag}_{name}.bin")
+                with open(part_file, "wb") as wf:
+                    wf.write(f.read(length))
+                extra = [a.format(offset=f"0x{offset:x}", length=f"0x{length:x}") for a in region_flags]
+                if not _burn(upload_tool, port, rates, part_file, tool_dir, extra, log=log):
+                    device.forget()
+                    log(f"!!! {port}: upload of {name} failed; the next upload will write the full image")
+                    return False
+        device.save(manifest["layout_key"], manifest["parts"])
+        return True
+
+    device.forget()
+    sparse = sparseimage.current(image, image + ".sparse.json") if region_flags and _upload_sparse(env) else None
+    if sparse is not None:
+        size, chunks = sparseimage.read(image + ".sparse")
+        log(f">>> {port}: writing {len(chunks)} sparse chunk(s), "
+            f"{sum(len(d) for _, d in chunks)} of {size} bytes")
+        for i, (offset, data) in enumerate(chunks):
+            part_file = os.path.join(build_dir, f"upload_{tag}_chunk{i}.bin")
+            with open(part_file, "wb") as wf:
+                wf.write(data)
+            extra = [a.format(offset=f"0x{offset:x}", length=f"0x{len(data):x}") for a in region_flags]
+            if not _burn(upload_tool, port, rates, part_file, tool_dir, extra, log=log):
+                log(f"!!! {port}: upload of sparse chunk @0x{offset:x} failed")
+                return False
+    elif not _burn(upload_tool, port, rates, image, tool_dir, log=log):
+        return False
+    if manifest:
+        device.save(manifest["layout_key"], manifest["parts"])
+    return True
+
+def upload_amebapro2(source, target, env):
+    print(">>> Uploading AmebaPro2 image ...")
+    port = env.GetProjectOption("upload_port") or os.environ.get("UPLOAD_PORT") or "COM3"
+    rates = _upload_rates(env)
+
+    image = _pick_flash_image()
+    print(f">>> Image: {image}")
+    upload_tool, tool_dir = _upload_tool(env)
+    if _flash_port(env, port, rates, image, upload_tool, tool_dir):
+        print(">>> Upload done!")
+        return
+    raise RuntimeError("Upload failed. " + UPLOAD_HINTS)
+
+def upload_batch_amebapro2(source, target, env):
+    # 產線批次燒錄：upload_ports 可列多個 port 或 glob（例如 /dev/ttyUSB*），
+    # upload_jobs 限制同時燒錄數，upload_retries 為每個 port 失敗後的重試次數。
+    # 每片都整包燒，不讀也不寫裝置紀錄（同一個 port 上接的是下一批新板子）
+    spec = (env.GetProjectOption("upload_ports", "") or os.environ.get("AMEBAPRO2_UPLOAD_PORTS") or
+            env.GetProjectOption("upload_port") or "")
+    ports = batchflash.expand_ports(spec)
+    if not ports:
+        raise RuntimeError("upload_batch: no ports; set upload_ports (e.g. /dev/ttyUSB* or COM3,COM4)")
+    jobs = int(env.GetProjectOption("upload_jobs", "") or os.environ.get("AMEBAPRO2_UPLOAD_JOBS", "4"))
+    retries = int(env.GetProjectOption("upload_retries", "") or os.environ.get("AMEBAPRO2_UPLOAD_RETRIES", "1"))
+    rates = _upload_rates(env)
+
+    image = _pick_flash_image()
+    upload_tool, tool_dir = _upload_tool(env)
+    print(f">>> Batch uploading {os.path.basename(image)} to {len(ports)} port(s), {jobs} at a time ...")
+    results = batchflash.run(ports,
+                             lambda port, log: _burn(upload_tool, port, rates, image, tool_dir, log=log),
+                             os.path.join(build_dir, "upload_logs"), jobs=jobs, retries=retries)
+    print(batchflash.table(results))
+    failed = [r.port for r in results if not r.ok]
+    if failed:
+        raise RuntimeError(f"Batch upload failed on {', '.join(failed)}. " + UPLOAD_HINTS)
+
+NN_PARTITION = "PT_NN_MDL"
+
+def upload_model_amebapro2(source, target, env):
+    # `pio run -t flash_model`：只寫 NN model 分區（模型常改、韌體不常改）；需要 upload_region_flags。
+    # upload_differential = 1 時裝置紀錄裡這個分區的內容相同就略過；成功後只更新紀錄裡的這個分區，其他分區的紀錄不動
+    if not PRELOAD_NN:
+        raise RuntimeError("flash_model needs preload_nn = 1")
+    port = env.GetProjectOption("upload_port") or os.environ.get("UPLOAD_PORT") or "COM3"
+    region_flags = _upload_region_flags(env)
+    if not region_flags:
+        raise RuntimeError("flash_model needs upload_region_flags to write a single partition")
+    image = _pick_flash_image()
+    manifest = FlashImage(image, None).valid_manifest()
+    part = manifest and manifest["parts"].get(NN_PARTITION)
+    if not part:
+        raise RuntimeError(f"no verified {NN_PARTITION} partition in {os.path.basename(image)}; "
+                           f"run `pio run -t flash_nn` first")
+
+    device = DeviceState(os.path.join(project_cache_dir, "upload"), port)
+    last = device.load()
+    same_layout = last is not None and last.get("layout_key") == manifest["layout_key"] and \
+        NN_PARTITION in last.get("parts", {})
+    if same_layout and last["parts"][NN_PARTITION]["sha"] == part["sha"] and _upload_differential(env):
+        print(f">>> {port}: {NN_PARTITION} matches the last flash; nothing to upload")
+        return
+    offset, length = region(manifest, last, NN_PARTITION) if same_layout else (part["offset"], part["size"])
+    part_file = os.path.join(build_dir, f"upload_{re.sub(r'[^A-Za-z0-9._-]', '_', port)}_{NN_PARTITION}.bin")
+    with open(image, "rb") as f, open(part_file, "wb") as wf:
+        f.seek(offset)
+        wf.write(f.read(length))
+    print(f">>> {port}: writing {NN_PARTITION} only, {length} bytes @0x{offset:x}")
+    upload_tool, tool_dir = _upload_tool(env)
+    extra = [a.format(offset=f"0x{offset:x}", length=f"0x{length:x}") for a in region_flags]
+    if not _burn(upload_tool, port, _upload_rates(env), part_file, tool_dir, extra):
+        if same_layout:
+            device.forget()
+        raise RuntimeError(f"Upload of {NN_PARTITION} failed. " + UPLOAD_HINTS)
+    if same_layout:
+        last["parts"][NN_PARTITION] = part
+        device.save(last["layout_key"], last["parts"])
+    print(">>> Model upload done!")
+
+# 只跑 upload（搭配 -t nobuild）/ clean / monitor 時不需要編譯圖；直接宣告用得到的 target 就結束
+UPLOAD_TARGETS = {"upload", "upload_full", "upload_batch", "flash_model"}
+LAZY_TARGETS = {"nobuild", "clean", "cleanall", "monitor"} | UPLOAD_TARGETS
+
+def _lazy_graph():
+    targets = set(COMMAND_LINE_TARGETS)
+    if not targets or not targets <= LAZY_TARGETS:
+        return False
+    # 單獨的 -t upload 照 PlatformIO 慣例要先 build；要跳過請加 -t nobuild
+    return not targets & UPLOAD_TARGETS or "nobuild" in targets
+
+if _lazy_graph():
+    AlwaysBuild(env.Alias("upload", [], upload_amebapro2))
+    AlwaysBuild(env.Alias("upload_full", [], upload_amebapro2))
+    AlwaysBuild(env.Alias("upload_batch", [], upload_batch_amebapro2))
+    AlwaysBuild(env.Alias("flash_model", [], upload_model_amebapro2))
+    Return()
+
+stampdb = StampDB(os.path.join(project_cache_dir, "stamps"))
+keystore = KeyStore(KEY_STORE_DIR)
+sigcache = SigCache(SIGN_CACHE_DIR)
+objcache = ObjCache(OBJ_CACHE_DIR, sdk_dir) if USE_OBJ_CACHE else None
+
+def _objcache_finish():
+    # build 結束時印出命中率；有新存入的東西才檢查大小（no-op build 不走訪整個快取目錄）
+    line = objcache.report()
+    if line:
+        print(">>>", line)
+    if OBJ_CACHE_MAX_MB and (objcache.misses or objcache.archive_stores):
+        removed, freed = objcache.prune(int(OBJ_CACHE_MAX_MB * 1024 * 1024))
+        if removed:
+            print(f">>> obj cache: pruned {removed} least recently used file(s), {freed / 1048576:.1f} MB")
+
+if objcache:
+    atexit.register(_objcache_finish)
+
 # bootfcs sources/inc 
 bootfcs_src = [os.path.join(sdk_dir, "component/video/driver/RTL8735B/video_user_boot.c")]
 
@@ -594,15 +1024,245 @@ def collect_sources(root, exts=(".c", ".cpp")):
         files.extend(glob.glob(os.path.join(root, "**", "*" + ext), recursive=True))
     return files
 
+def _cached_cc_action(target, source, env):
+    # 與 Object 相同的 $CCCOM，只是經過 objcache；命中時直接拿快取的 .o
+    args = [str(a) for a in env.subst_list("$CCCOM", target=target, source=source)[0]]
+    with buildtrace.span("cc " + os.path.basename(str(source[0])), "compile", cwd=os.getcwd()) as ev:
+        ev["exit"] = objcache.compile(args, str(target[0]), str(source[0]), env=env["ENV"])
+        ev["bytes"] = buildtrace.file_bytes(target)
+    return ev["exit"]
+
+def _cached_cc_str(target, source, env):
+    return env.subst("$CCCOMSTR", target=target, source=source) or \
+           env.subst("$CCCOM", target=target, source=source)
+
+_cached_cc = Action(_cached_cc_action, strfunction=_cached_cc_str,
+                    varlist=["CC", "CCCOM", "CFLAGS", "CCFLAGS", "_CCCOMCOM"])
+
+def _opt_rel(path):
+    rel = os.path.relpath(path, sdk_dir)
+    if rel.startswith(".."):
+        rel = os.path.relpath(path, env.subst("$PROJECT_DIR"))
+    return rel.replace("\\", "/")
+
+def _opt_flags(path):
+    # OPT_OVERRIDES 裡符合 path 的旗標（依序串接）
+    rel = _opt_rel(path)
+    out = []
+    for pat, flags in OPT_OVERRIDES:
+        if fnmatch.fnmatch(rel if "/" in pat else os.path.basename(rel), pat):
+            out += flags
+    return out
+
 def _mk_objs(envx, srcs, suffix, obj_root): 
     objs = [] 
+    if UNITY_BUILD:
+        objs, srcs = _mk_unity_objs(envx, srcs, suffix, obj_root)
+    pch_info = envx.get("AMEBAPRO2_PCH")
     for s in srcs: 
         rel = os.path.relpath(s, sdk_dir).replace("\\", "/") 
         obj = os.path.join(obj_root, rel) + suffix + ".o"
-        os.makedirs(os.path.dirname(obj), exist_ok=True)
-        objs.append(envx.Object(target=obj, source=s)) 
+        kw = {}
+        override = _opt_flags(s)
+        if override:
+            # 覆寫旗標的檔案不用 PCH（.gch 是用 profile 的旗標產生的）
+            kw["CCFLAGS"] = list(envx.Flatten(envx["CCFLAGS"])) + override
+        elif pch_info and s.endswith(".c") and pch.eligible(s, pch_info["headers"]):
+            # 開頭就 include PCH header 的 .c 改用 precompiled header
+            kw["CCFLAGS"] = pch_info["ccflags"]
+        # 目錄由 SCons 在真的要編這個物件時才建立
+        if objcache and s.endswith(".c") and not rel.startswith(".."):
+            # SDK 固定清單走共用快取；專案自己的 src/ 照常編譯
+            node = envx.Command(obj, s, _cached_cc, source_scanner=c_scanner, **kw)
+        else:
+            node = envx.Object(target=obj, source=s, **kw)
+        if kw and not override:
+            envx.Depends(node, pch_info["gch"])
+        objs.append(node)
     return objs
 
+def _setup_pch(envx, name, candidates, srcs):
+    # 依 envx 的 CPPPATH 找出 candidates，挑 srcs 最常見的開頭 include 順序（pch.choose），
+    # 產生 pch/<name>-<旗標雜湊>/amebapro2_pch.h(.gch)；
+    # 旗標或任何一個 header（CScanner 追蹤）變了就重建。build_flags 裡的 -include 要搬進 PCH 最前面，
+    # 否則 -include 的內容排在 .gch 之前會讓它失效
+    dirs = [envx.subst(str(d)) for d in envx.Flatten(envx.get("CPPPATH", []))]
+    headers = pch.choose(srcs, [p for p in (pch.resolve(h, dirs) for h in candidates) if p])
+    if not headers:
+        print(f">>> WARN: no precompiled header candidates found for {name}")
+        return
+    prefix, flags = [], []
+    it = iter(str(f) for f in envx.Flatten(envx["CCFLAGS"]))
+    for f in it:
+        if f == "-include":
+            prefix.append(next(it))
+        else:
+            flags.append(f)
+    key = pch.flags_key("\n".join([envx.subst("$CC $CFLAGS $_CPPDEFFLAGS $_CPPINCFLAGS")] + flags + prefix + headers))
+    header = pch.write_header(os.path.join(build_dir, "pch", f"{name}-{key}"), prefix, headers)
+    gch = envx.Command(header + ".gch", header,
+                       Action("$CC -x c-header -o $TARGET -c $CFLAGS $CCFLAGS $_CCCOMCOM $SOURCE", "Precompiling $TARGET"),
+                       source_scanner=c_scanner, CCFLAGS=flags)
+    envx["AMEBAPRO2_PCH"] = {"headers": headers, "gch": gch, "ccflags": flags + ["-include", header, "-Winvalid-pch"]}
+
+def _unity_plan(name, srcs):
+    # 有旗標覆寫的檔案一定單獨編
+    exclude = UNITY_EXCLUDE + [os.path.relpath(s, sdk_dir).replace("\\", "/") for s in srcs if _opt_flags(s)]
+    return unity.plan([s for s in srcs if s.endswith(".c")], UNITY_BATCH, exclude,
+                      rel=lambda p: os.path.relpath(p, sdk_dir).replace("\\", "/"))
+
+def _mk_unity_objs(envx, srcs, suffix, obj_root):
+    # UNITY_COMPONENTS 的 .c 分組成 obj_root/unity/<元件>_<n><suffix>.c，一組編成一個 .o；
+    # 回傳 (unity 物件, 剩下照常一個一個編的檔案)
+    groups, rest = _split_components(srcs)
+    objs = []
+    for name, members in sorted(groups.items()):
+        if name not in UNITY_COMPONENTS:
+            rest += members
+            continue
+        batches, singles, _ = _unity_plan(name, members)
+        rest += singles + [s for s in members if not s.endswith(".c")]
+        for i, batch in enumerate(batches):
+            unity_c = unity.write(os.path.join(obj_root, "unity", f"{name}_{i}{suffix}.c"), batch)
+            objs.append(envx.Object(target=unity_c[:-2] + ".o", source=unity_c))
+    return objs, rest
+
+# SDK 元件 archive：application_src 裡屬於這些目錄的檔案打包成 libsdk_<name>.a
+SDK_COMPONENTS = [
+    ("lwip",    ["component/lwip/"]),
+    ("mbedtls", [f"component/ssl/mbedtls-{MBEDTLS_VERSION}/"]),
+    ("hal",     ["component/soc/8735b/fwlib/", "component/soc/8735b/mbed-drivers/", "component/mbed/targets/"]),
+    ("wifi",    ["component/wifi/"]),
+    ("bt",      ["component/bluetooth/"]),
+]
+
+UNITY_COMPONENTS = ("lwip", "mbedtls")
+
+def _split_components(srcs):
+    # 回傳 ({name: [src]}, 其餘散裝的 src)
+    groups, rest = {}, []
+    for s in srcs:
+        rel = os.path.relpath(s, sdk_dir).replace("\\", "/")
+        for name, prefixes in SDK_COMPONENTS:
+            if rel.startswith(tuple(prefixes)):
+                groups.setdefault(name, []).append(s)
+                break
+        else:
+            rest.append(s)
+    return groups, rest
+
+_sdk_rev = None
+
+def _sdk_revision():
+    # store 佈建的 SDK 直接用 marker 的 key；舊版 git clone 的 SDK 用 git HEAD + 本地改動
+    global _sdk_rev
+    if _sdk_rev is None and sdk_info.get("key"):
+        _sdk_rev = sdk_info["key"]
+    if _sdk_rev is None:
+        try:
+            head = subprocess.run(["git", "-C", sdk_dir, "rev-parse", "HEAD"],
+                                  capture_output=True, text=True).stdout.strip()
+            # 本地改動用 diff 內容的雜湊：同一個檔案改了兩次 status 不會變
+            dirty = subprocess.run(["git", "-C", sdk_dir, "diff", "HEAD", "--binary"],
+                                   capture_output=True).stdout
+            _sdk_rev = head + "\n" + hashlib.sha256(dirty).hexdigest()
+        except OSError:
+            _sdk_rev = os.path.basename(sdk_dir)
+    return _sdk_rev
+
+def _project_headers_digest():
+    # include/ 與 -I 目錄下的 header（lwipopts.h / platform_opts.h ...）也會改變 SDK 物件；
+    # 除了內容也記「第幾個 -I 目錄 + 相對路徑」，header 換目錄時 key 才會變
+    files, where = [], []
+    for i, d in enumerate([proj_include] + include_dirs):
+        for p in sorted(glob.glob(os.path.join(d, "**", "*.h"), recursive=True)):
+            files.append(p)
+            where.append(f"{i}:{os.path.relpath(p, d).replace(os.sep, '/')}")
+    return stampdb.digest(files=files, extra=where)
+
+def _compiler_digest(envx):
+    # PlatformIO 會在同一個路徑就地升級 toolchain，key 要看 compiler 本身的內容
+    cc = envx.subst("$CC")
+    for p in (cc, cc + ".exe"):
+        if os.path.isfile(p):
+            return stampdb.digest(files=[p])
+    return cc
+
+def _component_key(envx, name, srcs):
+    # -I 順序決定拿到哪份 header；原始檔內容也算進去（mtime 沒變的檔案用 stamps.json 記住的雜湊）
+    flags = envx.subst("$CC $CCFLAGS $CFLAGS $_CPPDEFFLAGS $_CPPINCFLAGS").replace(sdk_dir, "<SDK>") \
+                .replace(env.subst("$PROJECT_DIR"), "<PROJECT>")
+    rels = sorted(os.path.relpath(s, sdk_dir).replace("\\", "/") for s in srcs)
+    unity_cfg = f"unity={UNITY_BATCH}:{' '.join(UNITY_EXCLUDE)}" if UNITY_BUILD and name in UNITY_COMPONENTS else "unity=0"
+    opt = [f"opt:{_opt_rel(s)}:{' '.join(_opt_flags(s))}" for s in sorted(srcs) if _opt_flags(s)]
+    return stampdb.digest(files=sorted(srcs),
+                          extra=[name, _sdk_revision(), flags, _compiler_digest(envx), f"TZ={USE_TZ}", unity_cfg,
+                                 _project_headers_digest()] + rels + opt)
+
+def _store_archive_action(name, key):
+    def _act(target, source, env):
+        objcache.store_archive(str(target[0]), name, key)
+        return 0
+    return buildtrace.action(_act, "archive.store")
+
+def _mk_sdk_archives(envx, srcs, suffix, obj_root, lib_root):
+    # 每個元件一個 archive；快取裡已有同 (SDK revision, 旗標, TZ/NTZ) 的 archive 就直接拿來連結，
+    # 連物件 node 都不宣告，no-op build 只需要檢查這幾個 archive
+    groups, rest = _split_components(srcs)
+    archives = []
+    for name, _ in SDK_COMPONENTS:
+        members = groups.get(name)
+        if not members:
+            continue
+        key = _component_key(envx, name, members)
+        cached = objcache.archive(name, key) if objcache else None
+        if cached:
+            archives.append(envx.File(cached))
+            continue
+        lib = envx.StaticLibrary(os.path.join(lib_root, f"libsdk_{name}.a"),
+                                 _mk_objs(envx, members, suffix, obj_root))
+        if objcache:
+            envx.AddPostAction(lib, _store_archive_action(name, key))
+        archives += lib
+    return archives, rest
+
+def _config_macros(envx):
+    # gcc -dM -E 取得專案實際的 config macro；key 沒變就用上次存下來的結果
+    args = [envx.subst("$CC")] + [str(a) for a in envx.subst_list("$CCFLAGS $CFLAGS $_CCCOMCOM")[0]]
+    out = os.path.join(project_cache_dir, "config_macros.json")
+    key = stampdb.digest(extra=[_compiler_digest(envx), _sdk_revision(), _project_headers_digest()] + args[1:])
+    probed = {}
+
+    def _probe():
+        # 先刪掉上次（別的 key）留下的結果：這次 probe 失敗就是「無法判斷 → 全部編」，不能沿用舊設定裁剪
+        _remove_files([out])
+        probed["macros"] = macros = components.probe_macros(args, env=envx["ENV"])
+        if macros is not None:
+            os.makedirs(project_cache_dir, exist_ok=True)
+            with open(out, "w", encoding="utf-8") as f:
+                json.dump(macros, f, indent=1, sort_keys=True)
+
+    stampdb.step("config.macros", key, [out], _probe)
+    if "macros" in probed:
+        return probed["macros"]
+    try:
+        with open(out, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _prune_components(envx, srcs):
+    if not PRUNE_COMPONENTS:
+        return srcs
+    macros = _config_macros(envx)
+    if macros is None:
+        print(">>> WARN: cannot evaluate config macros; build all SDK components")
+        return srcs
+    kept, dropped = components.prune(srcs, lambda s: os.path.relpath(s, sdk_dir).replace("\\", "/"), macros)
+    if dropped:
+        print(f">>> Pruned {len(srcs) - len(kept)} SDK source(s): {', '.join(dropped)}")
+    return kept
+
 toolbin = os.path.join(toolchain, "bin")
 
 def set_xtools(e):
@@ -619,6 +1279,20 @@ def set_xtools(e):
     # 保險：把 toolchain/bin 也塞進 PATH（有些外部腳本/工具會用到） 
     e.PrependENVPath("PATH", toolbin) 
 
+def _common_ccflags(cpu, profile):
+    # bootloader / application 共用的編譯旗標；最佳化等級由 profile 決定
+    return [
+        f"-mcpu={cpu}", "-mthumb", "-mcmse", "-mfpu=fpv5-sp-d16", "-mfloat-abi=softfp",
+    ] + PROFILES[profile]["ccflags"] + [
+        "-fno-common", "-fmessage-length=0",
+        "-Wall", "-Wpointer-arith", "-Wstrict-prototypes",
+        "-Wundef", "-Wno-unused-function", "-Wno-unused-variable",
+        "-ffunction-sections", "-fdata-sections",
+        "-Wno-int-conversion",
+        "-Wno-implicit-function-declaration",
+        "-Wno-incompatible-pointer-types",
+    ]
+
 def apply_ini_build_flags(envx): 
     raw = envx.GetProjectOption("build_flags") or ""
     flags = envx.ParseFlags(raw)
@@ -635,20 +1309,71 @@ def apply_ini_build_flags(envx):
     
 proj_include = os.path.join(env.subst("$PROJECT_DIR"), "include")
 
+class _IndexedCScanner(SCons.Scanner.ClassicCPP):
+    # 跟 SCons 的 CScanner 同樣的規則（"" 先找同目錄、<> 先找 CPPPATH），只是改查 include_index，不逐目錄 stat
+    def __init__(self, index):
+        super().__init__("IndexedCScanner", "$CPPSUFFIXES", "CPPPATH",
+                         r'^[ \t]*#[ \t]*(?:include|import)[ \t]*(<|")([^>"]+)(>|")')
+        self.index = index
+
+    def find_include(self, include, source_dir, path):
+        delim, name = SCons.Util.to_str(include[0]), SCons.Util.to_str(include[1])
+        dirs = tuple(d.get_abspath() for d in path)
+        here = (source_dir.get_abspath(),)
+        hit = self.index.resolve(name, here + dirs if delim == '"' else dirs + here)
+        if hit:
+            return env.File(hit), SCons.Util.silent_intern(name)
+        # 磁碟上找不到：可能是還沒產生的 header（例如 include/build_info.h），交給 SCons 在 SDK 以外的目錄找 node
+        return super().find_include(include, source_dir,
+                                    tuple(d for d in path if not self.index.stable(d.get_abspath())))
+
+c_scanner = SCons.Tool.CScanner
+include_index = None
+if USE_INCLUDE_INDEX:
+    include_index = incindex.HeaderIndex(bootloader_inc + application_inc + include_dirs + [proj_include],
+                                         os.path.join(project_cache_dir, "include_index.json"),
+                                         _sdk_revision(), sdk_dir)
+    c_scanner = _IndexedCScanner(include_index)
+
+def _use_indexed_scanner(envx):
+    # Object builder 依副檔名從 SourceFileScanner 選 scanner，不看 env 的 SCANNERS；
+    # 只在 envx 換一份自己的 Object builder，全域的 SourceFileScanner 與其他 environment 不受影響
+    table = dict(SCons.Tool.SourceFileScanner.function)
+    table.update((suffix, c_scanner) for suffix in SCons.Tool.CSuffixes)
+    # StaticObject 是包著 BuilderBase 的 CompositeBuilder（Proxy 不能直接 copy），複製裡面那個再包回去
+    old = envx["BUILDERS"]["StaticObject"]
+    inner = copy.copy(old.builder)
+    inner.source_scanner = SCons.Scanner.ScannerBase(table, name="AmebaPro2SourceFileScanner")
+    obj = SCons.Builder.CompositeBuilder(inner, old.cmdgen)
+    envx["BUILDERS"]["StaticObject"] = obj
+    envx["BUILDERS"]["Object"] = obj
+
+_shadow_noted = set()
+
+def _index_includes(envx, name):
+    # 刪掉不存在、沒有檔案、或完全被前面目錄蓋掉的 -I
+    dirs = [envx.subst(str(d)) for d in envx.Flatten(envx.get("CPPPATH", []))]
+    kept, dropped = include_index.prune(dirs)
+    envx.Replace(CPPPATH=kept)
+    if dropped:
+        why = {}
+        for _, reason in dropped:
+            why[reason] = why.get(reason, 0) + 1
+        print(f">>> include index: {name} uses {len(kept)} of {len(dirs)} include dirs "
+              f"({', '.join(f'{n} {r}' for r, n in sorted(why.items()))} dropped)")
+    for hname, _, sdk in include_index.shadowed([proj_include] + include_dirs, dirs):
+        if sdk in _shadow_noted:
+            continue
+        _shadow_noted.add(sdk)
+        # SDK 檔案用 "" include 時會先找到自己目錄的那份（lwipopts.h 因此從 checkout 拿掉）
+        print(f">>> NOTE: {name}: project {hname} shadows {os.path.relpath(sdk, sdk_dir)}; "
+              f"SDK sources next to it still get the SDK copy via #include \"{hname}\"")
+
 # Build bootloader
 env_bootloader = env.Clone()
 set_xtools(env_bootloader)
 apply_ini_build_flags(env_bootloader)
-env_bootloader.Append(CCFLAGS=[
-    "-mcpu=cortex-m23", "-mthumb", "-mcmse", "-mfpu=fpv5-sp-d16", "-mfloat-abi=softfp",
-    "-Os", "-fno-common", "-fmessage-length=0",
-    "-Wall", "-Wpointer-arith", "-Wstrict-prototypes",
-    "-Wundef", "-Wno-unused-function", "-Wno-unused-variable",
-    "-ffunction-sections","-fdata-sections",
-    "-Wno-int-conversion",
-    "-Wno-implicit-function-declaration",
-    "-Wno-incompatible-pointer-types"
-])
+env_bootloader.Append(CCFLAGS=_common_ccflags("cortex-m23", "size"))
 env_bootloader.Append(CPPPATH=[include_dirs])
 env_bootloader.Append(CPPPATH=[proj_include])
 env_bootloader.Append(CCFLAGS=[
@@ -659,6 +1384,11 @@ env_bootloader.Append(CCFLAGS=[
 	"-DCONFIG_RTL8735B_PLATFORM=1",
 ])
 env_bootloader.Append(CPPPATH=bootloader_inc, CPPDEFINES=env.get("CPPDEFINES", []))
+if include_index:
+    _use_indexed_scanner(env_bootloader)
+    _index_includes(env_bootloader, "bootloader")
+if USE_PCH:
+    _setup_pch(env_bootloader, "bootloader", pch.BOOTLOADER_CANDIDATES, bootloader_src)
 bootloader_objs = _mk_objs(env_bootloader, bootloader_src, ".bootloader", os.path.join(env.subst("$BUILD_DIR"), "amebapro2/bootloader/obj"))
 bootloader_elf = env_bootloader.Program(
     target=os.path.join(env.subst("$BUILD_DIR"), "amebapro2/bootloader.elf"),
@@ -693,26 +1423,13 @@ set_xtools(env_application)
 set_xtools(env_application_nosec)
 apply_ini_build_flags(env_application)
 apply_ini_build_flags(env_application_nosec)
-env_application.Append(CCFLAGS=[
-    "-mcpu=cortex-m33", "-mthumb", "-mcmse", "-mfpu=fpv5-sp-d16", "-mfloat-abi=softfp",
-    "-Os", "-fno-common", "-fmessage-length=0",
-    "-Wall", "-Wpointer-arith", "-Wstrict-prototypes",
-    "-Wundef", "-Wno-unused-function", "-Wno-unused-variable",
-    "-ffunction-sections","-fdata-sections",
-    "-Wno-int-conversion",
-    "-Wno-implicit-function-declaration",
-    "-Wno-incompatible-pointer-types"
-])
-env_application_nosec.Append(CCFLAGS=[
-    "-mcpu=cortex-m33", "-mthumb", "-mcmse", "-mfpu=fpv5-sp-d16", "-mfloat-abi=softfp",
-    "-Os", "-fno-common", "-fmessage-length=0",
-    "-Wall", "-Wpointer-arith", "-Wstrict-prototypes",
-    "-Wundef", "-Wno-unused-function", "-Wno-unused-variable",
-    "-ffunction-sections","-fdata-sections",
-    "-Wno-int-conversion",
-    "-Wno-implicit-function-declaration",
-    "-Wno-incompatible-pointer-types"
-])
+if PROFILE == "lto":
+    # 含 LTO IR 的 archive 要用 gcc-ar / gcc-ranlib（經 LTO plugin 建符號表）
+    for _e in (env_application, env_application_nosec):
+        _e.Replace(AR=os.path.join(toolbin, "arm-none-eabi-gcc-ar"),
+                   RANLIB=os.path.join(toolbin, "arm-none-eabi-gcc-ranlib"))
+env_application.Append(CCFLAGS=_common_ccflags("cortex-m33", PROFILE))
+env_application_nosec.Append(CCFLAGS=_common_ccflags("cortex-m33", PROFILE))
 if USE_TZ:
     env_application_nosec.Append(CCFLAGS=[
         "-DCONFIG_BUILD_NONSECURE=1",
@@ -737,7 +1454,19 @@ env_application.Append(CPPPATH=[proj_include])
 env_application_nosec.Append(CPPPATH=[proj_include])
 env_application.Append(CPPPATH=application_inc, CPPDEFINES=env.get("CPPDEFINES", []))
 env_application_nosec.Append(CPPPATH=application_inc, CPPDEFINES=env.get("CPPDEFINES", []))
-application_objs = _mk_objs(env_application, application_src, ".application", os.path.join(env.subst("$BUILD_DIR"), "amebapro2/application/obj"))
+if include_index:
+    _use_indexed_scanner(env_application)
+    _use_indexed_scanner(env_application_nosec)
+    _index_includes(env_application, "application")
+    _index_includes(env_application_nosec, "application (nosec)")
+application_src = _prune_components(env_application, application_src)
+if USE_PCH:
+    _setup_pch(env_application, "application", pch.CANDIDATES, application_src)
+application_archives, application_loose_src = _mk_sdk_archives(
+    env_application, application_src, ".application",
+    os.path.join(env.subst("$BUILD_DIR"), "amebapro2/application/obj"),
+    os.path.join(env.subst("$BUILD_DIR"), "amebapro2/application/lib"))
+application_objs = _mk_objs(env_application, application_loose_src, ".application", os.path.join(env.subst("$BUILD_DIR"), "amebapro2/application/obj"))
 application_sec_objs = _mk_objs(env_application_nosec, application_nosec_src, ".application", os.path.join(env.subst("$BUILD_DIR"), "amebapro2/application/obj"))
 application_proj_src = collect_sources(project_application_dir)
 application_proj_objs = _mk_objs(env_application, application_proj_src, ".application", os.path.join(env.subst("$BUILD_DIR"), "amebapro2/application/obj"))
@@ -748,6 +1477,7 @@ application_elf = env_application.Program(
     LIBS=extra_libs_application,
     LINKFLAGS=[
         "-mcpu=cortex-m33", "-mthumb", "-mcmse", "-mfpu=fpv5-sp-d16", "-mfloat-abi=softfp",
+    ] + PROFILES[PROFILE]["linkflags"] + [
         "-L" + sdk_cmake_ROM_dir,
         "-L" + os.path.join(sdk_cmake_application_dir, "output"),
         "-T" + os.path.join(sdk_cmake_application_dir, "rtl8735b_ram_ns.ld" if USE_TZ else "rtl8735b_ram.ld"),
@@ -755,47 +1485,134 @@ application_elf = env_application.Program(
         "-Wl,--gc-sections", "-Wl,--warn-section-align",
         "-Wl,-Map=" + os.path.join(build_dir, "target_application.map"),
         "-Wl,--cref", "-Wl,--no-enum-size-warning",
+        # SDK 元件 archive 要整包連進來，行為才會跟散裝 .o 一樣（libwlan 等會往回找 lwIP 的符號）
+        "-Wl,--whole-archive",
+    ] + [str(a) for a in application_archives] + [
+        "-Wl,--no-whole-archive",
     ]
 )
+env_application.Depends(application_elf, application_archives)
 
-def _run(cmd, strict=True, cwd=None):
-    import subprocess, shlex
-    # 支援 list 或字串
-    if isinstance(cmd, str):
-        printable = cmd
-        r = subprocess.run(cmd, capture_output=True, text=True, shell=True, cwd=cwd)
-    else:
-        printable = " ".join(cmd)
-        r = subprocess.run(cmd, capture_output=True, text=True, cwd=cwd)
-    print(">>>", printable)
-    if r.stdout: print(r.stdout)
-    if r.stderr: print(r.stderr)
-    if strict and r.returncode != 0:
-        raise RuntimeError(f"Command failed: {printable}")
-    return r.returncode
-
-def _safe_copy(src, dst):
-    import shutil, os
+def _safe_copy(src, dst, mutable=False):
+    # 經 publish：內容相同就不寫，否則 hardlink / reflink，不行才複製；
+    # 目的檔之後會被就地改寫、或來源是共用 SDK store 的檔案時要傳 mutable=True
     if os.path.exists(src):
-        shutil.copy2(src, dst)
+        with buildtrace.span("copy " + os.path.basename(dst), "copy", src=src, dst=dst) as ev:
+            ev["how"] = publish(src, dst, mutable=mutable)
+            ev["bytes"] = 0 if ev["how"] == "same" else buildtrace.file_bytes([dst])
         return True
     print(f">>> WARN: {src} not found; skip copy")
     return False
 
-def _copy_glob(globpat, dst_dir):
+def _copy_glob(globpat, dst_dir, mutable=False):
     os.makedirs(dst_dir, exist_ok=True)
     cnt = 0
-    for p in glob.glob(globpat):
-        shutil.copy2(p, os.path.join(dst_dir, os.path.basename(p)))
-        cnt += 1
+    with buildtrace.span("copy " + os.path.basename(globpat), "copy", src=globpat, dst=dst_dir) as ev:
+        written = []
+        for p in glob.glob(globpat):
+            dst = os.path.join(dst_dir, os.path.basename(p))
+            if publish(p, dst, mutable=mutable) != "same":
+                written.append(dst)
+            cnt += 1
+        ev["files"], ev["bytes"] = cnt, buildtrace.file_bytes(written)
     return cnt
 
-def _copy_nn_bins():
-    if os.path.isdir(project_models_dir):
-        copied = _copy_glob(os.path.join(project_models_dir, "*.nb"), build_dir)
-        print(f">>> Copied {copied} NN *.nb files to build_dir")
-    else:
-        print(">>> NOTE: NN model dir not found:", project_models_dir)
+@buildtrace.action
+def _copy_nn_action(target, source, env):
+    # 對齊 CMake：拷貝 NN *.nb（每個 model 一個 node，沒變的不會重拷）
+    for t, s in zip(target, source):
+        _safe_copy(str(s), str(t))
+    return 0
+
+@buildtrace.action
+def _nn_manifest_action(target, source, env):
+    # 模型內容清單 {檔名: 內容雜湊}；fwfs_nn_model.bin / nn_model.bin 只看這份清單，模型沒變就不重新 convert。
+    # 上次清單有、這次沒有的 .nb（模型被刪 / 改名）從 build_dir 移掉，免得被 elf2bin 讀到
+    out = str(target[0])
+    try:
+        with open(out, "r", encoding="utf-8") as f:
+            old = json.load(f)
+    except (OSError, ValueError):
+        old = {}
+    models = {os.path.basename(str(s)): stampdb.digest(files=[str(s)]) for s in source}
+    for name in sorted(set(old) - set(models)):
+        try:
+            os.remove(os.path.join(build_dir, name))
+        except OSError:
+            pass
+    changed = sorted(n for n in set(old) | set(models) if old.get(n) != models.get(n))
+    print(">>> NN models " + (f"changed: {', '.join(changed)}" if changed else "unchanged"))
+    if changed or not os.path.exists(out):
+        tmp = out + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(models, f, indent=1, sort_keys=True)
+        os.replace(tmp, out)
+    return 0
+
+def _key_files(d):
+    return [os.path.join(d, "key_public.json"), os.path.join(d, "key_private.json")]
+
+def _publish_outputs(paths):
+    # 對齊 CMake：輸出 output/ 目錄
+    outdir = os.path.join(build_dir, "output")
+    os.makedirs(outdir, exist_ok=True)
+    for p in paths:
+        if os.path.exists(p):
+            _safe_copy(p, os.path.join(outdir, os.path.basename(p)))
+
+def _stamped_keygen():
+    # keygen：key 放在 key store（所有 environment 共用、clean 後仍在），key_cfg.json 內容沒看過才跑 elf2bin keygen；
+    # build_dir 只放連結 / 複本，後面簽章步驟的 stamp 才會命中
+    public, private, created = keystore.ensure(
+        sdk_key_cfg_path, lambda cwd: _run([sdk_elf2bin_path, "keygen", sdk_key_cfg_path, "key"], cwd=cwd))
+    print(f">>> keygen: {'generated' if created else 'reusing'} key {keystore.fingerprint(sdk_key_cfg_path)} "
+          f"from {os.path.dirname(public)}")
+    keys = _key_files(build_dir)
+    for src, dst in zip((public, private), keys):
+        _safe_copy(src, dst, mutable=True)
+    return keys
+
+def _stamped_convert(json_path, kind, out_name, inputs=()):
+    # elf2bin convert 的通用步驟；inputs 為 json 以外、會被 elf2bin 讀到的檔案
+    out = os.path.join(build_dir, out_name)
+    stampdb.step(f"convert.{out_name}",
+                 stampdb.digest(files=[sdk_elf2bin_path, json_path] + list(inputs)),
+                 [out],
+                 lambda: _run([sdk_elf2bin_path, "convert", json_path, kind, out_name], cwd=build_dir, outputs=[out]))
+    return out
+
+elfreader_path = os.path.join(env.PioPlatform().get_dir(), "builder", "elfreader.py")
+
+def _stamped_nm(name, elf, nm_map, sizes):
+    # nm map / section 大小（純給人看，-t symbols 才產生）；elfreader 直接讀 ELF
+    # ELF 讀不了就讓 target 失敗；寫到一半的檔案刪掉，不記進 stamp、也不發佈
+    def _nm():
+        try:
+            parsed = elfreader.load(elf)
+            parsed.write_nm(nm_map)
+            parsed.write_sizes(sizes)
+        except Exception:
+            _remove_files([nm_map, sizes])
+            raise
+
+    stampdb.step(name, stampdb.digest(files=[elfreader_path], elfs=[elf]), [nm_map, sizes], _nm)
+    _publish_outputs([nm_map, sizes])
+
+def _stamped_disasm(name, elf, asm):
+    # 反組譯（-t disasm 才產生）；ELF 內容沒變就從 stamp 快取還原
+    # objdump 失敗時刪掉不完整的 .asm 並讓 target 失敗（不然會被記進 stamp，之後一直還原壞掉的檔案）
+    def _disasm():
+        try:
+            with open(asm, "w", encoding="utf-8") as wf:
+                subprocess.run([objdump, "-d", elf], stdout=wf, text=True, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            _remove_files([asm])
+            raise
+
+    stampdb.step(name, stampdb.digest(files=[objdump], elfs=[elf]), [asm], _disasm)
+    _publish_outputs([asm])
+
+bootfcs_obj = os.path.join(build_dir, "bootloader/obj/component/video/driver/RTL8735B/video_user_boot.c.bootloader.o")
 
 def postprocess_bootloader_with_elf2bin():
     image_out = build_dir
@@ -805,35 +1622,51 @@ def postprocess_bootloader_with_elf2bin():
     if not os.path.exists(boot_elf):
         raise FileNotFoundError("bootloader.elf not found")
 
-    # 對齊 CMake：產生 map/asm/axf（純給人看）
-    with open(os.path.join(image_out, "bootloader.asm"), "w") as wf:
-        subprocess.run([objdump, "-d", boot_elf], stdout=wf)
-    shutil.copyfile(boot_elf, os.path.join(image_out, "bootloader.axf"))
-
-    _run([sdk_elf2bin_path, "keygen", sdk_key_cfg_path, "key"], cwd=image_out)
-
-    # 把 POSTBUILD_BOOT 當成 json
-    _run([sdk_elf2bin_path, "convert", sdk_amebapro2_bootloader_path, "BOOTLOADER", "boot.bin"], cwd=image_out)
+    keys = _key_files(image_out)
 
-    # boot.bin 應該已經存在
+    # 把 POSTBUILD_BOOT 當成 json；key 只看 ELF 的 section 內容，時間戳變了不算
     boot_bin = os.path.join(image_out, "boot.bin")
-    if not os.path.exists(boot_bin):
-        # 有些 elf2bin 專案檔會直接輸出到 output/，幫你搬回 build_dir
-        cand = glob.glob(os.path.join(image_out, "output", "boot.bin"))
-        if cand:
-            shutil.copy2(cand[0], boot_bin)
+    boot_axf = os.path.join(image_out, "bootloader.axf")
+
+    def _boot_image():
+        shutil.copyfile(boot_elf, boot_axf)
+        _run([sdk_elf2bin_path, "convert", sdk_amebapro2_bootloader_path, "BOOTLOADER", "boot.bin"], cwd=image_out,
+             outputs=[boot_bin])
+        # boot.bin 應該已經存在
+        if not os.path.exists(boot_bin):
+            # 有些 elf2bin 專案檔會直接輸出到 output/，幫你搬回 build_dir
+            cand = glob.glob(os.path.join(image_out, "output", "boot.bin"))
+            if cand:
+                shutil.copy2(cand[0], boot_bin)
+
+    stampdb.step("boot.image",
+                 stampdb.digest(files=[sdk_elf2bin_path, sdk_amebapro2_bootloader_path] + keys, elfs=[boot_elf]),
+                 [boot_bin, boot_axf],
+                 _boot_image)
 
     if not os.path.exists(boot_bin):
         print(">>> WARN: boot.bin not found after elf2bin convert（請檢查 json / sdk_elf2bin_path）")
 
+    _publish_outputs([boot_bin, boot_axf])
+    print(">>> bootloader (sdk_elf2bin_path) done")
+    # 回傳可能會被 imagetool 合併用到的路徑（若不存在，也不致於中斷）
+    return boot_bin if os.path.exists(boot_bin) else None,
+
+def postprocess_bootfcs():
+    image_out = build_dir
+    boot_fcs = os.path.join(image_out, "boot_fcs.bin")
+
     # 盡力在 build_dir 找出含 video_user_boot 的物件
-    bootfcs_obj = os.path.join(build_dir, "bootloader/obj/component/video/driver/RTL8735B/video_user_boot.c.bootloader.o")
-    
-    if os.path.exists(bootfcs_obj):
+    if not os.path.exists(bootfcs_obj):
+        print(">>> WARN: 找不到 bootfcs 物件，無法抽出 boot_fcs.bin（可透過環境變數 FCS_FB_OBJ 指定 .o 檔路徑）")
+        return None
+
+    def _boot_fcs():
         tmpo = os.path.join(image_out, "tmp_bootfcs.o")
         shutil.copyfile(bootfcs_obj, tmpo)
-        _run([objcopy, "-O", "binary", tmpo, "boot_fcs.bin", "-j", ".data.video_boot_stream"], strict=False, cwd=image_out)
-        if os.path.exists(os.path.join(image_out, "boot_fcs.bin")):
+        _run([objcopy, "-O", "binary", tmpo, "boot_fcs.bin", "-j", ".data.video_boot_stream"], strict=False, cwd=image_out,
+             outputs=[boot_fcs])
+        if os.path.exists(boot_fcs):
             # chksum（可選）
             try:
                 _run([sdk_checksum_path, "-m", "fcs","boot_fcs.bin"], strict=False, cwd=image_out)
@@ -843,31 +1676,13 @@ def postprocess_bootloader_with_elf2bin():
             os.remove(tmpo)
         except OSError:
             pass
-    else:
-        print(">>> WARN: 找不到 bootfcs 物件，無法抽出 boot_fcs.bin（可透過環境變數 FCS_FB_OBJ 指定 .o 檔路徑）")
-
-    # 對齊 CMake：輸出 output/ 目錄
-    outdir = os.path.join(image_out, "output")
-    os.makedirs(outdir, exist_ok=True)
-    for f in ("boot.bin", "bootloader.axf", "boot_fcs.bin"):
-        p = os.path.join(image_out, f)
-        if os.path.exists(p):
-            _safe_copy(p, os.path.join(outdir, f))
-
-    # 盡力複製 nm.map / asm，名稱與 CMake 接近
-    try:
-        with open(os.path.join(image_out, "bootloader.nm.map"), "w", encoding="utf-8") as wf:
-            subprocess.run([nm, "-n", boot_elf], stdout=wf, text=True, check=False)
-        with open(os.path.join(image_out, "bootloader.asm"), "w", encoding="utf-8") as wf:
-            subprocess.run([objdump, "-d", boot_elf], stdout=wf, text=True, check=False)
-        _safe_copy(os.path.join(image_out, "bootloader.nm.map"), os.path.join(outdir, "bootloader.nm.map"))
-        _safe_copy(os.path.join(image_out, "bootloader.asm"),    os.path.join(outdir, "bootloader.asm"))
-    except Exception:
-        pass
 
-    print(">>> bootloader (sdk_elf2bin_path) done")
-    # 回傳可能會被 imagetool 合併用到的路徑（若不存在，也不致於中斷）
-    return boot_bin if os.path.exists(boot_bin) else None,
+    stampdb.step("boot.fcs",
+                 stampdb.digest(files=[bootfcs_obj, objcopy, sdk_checksum_path]),
+                 [boot_fcs],
+                 _boot_fcs)
+    _publish_outputs([boot_fcs])
+    return boot_fcs if os.path.exists(boot_fcs) else None
 
 def postprocess_application_with_elf2bin():
     image_out = build_dir
@@ -876,128 +1691,175 @@ def postprocess_application_with_elf2bin():
     if not os.path.exists(app_elf):
         raise FileNotFoundError("application.elf not found")
 
-    # symbols / asm / axf
-    try:
-        with open(os.path.join(image_out, "application.nm.map"), "w", encoding="utf-8") as wf:
-            subprocess.run([nm, "-n", app_elf], stdout=wf, text=True, check=False)
-        with open(os.path.join(image_out, "application.asm"), "w", encoding="utf-8") as wf:
-            subprocess.run([objdump, "-d", app_elf], stdout=wf, text=True, check=False)
-    except Exception:
-        pass
-
     axf_filename = "application.ns.axf" if USE_TZ else "application.ntz.axf"
-    shutil.copyfile(app_elf, os.path.join(image_out, axf_filename))
-
-    # 轉成 firmware_tz.bin / firmware_ntz.bin
-    post_json = sdk_amebapro2_application_path
-    _run([sdk_elf2bin_path, "convert", post_json, "FIRMWARE", "firmware.bin"], cwd=image_out)
-
+    app_axf = os.path.join(image_out, axf_filename)
+    firmware_bin = os.path.join(build_dir, "firmware.bin")
     # application.bin（保留你原工作流用）
     out_img2 = os.path.join(build_dir, "application.bin")
-    _safe_copy(os.path.join(build_dir, "firmware.bin"), out_img2)
 
+    def _app_firmware():
+        shutil.copyfile(app_elf, app_axf)
+        # 轉成 firmware_tz.bin / firmware_ntz.bin
+        _run([sdk_elf2bin_path, "convert", sdk_amebapro2_application_path, "FIRMWARE", "firmware.bin"], cwd=image_out,
+             outputs=[firmware_bin])
+        _safe_copy(firmware_bin, out_img2)
+
+    stampdb.step("app.firmware",
+                 stampdb.digest(files=[sdk_elf2bin_path, sdk_amebapro2_application_path] + _key_files(image_out),
+                                elfs=[app_elf]),
+                 [app_axf, firmware_bin, out_img2],
+                 _app_firmware)
+
+    # APP.trace（若存在就拷）
+    app_trace = os.path.join(build_dir, "APP.trace")
+    if not os.path.exists(app_trace) and os.path.exists(os.path.join(build_dir, "output", "APP.trace")):
+        _safe_copy(os.path.join(build_dir, "output", "APP.trace"), app_trace)
+
+    _publish_outputs([out_img2, firmware_bin, app_axf])
+    print(">>> application postbuild done")
+    return {"firmware": firmware_bin}
+
+def postprocess_application_symbols():
+    app_elf = os.path.join(build_dir, "application.elf")
     # 產 application.symbols（供 nn_model_cfg 使用）
-    sym_out = os.path.join(image_out, "application.symbols")
+    sym_out = os.path.join(build_dir, "application.symbols")
+
+    def _app_symbols():
+        # 跟 `nm -n` 同格式；與 -t symbols 的 app.nm 共用同一次 ELF parse
+        elfreader.load(app_elf).write_nm(sym_out)
+
     try:
-        with open(sym_out, "w", encoding="utf-8") as wf:
-            subprocess.run([nm, "-n", app_elf], stdout=wf, text=True, check=False)
+        stampdb.step("app.symbols",
+                     stampdb.digest(files=[elfreader_path], elfs=[app_elf]),
+                     [sym_out],
+                     _app_symbols)
     except Exception:
         print(">>> WARN: cannot generate application.symbols")
+    _publish_outputs([sym_out])
+    return sym_out
 
-    # output/
-    outdir = os.path.join(image_out, "output")
-    os.makedirs(outdir, exist_ok=True)
-    for f in ("application.bin", "firmware.bin", axf_filename, "application.nm.map", "application.asm", "application.symbols"):
-        _safe_copy(os.path.join(image_out, f), os.path.join(outdir, f))
-
-    print(">>> application postbuild done")
-    return {"firmware": os.path.join(build_dir, "firmware.bin"), "symbols": sym_out}
-
+@buildtrace.action
 def _post_bootloader_elf2bin_action(target, source, env):
     postprocess_bootloader_with_elf2bin()
     return 0
 
+@buildtrace.action
+def _bootfcs_action(target, source, env):
+    postprocess_bootfcs()
+    return 0
+
+def _diag_nm_action(name):
+    def _act(target, source, env):
+        _stamped_nm(name, str(source[0]), str(target[0]), str(target[1]))
+        return 0
+    return buildtrace.action(_act, "symbols")
+
+def _diag_disasm_action(name):
+    def _act(target, source, env):
+        _stamped_disasm(name, str(source[0]), str(target[0]))
+        return 0
+    return buildtrace.action(_act, "disasm")
+
 # 綁定 SCons target：把 application.elf 轉出 application.bin（與 CMake 對齊）
+@buildtrace.action
 def _post_application_image_action(target, source, env):
     postprocess_application_with_elf2bin()
     return 0
 
-bootloader_all_bin = env.Command(
-    os.path.join(build_dir, "boot.bin"),  # 方便後面的 application 合併目標仍依此檔名
-    bootloader_elf,
-    _post_bootloader_elf2bin_action
-)
+@buildtrace.action
+def _application_symbols_action(target, source, env):
+    postprocess_application_symbols()
+    return 0
 
-# 生成 application 產物（image2 為必要；TZ=ON 才做 image3）
-application_all_bin = env.Command(
-    os.path.join(build_dir, "application.bin"),
-    application_elf,
-    _post_application_image_action
-)
+@buildtrace.action
+def _size_report_action(target, source, env):
+    # section 大小對照板子上限；寫 size_report.json，並跟其他 profile 上次的結果比較
+    board = env.BoardConfig()
+    images = sizereport.measure({"bootloader": str(source[0]), "application": str(source[1])})
+    report = sizereport.build(PROFILE, [f"{pat} = {' '.join(flags)}" for pat, flags in OPT_OVERRIDES], images,
+                              int(board.get("upload.maximum_size", 0)), int(board.get("upload.maximum_ram_size", 0)))
+    history = sizereport.write(report, str(target[0]), os.path.join(project_cache_dir, "size_profiles.json"))
+    for line in sizereport.lines(report, history):
+        print(">>> size " + line)
+    for what in sizereport.over(report):
+        print(f">>> WARN: {what} usage exceeds the board limit")
+    _publish_outputs([str(target[0])])
+    return 0
 
+@buildtrace.action
 def _keygen_action(target, source, env):
     print(">>> keygen action...")
     # keycfg.json -> key_public.json/key_private.json
-    _run([sdk_elf2bin_path, "keygen", sdk_key_cfg_path, "key"], cwd=build_dir)
+    _stamped_keygen()
     print(">>> keygen done")
     return 0
 
-def _sensor_iq_action(target, source, env):
-    print(">>> sensor IQ action...")
-
-    # 1) VOE bin 複製
-    _copy_glob(os.path.join(sdk_voe_bin_dir, "*.bin"), build_dir)
-
-    # 2/3) 由 sensor.h 產 snrlist（可選）
-    if sdk_gensnrlst_path and os.path.exists(sdk_gensnrlst_path):
-        try:
-            _run([sdk_gensnrlst_path, os.path.join(project_include_dir, "sensor.h")], cwd=build_dir, strict=False)
-        except Exception as e:
-            print(">>> WARN: gen_snrlst failed:", e)
-
-    # 4) ISP_SENSOR_SETS
-    _run([sdk_elf2bin_path, "convert", sdk_amebapro2_sensor_set_json, "ISP_SENSOR_SETS", "iq_set.bin"], cwd=build_dir)
-    _safe_copy(os.path.join(build_dir, "iq_set.bin"), os.path.join(build_dir, "isp_iq.bin"))
-    # 5) firmware_isp_iq.bin
-    _run([sdk_elf2bin_path, "convert", sdk_amebapro2_isp_iq_json, "FIRMWARE", "firmware_isp_iq.bin"], cwd=build_dir)
+def _convert_action(json_path, kind):
+    # cert / partition / fwfs / nn_model：各自獨立的 elf2bin convert，可平行
+    def _act(target, source, env):
+        out_name = os.path.basename(str(target[0]))
+        inputs = [str(s) for s in source if str(s) != json_path]
+        _stamped_convert(json_path, kind, out_name, inputs)
+        return 0
+    return buildtrace.action(_act, "convert")
 
-    print(">>> sensor IQ done")
+def _json_file_refs(json_path):
+    # elf2bin 的 json 裡出現的檔名（字串值的 basename）；讀不到回傳 None（呼叫端當作全部都要）
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    refs = set()
+
+    def _walk(node):
+        if isinstance(node, dict):
+            for v in node.values():
+                _walk(v)
+        elif isinstance(node, list):
+            for v in node:
+                _walk(v)
+        elif isinstance(node, str) and "." in node:
+            refs.add(os.path.basename(node.replace("\\", "/")))
+    _walk(data)
+    return refs
+
+def _json_inputs(json_path, nodes):
+    # nodes: {檔名: node}；只留 json 真的有引用的
+    refs = _json_file_refs(json_path)
+    return [n for name, n in sorted(nodes.items()) if refs is None or name in refs]
+
+@buildtrace.action
+def _copy_blob_action(target, source, env):
+    # VOE blob / isp_iq.bin：之後可能被 elf2bin 讀寫，不跟來源（SDK store）共用 inode
+    for t, s in zip(target, source):
+        _safe_copy(str(s), str(t), mutable=True)
     return 0
 
-def _plain_img_action(target, source, env):
-    print(">>> plain_img action...")
-
-    # 對齊 CMake：先拷貝 NN *.nb
-    if PRELOAD_NN:
-        _copy_nn_bins()
+@buildtrace.action
+def _gen_snrlst_action(target, source, env):
+    # gen_snrlst 的輸出檔名由工具決定：在空的 snrlst/ 目錄執行（不會被 -j 同時寫 build_dir 的其他步驟干擾），
+    # 產出的檔案放到 build_dir，檔名與內容雜湊寫進 target；內容沒變時清單不變，下游的 iq_set.bin 不會重產
+    out = str(target[0])
+    written = {}
+    sensor_h = os.path.join(project_include_dir, "sensor.h")
+    if sdk_gensnrlst_path and os.path.exists(sdk_gensnrlst_path) and os.path.exists(sensor_h):
+        work = os.path.join(build_dir, "snrlst")
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+        if _run([sdk_gensnrlst_path, sensor_h], cwd=work, strict=False) != 0:
+            print(">>> WARN: gen_snrlst failed")
+        for name in sorted(os.listdir(work)):
+            if _safe_copy(os.path.join(work, name), os.path.join(build_dir, name)):
+                written[name] = stampdb.digest(files=[os.path.join(build_dir, name)])
     else:
-        print(">>> skip copying NN models (PRELOAD_NN=0)")
-
-    # cert / partition
-    _run([sdk_elf2bin_path, "convert", sdk_certificate_json, "CERT_TABLE", "certable.bin"], cwd=build_dir)
-    _run([sdk_elf2bin_path, "convert", sdk_certificate_json, "CERTIFICATE", "certificate.bin"], cwd=build_dir)
-
-    _run([sdk_elf2bin_path, "convert", sdk_amebapro2_partitiontable_path, "PARTITIONTABLE", "partition.bin"], cwd=build_dir)
-
-    # boot / fcs / firmware / isp_iq
-    _safe_copy(os.path.join(build_dir, "boot.bin"), os.path.join(build_dir, "boot.bin"))
-    if os.path.exists(os.path.join(build_dir, "boot_fcs.bin")):
-        pass  # 已在 boot 後處理階段可能產生
-    _safe_copy(os.path.join(build_dir, "firmware_isp_iq.bin"), os.path.join(build_dir, "firmware_isp_iq.bin"))
-
-    # application.symbols（從 output/ 或本地）
-    sym_src = os.path.join(build_dir, "application.symbols")
-    if not os.path.exists(sym_src):
-        _safe_copy(os.path.join(build_dir, "output", "application.symbols"), sym_src)
-    # APP.trace（若存在就拷）
-    app_trace = os.path.join(build_dir, "APP.trace")
-    if not os.path.exists(app_trace) and os.path.exists(os.path.join(build_dir, "output", "APP.trace")):
-        _safe_copy(os.path.join(build_dir, "output", "APP.trace"), app_trace)
-
-    print(">>> plain_img prepared")
+        print(">>> NOTE: gen_snrlst or include/sensor.h not found; skip sensor list")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(written, f, indent=1, sort_keys=True)
     return 0
 
 # ---- auto_model_cfg ----
+@buildtrace.action
 def _auto_model_cfg_action(target, source, env):
     print(">>> auto_model cfg action...")
 
@@ -1006,238 +1868,358 @@ def _auto_model_cfg_action(target, source, env):
         _run([sdk_nn_model_cfg_path, sdk_amebapro2_fwfs_nn_models_path, "application.symbols"], cwd=build_dir)
     else:
         print(">>> skip model config (UNITEST=0)")
+    with open(str(target[0]), "w") as wf:
+        wf.write("done\n")
     return 0
 
-# ---- flash (CMake: flash ；含 MP / 非 MP 分支) ----
-def _flash_action(target, source, env):
-    print(">>> flash action...")
-
+def _flash_image_name(suffix=".bin"):
     tgt = "flash_tz" if USE_TZ else "flash_ntz"
     if USE_WLANMP:
         tgt += "_mp"
-    out = os.path.join(build_dir, f"{tgt}.bin")
+    return os.path.join(build_dir, tgt + suffix)
 
-    # 先產 partition.bin（不分 MP / 非 MP 都先做）
-    _run([sdk_elf2bin_path, "convert", sdk_amebapro2_partitiontable_path,
-          "PARTITIONTABLE", "partition.bin"], cwd=build_dir)
-    
-    mapping = "PT_PT=partition.bin,PT_BL_PRI=boot.bin,PT_FW1=firmware.bin,PT_ISP_IQ=firmware_isp_iq.bin"
-    if os.path.exists(os.path.join(build_dir, "boot_fcs.bin")):
-        mapping += ",PT_FCSDATA=boot_fcs.bin"
-    if USE_TZ:
-        mapping += ",CER_TBL=certable.bin,KEY_CER1=certificate.bin"
-
-    _run([sdk_elf2bin_path, "combine", sdk_amebapro2_partitiontable_path, out, mapping], cwd=build_dir)
-
-    # OTA + checksum（保持你原本流程）
-    if sdk_checksum_path:
-        for src, dst in [("firmware.bin","ota.bin"),
-                         ("firmware_isp_iq.bin","isp_iq_ota.bin"),
-                         ("boot.bin","boot_ota.bin")]:
-            if _safe_copy(os.path.join(build_dir, src), os.path.join(build_dir, dst)):
-                _run([sdk_checksum_path, os.path.join(build_dir, dst)], strict=False)
-
-    print(">>> flash done:", out)
+def _combine_action(mapping_parts):
+    # ---- flash / flash_nn (CMake: flash ；含 MP / 非 MP 分支) ----
+    # mapping_parts: [(partition, 檔名)]；partition.bin 等輸入都是上游 node，這裡只負責 combine
+    def _act(target, source, env):
+        out = str(target[0])
+        print(">>> combine", os.path.basename(out), "...")
+        parts = [(k, v) for k, v in mapping_parts
+                 if k != "PT_FCSDATA" or os.path.exists(os.path.join(build_dir, v))]
+        mapping = ",".join(f"{k}={v}" for k, v in parts)
+        # 驗證過的 image 只就地改寫有變的分區；第一次 / 分區表或 elf2bin 變了才整包 combine
+        image = FlashImage(out, stampdb.digest(files=[sdk_elf2bin_path, sdk_amebapro2_partitiontable_path]))
+        how = image.assemble([(k, os.path.join(build_dir, v)) for k, v in parts],
+                             load_layout(sdk_amebapro2_partitiontable_path),
+                             lambda: _run([sdk_elf2bin_path, "combine", sdk_amebapro2_partitiontable_path, out, mapping], cwd=build_dir,
+                                          outputs=[out]))
+        print(f">>> flash done ({how}):", out)
+        return 0
+    return buildtrace.action(_act, "combine")
+
+@buildtrace.action
+def _sparse_action(target, source, env):
+    # flat image -> <image>.sparse + manifest，output/ 只保存 sparse 版本（sparseimage.py expand 可還原）
+    sparse, manifest = str(target[0]), str(target[1])
+    m = sparseimage.write(str(source[0]), sparse, manifest)
+    stored = sum(c["length"] for c in m["chunks"])
+    print(f">>> sparse image: {len(m['chunks'])} chunk(s), {stored} of {m['size']} bytes:", sparse)
+    _publish_outputs([sparse, manifest])
     return 0
 
-# ---- flash_nn ----
-def _flash_nn_action(target, source, env):
-    print(">>> flash nn action...")
-    tgt = "flash_tz" if USE_TZ else "flash_ntz"
-    if USE_WLANMP:
-        tgt += "_mp"
-    out = os.path.join(build_dir, f"{tgt}.nn.bin")
-
-    # 生成 fwfs_nn_model.bin / nn_model.bin
-    _run([sdk_elf2bin_path, "convert", sdk_amebapro2_fwfs_nn_models_path, "FWFS", "fwfs_nn_model.bin"], cwd=build_dir)
-    _run([sdk_elf2bin_path, "convert", sdk_amebapro2_nn_model_path,      "FIRMWARE", "nn_model.bin"], cwd=build_dir)
-
-    # 先產 partition.bin
-    _run([sdk_elf2bin_path, "convert", sdk_amebapro2_partitiontable_path,
-          "PARTITIONTABLE", "partition.bin"], cwd=build_dir)
-    
-    mapping = "PT_PT=partition.bin,PT_BL_PRI=boot.bin,PT_FW1=firmware.bin,PT_NN_MDL=nn_model.bin,PT_ISP_IQ=firmware_isp_iq.bin"
-    if os.path.exists(os.path.join(build_dir, "boot_fcs.bin")):
-        mapping += ",PT_FCSDATA=boot_fcs.bin"
-    if USE_TZ:
-        mapping += ",CER_TBL=certable.bin,KEY_CER1=certificate.bin"
-
-    _run([sdk_elf2bin_path, "combine", sdk_amebapro2_partitiontable_path, out, mapping], cwd=build_dir)
-
-    # OTA + checksum
-    if sdk_checksum_path:
-        for src, dst in [("firmware.bin","ota.bin"),
-                         ("nn_model.bin","nn_model_ota.bin"),
-                         ("firmware_isp_iq.bin","isp_iq_ota.bin")]:
-            if _safe_copy(os.path.join(build_dir, src), os.path.join(build_dir, dst)):
-                _run([sdk_checksum_path, os.path.join(build_dir, dst)], strict=False)
-
-    print(">>> flash_nn done:", out)
+def _stamped_ota(src, dst):
+    # OTA + checksum（保持你原本流程）；checksum 會直接改寫目的檔
+    def _ota():
+        if _safe_copy(src, dst, mutable=True) and sdk_checksum_path:
+            _run([sdk_checksum_path, dst], strict=False, outputs=[dst])
+    stampdb.step(f"ota.{os.path.basename(dst)}",
+                 stampdb.digest(files=[src, sdk_checksum_path]),
+                 [dst],
+                 _ota)
+
+@buildtrace.action
+def _ota_action(target, source, env):
+    _stamped_ota(str(source[0]), str(target[0]))
     return 0
 
 # ---- secure: hash / sign / sign_enc ----
+# 每個模式四個 elf2bin secure：(模式參數, 輸入, 輸出, 額外輸入)；sign_enc 需要 encrypt_bl.json / encrypt_fw.json（MP JSON 已內建）
+SECURE_STEPS = {
+    "hash": [
+        ("sign+dbg=cert", "certificate.bin", "certificate_signed.bin", []),
+        ("hash+dbg=ptab", "partition.bin", "partition_hashed.bin", []),
+        ("hash+dbg=boot", "boot.bin", "boot_hashed.bin", []),
+        ("hash+dbg=fw",   "firmware.bin", "firmware_hashed.bin", []),
+    ],
+    "sign": [
+        ("sign+dbg=cert",      "certificate.bin", "certificate_signed.bin", []),
+        ("sign+hash+dbg=ptab", "partition.bin", "partition_signed.bin", []),
+        ("sign+hash+dbg=boot", "boot.bin", "boot_signed.bin", []),
+        ("sign+hash+dbg=fw",   "firmware.bin", "firmware_signed.bin", []),
+    ],
+    "sign_enc": [
+        ("sign+dbg=cert",          "certificate.bin", "certificate_signed.bin", []),
+        ("sign+hash+dbg=ptab",     "partition.bin", "partition_signed.bin", []),
+        ("sign+enc+hash+dbg=boot", "boot.bin", "boot_signed_enc.bin", [os.path.join(sdk_mp_dir, "encrypt_bl.json")]),
+        ("sign+enc+hash+dbg=fw",   "firmware.bin", "firmware_signed_enc.bin", [os.path.join(sdk_mp_dir, "encrypt_fw.json")]),
+    ],
+}
+
+# 簽章用到的未簽章檔案；在 secure/<模式>/ 底下各放一份，三個模式可以同時跑
+SECURE_INPUTS = ["key_public.json", "key_private.json", "certificate.bin", "partition.bin", "boot.bin", "firmware.bin",
+                 "certable.bin", "firmware_isp_iq.bin", "boot_fcs.bin", "nn_model.bin"]
+
+def _secure_variants():
+    # [(檔名後綴, 額外分區)]：同一份簽章產出不含 / 含 NN model 的 flash image
+    out = [("", [])]
+    if PRELOAD_NN:
+        out.append((".nn", [("PT_NN_MDL", "nn_model.bin")]))
+    return out
+
+def _secure_targets(mode):
+    return [_flash_image_name(f".{mode}{suffix}.bin") for suffix, _ in _secure_variants()] + \
+           [os.path.join(build_dir, f"ota.{mode}.bin")]
+
+def _secure_step(work, keys, op, src, dst, extra):
+    # 一個 elf2bin secure；(輸入內容, key 指紋, 模式) 在簽章快取裡就直接還原。回傳是否命中
+    out = os.path.join(work, dst)
+    key = sigcache.key(op, os.path.join(work, src), keys, sdk_elf2bin_path, extra)
+    with buildtrace.span(f"secure {op}", "sign", image=src) as ev:
+        ev["hit"] = sigcache.fetch(key, out)
+        if not ev["hit"]:
+            _run([sdk_elf2bin_path, "secure", op, "key_private.json", "key_public.json"] + list(extra) + [src, dst], cwd=work,
+                 outputs=[out])
+            sigcache.store(key, out)
+    return ev["hit"]
+
+def _secure_combine(work, out, mapping_parts):
+    # 跟 flash image 一樣走增量組裝：只有簽章有變的分區會被改寫
+    parts = [(k, v) for k, v in mapping_parts if k != "PT_FCSDATA" or os.path.exists(os.path.join(work, v))]
+    mapping = ",".join(f"{k}={v}" for k, v in parts)
+    image = FlashImage(out, stampdb.digest(files=[sdk_elf2bin_path, sdk_amebapro2_partitiontable_path]))
+    return image.assemble([(k, os.path.join(work, v)) for k, v in parts],
+                          load_layout(sdk_amebapro2_partitiontable_path),
+                          lambda: _run([sdk_elf2bin_path, "combine", sdk_amebapro2_partitiontable_path, out, mapping], cwd=work,
+                                       outputs=[out]))
+
 def _secure_action(mode):
+    # 四個 secure 同時跑（快取命中的直接還原），再同時組出每個 variant 的 flash image 與 OTA
     def _act(target, source, env):
-        # sign/hash
-        if mode == "hash":
-            _run([sdk_elf2bin_path, "secure", "sign+dbg=cert", "key_private.json", "key_public.json", "certificate.bin", "certificate_signed.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "hash+dbg=ptab", "key_private.json", "key_public.json", "partition.bin", "partition_hashed.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "hash+dbg=boot", "key_private.json", "key_public.json", "boot.bin", "boot_hashed.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "hash+dbg=fw",   "key_private.json", "key_public.json", "firmware.bin", "firmware_hashed.bin"], cwd=build_dir)
-            tgt = "flash_tz" if USE_TZ else "flash_ntz"
-            if USE_WLANMP: tgt += "_mp"
-            out = os.path.join(build_dir, f"{tgt}.bin")
-            mapping = "PT_PT=partition_hashed.bin,CER_TBL=certable.bin,KEY_CER1=certificate_signed.bin,PT_BL_PRI=boot_hashed.bin,PT_FW1=firmware_hashed.bin,PT_ISP_IQ=firmware_isp_iq.bin"
-            if os.path.exists(os.path.join(build_dir, "boot_fcs.bin")):
-                mapping += ",PT_FCSDATA=boot_fcs.bin"
-            _run([sdk_elf2bin_path, "combine", "amebapro2_partitiontable.json", out, mapping], cwd=build_dir)
-            if sdk_checksum_path:
-                if _safe_copy(os.path.join(build_dir, "firmware_hashed.bin"), os.path.join(build_dir, "ota.bin")):
-                    _run([sdk_checksum_path, os.path.join(build_dir, "ota.bin")], strict=False)
-        elif mode == "sign":
-            _run([sdk_elf2bin_path, "secure", "sign+dbg=cert", "key_private.json", "key_public.json", "certificate.bin", "certificate_signed.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "sign+hash+dbg=ptab", "key_private.json", "key_public.json", "partition.bin", "partition_signed.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "sign+hash+dbg=boot", "key_private.json", "key_public.json", "boot.bin", "boot_signed.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "sign+hash+dbg=fw",   "key_private.json", "key_public.json", "firmware.bin", "firmware_signed.bin"], cwd=build_dir)
-            tgt = "flash_tz" if USE_TZ else "flash_ntz"
-            if USE_WLANMP: tgt += "_mp"
-            out = os.path.join(build_dir, f"{tgt}.bin")
-            mapping = "PT_PT=partition_signed.bin,CER_TBL=certable.bin,KEY_CER1=certificate_signed.bin,PT_BL_PRI=boot_signed.bin,PT_FW1=firmware_signed.bin,PT_ISP_IQ=firmware_isp_iq.bin"
-            if os.path.exists(os.path.join(build_dir, "boot_fcs.bin")):
-                mapping += ",PT_FCSDATA=boot_fcs.bin"
-            _run([sdk_elf2bin_path, "combine", "amebapro2_partitiontable.json", out, mapping], cwd=build_dir)
-            if sdk_checksum_path:
-                if _safe_copy(os.path.join(build_dir, "firmware_signed.bin"), os.path.join(build_dir, "ota.bin")):
-                    _run([sdk_checksum_path, os.path.join(build_dir, "ota.bin")], strict=False)
-        elif mode == "sign_enc":
-            # 需要 encrypt_bl.json / encrypt_fw.json（MP JSON 已內建）
-            enc_boot = os.path.join(sdk_mp_dir, "encrypt_bl.json")
-            enc_fw   = os.path.join(sdk_mp_dir, "encrypt_fw.json")
-            _run([sdk_elf2bin_path, "secure", "sign+dbg=cert", "key_private.json", "key_public.json", "certificate.bin", "certificate_signed.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "sign+hash+dbg=ptab", "key_private.json", "key_public.json", "partition.bin", "partition_signed.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "sign+enc+hash+dbg=boot", "key_private.json", "key_public.json", enc_boot, "boot.bin", "boot_signed_enc.bin"], cwd=build_dir)
-            _run([sdk_elf2bin_path, "secure", "sign+enc+hash+dbg=fw",   "key_private.json", "key_public.json", enc_fw,   "firmware.bin", "firmware_signed_enc.bin"], cwd=build_dir)
-            tgt = "flash_tz" if USE_TZ else "flash_ntz"
-            if USE_WLANMP: tgt += "_mp"
-            out = os.path.join(build_dir, f"{tgt}.bin")
-            mapping = "PT_PT=partition_signed.bin,CER_TBL=certable.bin,KEY_CER1=certificate_signed.bin,PT_BL_PRI=boot_signed_enc.bin,PT_FW1=firmware_signed_enc.bin,PT_ISP_IQ=firmware_isp_iq.bin"
-            if os.path.exists(os.path.join(build_dir, "boot_fcs.bin")):
-                mapping += ",PT_FCSDATA=boot_fcs.bin"
-            _run([sdk_elf2bin_path, "combine", "amebapro2_partitiontable.json", out, mapping], cwd=build_dir)
-            if sdk_checksum_path:
-                if _safe_copy(os.path.join(build_dir, "firmware_signed_enc.bin"), os.path.join(build_dir, "ota.bin")):
-                    _run([sdk_checksum_path, os.path.join(build_dir, "ota.bin")], strict=False)
-        print(f">>> {mode} done")
+        work = os.path.join(build_dir, "secure", mode)
+        os.makedirs(work, exist_ok=True)
+        for name in SECURE_INPUTS:
+            if os.path.exists(os.path.join(build_dir, name)):
+                _safe_copy(os.path.join(build_dir, name), os.path.join(work, name), mutable=True)
+        steps = SECURE_STEPS[mode]
+        hits = runner.wait([runner.submit(_secure_step, work, _key_files(work), *step) for step in steps])
+        print(f">>> {mode}: {len(steps) - sum(hits)} image(s) signed, {sum(hits)} from the signature cache")
+
+        signed = {src: dst for _, src, dst, _ in steps}
+        mapping_parts = [("PT_PT", signed["partition.bin"]), ("CER_TBL", "certable.bin"),
+                         ("KEY_CER1", signed["certificate.bin"]), ("PT_BL_PRI", signed["boot.bin"]),
+                         ("PT_FW1", signed["firmware.bin"]), ("PT_ISP_IQ", "firmware_isp_iq.bin"),
+                         ("PT_FCSDATA", "boot_fcs.bin")]
+        images = [str(t) for t in target[:-1]]
+        jobs = [runner.submit(_secure_combine, work, out, mapping_parts + extra)
+                for out, (_, extra) in zip(images, _secure_variants())]
+        jobs.append(runner.submit(_stamped_ota, os.path.join(work, signed["firmware.bin"]), str(target[-1])))
+        for out, how in zip(images, runner.wait(jobs)):
+            print(f">>> {mode} done ({how}):", out)
+        _publish_outputs([str(t) for t in target])
         return 0
-    return _act
+    return buildtrace.action(_act, f"secure.{mode}")
 
+# ---- post-build DAG ----
+# 每個 node 只宣告真正讀到的輸入；彼此沒有資料相依的步驟（boot / firmware / sensor IQ /
+# cert / partition / fwfs / nn_model）交給 SCons 依 -j 平行執行
 keygen = env.Command(
-    [os.path.join(build_dir, "key_public.json"),
-     os.path.join(build_dir, "key_private.json")],
-    [], _keygen_action
+    _key_files(build_dir),
+    [sdk_key_cfg_path], _keygen_action
 )
 Alias("keygen", keygen)
 
-sensor_iq_target = env.Command(
-    [os.path.join(build_dir, "iq_set.bin"),
-     os.path.join(build_dir, "isp_iq.bin"),
-     os.path.join(build_dir, "firmware_isp_iq.bin")],
-    [], _sensor_iq_action
+bootloader_all_bin = env.Command(
+    [os.path.join(build_dir, "boot.bin"),  # 方便後面的 application 合併目標仍依此檔名
+     os.path.join(build_dir, "bootloader.axf")],
+    [bootloader_elf, sdk_amebapro2_bootloader_path, keygen],
+    _post_bootloader_elf2bin_action
+)
+
+bootfcs_bin = env.Command(
+    os.path.join(build_dir, "boot_fcs.bin"),
+    [bootfcs_obj],
+    _bootfcs_action
+)
+
+# 生成 application 產物（image2 為必要；TZ=ON 才做 image3）
+application_all_bin = env.Command(
+    [os.path.join(build_dir, "application.bin"),
+     os.path.join(build_dir, "firmware.bin"),
+     os.path.join(build_dir, "application.ns.axf" if USE_TZ else "application.ntz.axf")],
+    [application_elf, sdk_amebapro2_application_path, keygen],
+    _post_application_image_action
+)
+
+application_symbols = env.Command(
+    os.path.join(build_dir, "application.symbols"),
+    application_elf,
+    _application_symbols_action
+)
+
+# sensor IQ / VOE：每一步都是獨立 node，只宣告真正讀到的輸入
+# VOE blob 一個檔案一個 node；gen_snrlst 依 include/sensor.h（含它 include 的 header）；
+# 兩個 convert 依 json 與 json 引用到的檔案
+voe_bins = {
+    os.path.basename(p): env.Command(os.path.join(build_dir, os.path.basename(p)), p, _copy_blob_action)
+    for p in sorted(glob.glob(os.path.join(sdk_voe_bin_dir, "*.bin")))
+}
+project_sensor_h = os.path.join(project_include_dir, "sensor.h")
+snrlst = env.Command(
+    os.path.join(build_dir, "snrlst.json"),
+    [project_sensor_h] if os.path.exists(project_sensor_h) else [],
+    _gen_snrlst_action,
+    source_scanner=c_scanner, CPPPATH=[project_include_dir] + include_dirs
 )
+if sdk_gensnrlst_path and os.path.exists(sdk_gensnrlst_path):
+    env.Depends(snrlst, sdk_gensnrlst_path)
+iq_set_bin = env.Command(
+    os.path.join(build_dir, "iq_set.bin"),
+    [sdk_amebapro2_sensor_set_json, keygen, snrlst] + _json_inputs(sdk_amebapro2_sensor_set_json, voe_bins),
+    _convert_action(sdk_amebapro2_sensor_set_json, "ISP_SENSOR_SETS")
+)
+isp_iq_bin = env.Command(os.path.join(build_dir, "isp_iq.bin"), iq_set_bin, _copy_blob_action)
+firmware_isp_iq_bin = env.Command(
+    os.path.join(build_dir, "firmware_isp_iq.bin"),
+    [sdk_amebapro2_isp_iq_json, keygen] + _json_inputs(sdk_amebapro2_isp_iq_json, dict(
+        voe_bins, **{"iq_set.bin": iq_set_bin, "isp_iq.bin": isp_iq_bin})),
+    _convert_action(sdk_amebapro2_isp_iq_json, "FIRMWARE")
+)
+sensor_iq_target = iq_set_bin + isp_iq_bin + firmware_isp_iq_bin
 Alias("fcs_isp_iq", [sensor_iq_target])
 
-plain_img = env.Command(
-    os.path.join(build_dir, ".stamp_plain_img"),
-    [bootloader_all_bin, application_all_bin, sensor_iq_target, keygen],
-    _plain_img_action
+# cert / partition
+certable_bin = env.Command(
+    os.path.join(build_dir, "certable.bin"),
+    [sdk_certificate_json, keygen],
+    _convert_action(sdk_certificate_json, "CERT_TABLE")
+)
+certificate_bin = env.Command(
+    os.path.join(build_dir, "certificate.bin"),
+    [sdk_certificate_json, keygen],
+    _convert_action(sdk_certificate_json, "CERTIFICATE")
+)
+partition_bin = env.Command(
+    os.path.join(build_dir, "partition.bin"),
+    [sdk_amebapro2_partitiontable_path, keygen],
+    _convert_action(sdk_amebapro2_partitiontable_path, "PARTITIONTABLE")
 )
 
-env.Depends(sensor_iq_target,      keygen)
-env.Depends(bootloader_all_bin,    sensor_iq_target)
-env.Depends(application_all_bin,   bootloader_all_bin)
+size_report = env.Command(os.path.join(build_dir, "size_report.json"),
+                          [bootloader_elf, application_elf], _size_report_action)
+
+plain_img = [bootloader_all_bin, bootfcs_bin, application_all_bin, application_symbols,
+             sensor_iq_target, certable_bin, certificate_bin, partition_bin, size_report]
+Alias("plain_img", plain_img)
+
+# 診斷產物不在預設流程裡：`pio run -t symbols` / `pio run -t disasm` 才產生
+# （沒有 Default()，宣告出來的檔案 target 一般 build 也會做，所以只在指令列要求時才宣告）
+diag_symbols = []
+diag_disasm = []
+for _name, _elf in (("boot", bootloader_elf), ("app", application_elf)):
+    _base = "bootloader" if _name == "boot" else "application"
+    if "symbols" in COMMAND_LINE_TARGETS:
+        diag_symbols += env.Command(
+            [os.path.join(build_dir, f"{_base}.nm.map"),
+             os.path.join(build_dir, f"{_base}.sections.txt")],
+            _elf, _diag_nm_action(f"{_name}.nm"))
+    if "disasm" in COMMAND_LINE_TARGETS:
+        diag_disasm += env.Command(
+            os.path.join(build_dir, f"{_base}.asm"),
+            _elf, _diag_disasm_action(f"{_name}.disasm"))
+if diag_symbols:
+    Alias("symbols", diag_symbols)
+if diag_disasm:
+    Alias("disasm", diag_disasm)
+
+def _unity_conflicts_action(target, source, env):
+    # `pio run -t unity_conflicts`：列出 unity build 會退回單獨編譯的檔案與原因
+    groups, _ = _split_components(application_src)
+    for name in UNITY_COMPONENTS:
+        batches, singles, clashes = _unity_plan(name, groups.get(name, []))
+        print(f">>> unity {name}: {sum(len(b) for b in batches)} file(s) in {len(batches)} group(s), "
+              f"{len(singles)} compiled alone")
+        for (kind, sym), files in sorted(clashes.items()):
+            print(f"    {kind} {sym}: " + ", ".join(os.path.relpath(f, sdk_dir) for f in files))
+        for f in singles:
+            if not any(f in files for files in clashes.values()):
+                print(f"    alone: {os.path.relpath(f, sdk_dir)} (configures headers, excluded or last of a batch)")
+    return 0
+
+AlwaysBuild(Alias("unity_conflicts", [], _unity_conflicts_action))
 
 auto_model_cfg = env.Command(
     os.path.join(build_dir, ".stamp_auto_model_cfg"),
-    [plain_img],
+    [application_symbols, sdk_amebapro2_fwfs_nn_models_path],
     _auto_model_cfg_action
 )
 Alias("auto_model_cfg", auto_model_cfg)
 
-if PRELOAD_NN:
-    flash_target = env.Command(
-        os.path.join(build_dir, ".stamp_flash_nn"),
-        [plain_img, auto_model_cfg],
-        _flash_nn_action
-    )
-    Alias("flash_nn", [flash_target])
+flash_parts = [("PT_PT", "partition.bin"), ("PT_BL_PRI", "boot.bin"), ("PT_FW1", "firmware.bin")]
+flash_inputs = [partition_bin, bootloader_all_bin, bootfcs_bin, application_all_bin, sensor_iq_target]
+if USE_TZ:
+    flash_tz_parts = [("CER_TBL", "certable.bin"), ("KEY_CER1", "certificate.bin")]
+    flash_inputs += [certable_bin, certificate_bin]
 else:
-    flash_target = env.Command(
-        os.path.join(build_dir, ".stamp_flash"),
-        [plain_img],
-        _flash_action
-    )
-    Alias("flash", [flash_target])
-'''
-hash_target = env.Command(os.path.join(build_dir, ".stamp_hash"),     [plain_img], _secure_action("hash"))
-sign_target = env.Command(os.path.join(build_dir, ".stamp_sign"),     [plain_img], _secure_action("sign"))
-signenc_tgt = env.Command(os.path.join(build_dir, ".stamp_sign_enc"), [plain_img], _secure_action("sign_enc"))
-Alias("hash",     [hash_target])
-Alias("sign",     [sign_target])
-Alias("sign_enc", [signenc_tgt])
-'''
-# --- Upload --- 
-def _pick_flash_image():
-    tgt = "flash_tz" if USE_TZ else "flash_ntz"
-    if USE_WLANMP:
-        tgt += "_mp"
-    for name in (f"{tgt}.nn.bin", f"{tgt}.bin"):
-        p = os.path.join(build_dir, name)
-        if os.path.exists(p):
-            return p
-    raise FileNotFoundError("no flash image found; please run `pio run -t flash` or `pio run -t flash_nn` first")
+    flash_tz_parts = []
 
-def upload_amebapro2(source, target, env):
-    print(">>> Uploading AmebaPro2 image ...")
-    port = env.GetProjectOption("upload_port") or os.environ.get("UPLOAD_PORT") or "COM3"
-    baud = str(env.GetProjectOption("upload_speed") or os.environ.get("UPLOAD_SPEED") or 1500000)
-
-    image = _pick_flash_image()
-    print(f">>> Image: {image}")
-
-    # Arduino core tools 來源路徑
-    tool_dir_src = os.path.join(sdk_dir, "tools/Pro2_PG_tool _v1.4.3")
-    if os.name == "nt":
-        upload_tool = os.path.join(tool_dir_src, "uartfwburn.exe")
-        flashloader_src = os.path.join(tool_dir_src, "flash_loader_nor.bin")
+if PRELOAD_NN:
+    # 生成 fwfs_nn_model.bin / nn_model.bin
+    if os.path.isdir(project_models_dir):
+        nn_model_files = sorted(glob.glob(os.path.join(project_models_dir, "*.nb")))
+        print(f">>> Found {len(nn_model_files)} NN *.nb files")
     else:
-        upload_tool = os.path.join(tool_dir_src, "uartfwburn.linux")
-        flashloader_src = os.path.join(tool_dir_src, "flash_loader_nor.bin")
-
-    # 在 build_dir 下跑，讓程式能找到 flash_loader_nor.bin
-    tool_dir = build_dir
-    os.makedirs(tool_dir, exist_ok=True)
-    flashloader_dst = os.path.join(tool_dir, "flash_loader_nor.bin")
-    if not os.path.exists(flashloader_dst):
-        shutil.copy(flashloader_src, flashloader_dst)
-        print(f">>> Copied flashloader to {flashloader_dst}")
-
-    # 以旗標模式呼叫；先試軟體進入下載模式（-d p2m），失敗再用手動模式
-    attempts = [
-        [upload_tool, "-p", port, "-b", baud, "-f", image, "-U", "-v", "pro2", "-r", "-d", "p2m"],
-        [upload_tool, "-p", port, "-b", baud, "-f", image, "-U", "-v", "pro2", "-r"],
+        nn_model_files = []
+        print(">>> NOTE: NN model dir not found:", project_models_dir)
+    nn_model_copies = [
+        env.Command(os.path.join(build_dir, os.path.basename(p)), p, _copy_nn_action)
+        for p in nn_model_files
     ]
-    for cmd in attempts:
-        rc = _run(cmd, strict=False, cwd=tool_dir)
-        if rc == 0:
-            print(">>> Upload done!")
-            return
-
-    raise RuntimeError(
-        "Upload failed. Hints: 1) 確認 platformio.ini 設定 upload_port=COMx；"
-        "2) 若板子不支援軟體進入下載模式，請按住 UART/Download 鍵再 Reset；"
-        "3) 若仍連不上，試把 upload_speed 降到 921600 或 115200。"
+    # convert 只依賴模型的內容清單：模型內容沒變時（即使檔案被 touch / 重新下載）不會重產 multi-MB 的 bin
+    nn_manifest = env.Command(os.path.join(build_dir, "nn_models.json"), nn_model_copies, _nn_manifest_action)
+    fwfs_nn_model_bin = env.Command(
+        os.path.join(build_dir, "fwfs_nn_model.bin"),
+        [sdk_amebapro2_fwfs_nn_models_path, auto_model_cfg, nn_manifest],
+        _convert_action(sdk_amebapro2_fwfs_nn_models_path, "FWFS")
+    )
+    nn_model_bin = env.Command(
+        os.path.join(build_dir, "nn_model.bin"),
+        [sdk_amebapro2_nn_model_path, fwfs_nn_model_bin],
+        _convert_action(sdk_amebapro2_nn_model_path, "FIRMWARE")
+    )
+    Alias("nn_model", nn_model_bin)
+    flash_image = env.Command(
+        _flash_image_name(".nn.bin"),
+        flash_inputs + [nn_model_bin],
+        _combine_action(flash_parts + [("PT_NN_MDL", "nn_model.bin"), ("PT_ISP_IQ", "firmware_isp_iq.bin"),
+                                        ("PT_FCSDATA", "boot_fcs.bin")] + flash_tz_parts)
     )
+    ota_pairs = [("firmware.bin", "ota.bin"), ("nn_model.bin", "nn_model_ota.bin"), ("firmware_isp_iq.bin", "isp_iq_ota.bin")]
+else:
+    flash_image = env.Command(
+        _flash_image_name(".bin"),
+        flash_inputs,
+        _combine_action(flash_parts + [("PT_ISP_IQ", "firmware_isp_iq.bin"), ("PT_FCSDATA", "boot_fcs.bin")] + flash_tz_parts)
+    )
+    ota_pairs = [("firmware.bin", "ota.bin"), ("firmware_isp_iq.bin", "isp_iq_ota.bin"), ("boot.bin", "boot_ota.bin")]
 
+ota_bins = [
+    env.Command(os.path.join(build_dir, dst), os.path.join(build_dir, src), _ota_action)
+    for src, dst in ota_pairs
+]
+flash_target = [flash_image] + ota_bins
+if SPARSE_IMAGE:
+    flash_target += env.Command([str(flash_image[0]) + ".sparse", str(flash_image[0]) + ".sparse.json"],
+                                flash_image, _sparse_action)
+Alias("flash_nn" if PRELOAD_NN else "flash", flash_target)
+
+# hash / sign / sign_enc：`pio run -t sign` 產出這個 environment 所有 variant（含 / 不含 NN）的簽章 image；
+# 多個 environment（TZ / NTZ、MP）一起跑時共用簽章快取，沒變的 image 不會重簽。
+# 沒有 Default()，宣告出來的檔案 target 一般 build 也會做，所以只在指令列要求時才宣告
+secure_modes = [m for m in SECURE_STEPS if m in COMMAND_LINE_TARGETS or "secure_all" in COMMAND_LINE_TARGETS]
+secure_inputs = [keygen, certificate_bin, partition_bin, bootloader_all_bin, application_all_bin,
+                 certable_bin, sensor_iq_target, bootfcs_bin] + ([nn_model_bin] if PRELOAD_NN else [])
+secure_targets = {}
+for _mode in secure_modes:
+    secure_targets[_mode] = env.Command(_secure_targets(_mode), secure_inputs, _secure_action(_mode))
+    env.Depends(secure_targets[_mode], [p for _, _, _, extra in SECURE_STEPS[_mode] for p in extra if os.path.exists(p)])
+    Alias(_mode, secure_targets[_mode])
+if secure_targets:
+    Alias("secure_all", list(secure_targets.values()))
 # 🚩 Upload target (只負責上傳，不會在 build 時觸發)
 upload_target = env.Alias("upload", [flash_target], upload_amebapro2)
-AlwaysBuild(upload_target)
\ No newline at end of file
+AlwaysBuild(upload_target)
+AlwaysBuild(env.Alias("upload_full", [flash_target], upload_amebapro2))
+# 產線批次燒錄（upload_ports / upload_jobs / upload_retries）
+AlwaysBuild(env.Alias("upload_batch", [flash_target], upload_batch_amebapro2))
+# 只燒 NN model 分區；flash image 只會就地改寫有變的分區
+AlwaysBuild(env.Alias("flash_model", [flash_image], upload_model_amebapro2))
\ No newline at end of file
@@ -0,0 +1,175 @@
+# SDK 物件檔的共用快取（類似 ccache）
+# key = 預處理後的原始碼 + 編譯器 + 旗標；不含專案路徑，所以不同專案 / clean 後的 $BUILD_DIR 都能共用
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+
+def _strip_line_markers(text):
+    # 沒有 -g 時行號標記（# 12 "path"）不會進到 .o，拿掉才不會把專案路徑算進 key
+    return b"\n".join(l for l in text.split(b"\n") if not (l.startswith(b"# ") and l[2:3].isdigit()))
+
+class ObjCache:
+    def __init__(self, root, sdk_dir):
+        self.root = root
+        self.sdk_dir = sdk_dir
+        self._lock = threading.Lock()
+        self._tool_digests = {}
+        self.hits = 0
+        self.misses = 0
+        self.archive_hits = 0
+        self.archive_stores = 0
+
+    def _tool_digest(self, path):
+        with self._lock:
+            if path in self._tool_digests:
+                return self._tool_digests[path]
+        h = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        except OSError:
+            h.update(path.encode())
+        digest = h.hexdigest()
+        with self._lock:
+            self._tool_digests[path] = digest
+        return digest
+
+    def _normalized_flags(self, args, target, source):
+        # -I / -include 與 in/out 路徑的影響已經反映在預處理結果裡；其餘旗標把 SDK 路徑換成固定字串
+        out, skip = [], False
+        for a in args[1:]:
+            if skip:
+                skip = False
+                continue
+            if a in ("-o", "-include"):
+                skip = True
+                continue
+            if a in (target, source) or a.startswith("-I"):
+                continue
+            out.append(a.replace(self.sdk_dir, "<SDK>"))
+        return out
+
+    def key(self, args, target, source, env=None):
+        # args: 完整的編譯命令（含 -c -o target source）
+        pre = []
+        skip = False
+        for a in args:
+            if skip:
+                skip = False
+                continue
+            if a == "-o":
+                skip = True
+                continue
+            pre.append("-E" if a == "-c" else a)
+        r = subprocess.run(pre, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env)
+        if r.returncode != 0:
+            return None
+        text = r.stdout
+        if not any(a.startswith("-g") for a in args):
+            text = _strip_line_markers(text)
+
+        h = hashlib.sha256()
+        h.update(self._tool_digest(args[0]).encode() + b"\0")
+        h.update("\0".join(self._normalized_flags(args, target, source)).encode() + b"\0")
+        h.update(text)
+        return h.hexdigest()
+
+    def _blob(self, key):
+        return os.path.join(self.root, key[:2], key + ".o")
+
+    def compile(self, args, target, source, env=None):
+        # 命中就複製快取的 .o；否則照常編譯後存入快取。回傳 compiler 的 return code
+        key = self.key(args, target, source, env)
+        if key:
+            blob = self._blob(key)
+            if os.path.exists(blob):
+                shutil.copyfile(blob, target)
+                _touch(blob)
+                with self._lock:
+                    self.hits += 1
+                return 0
+
+        r = subprocess.run(args, env=env)
+        if r.returncode != 0 or not key:
+            return r.returncode
+        with self._lock:
+            self.misses += 1
+        try:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = blob + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(target, tmp)
+            os.replace(tmp, blob)
+        except OSError as e:
+            # 共用目錄沒有寫入權限之類的狀況不影響這次 build
+            print(">>> WARN: obj cache store failed:", e)
+        return 0
+
+    # ---- 元件 archive（libsdk_*.a）----
+    def archive(self, name, key):
+        # 已經有同 key 的 archive 就回傳路徑，否則 None
+        p = os.path.join(self.root, "archives", f"libsdk_{name}-{key[:16]}.a")
+        if not os.path.exists(p):
+            return None
+        _touch(p)
+        with self._lock:
+            self.archive_hits += 1
+        return p
+
+    def store_archive(self, src, name, key):
+        dst = os.path.join(self.root, "archives", f"libsdk_{name}-{key[:16]}.a")
+        try:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            tmp = dst + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        except OSError as e:
+            print(">>> WARN: archive cache store failed:", e)
+            return
+        with self._lock:
+            self.archive_stores += 1
+
+    # ---- 統計與清理 ----
+    def report(self):
+        # 這次 build 的命中情況；沒用到快取回傳 None
+        if not (self.hits or self.misses or self.archive_hits or self.archive_stores):
+            return None
+        total = self.hits + self.misses
+        rate = f" ({self.hits * 100.0 / total:.0f}%)" if total else ""
+        return (f"obj cache: {self.hits} hit(s), {self.misses} miss(es){rate}; "
+                f"archives: {self.archive_hits} reused, {self.archive_stores} stored")
+
+    def prune(self, max_bytes):
+        # 超過 max_bytes 時從最久沒用到的物件 / archive 刪起（命中時會更新 mtime）；回傳 (刪掉幾個, 釋放 bytes)
+        entries, total = [], 0
+        for root, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith((".o", ".a")):
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+        removed = freed = 0
+        for _, size, p in sorted(entries):
+            if total - freed <= max_bytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+        return removed, freed
+
+def _touch(path):
+    # 更新 mtime 給 prune 判斷最近用過；唯讀的共用目錄就算了
+    try:
+        os.utime(path)
+    except OSError:
+        pass
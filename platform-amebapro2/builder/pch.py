@@ -0,0 +1,119 @@
+# SDK 共用 header 的 precompiled header（GCC .gch）
+# 每個 (environment, 旗標組合) 產生一份 amebapro2_pch.h + .gch；只有「開頭的 include 正好是這串 header」的
+# 檔案才加 -include，開頭先 #define / #if 或順序不同的檔案照常編譯，避免改變它們看到的巨集狀態
+import hashlib
+import os
+import re
+
+HEADER = "amebapro2_pch.h"
+
+# 依 include 順序；找不到的略過
+CANDIDATES = [
+    "platform_opts.h",
+    "FreeRTOS.h",
+    "task.h",
+    "cmsis.h",
+    "hal.h",
+    "basic_types.h",
+    "diag.h",
+]
+
+# bootloader 沒有 RTOS，也不帶 application 的 HAL；只用這幾個
+BOOTLOADER_CANDIDATES = [
+    "cmsis.h",
+    "basic_types.h",
+    "diag.h",
+]
+
+_INCLUDE = re.compile(r'\s*#\s*include\s*([<"])([^>"]+)[>"]')
+_DIRECTIVE = re.compile(r"\s*#")
+
+def resolve(name, dirs):
+    for d in dirs:
+        p = os.path.join(d, name)
+        if os.path.isfile(p):
+            return p
+    return None
+
+def leading_includes(path):
+    # 檔案開頭（註解 / 空行之前不算）連續的 #include，(寫法, 是否 "" include)；遇到其他指令或程式碼就停
+    out = []
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read(64 * 1024)
+    except OSError:
+        return out
+    text = re.sub(r"/\*.*?\*/", lambda m: "\n" * m.group(0).count("\n"), text, flags=re.S)
+    for line in text.splitlines():
+        line = line.split("//", 1)[0]
+        if not line.strip():
+            continue
+        m = _INCLUDE.match(line)
+        if m:
+            out.append((m.group(2), m.group(1) == '"'))
+            continue
+        break
+    return out
+
+def _matches(path, incs, seq):
+    # incs 的前 len(seq) 個正好依序是 seq，而且會解析到同一份 header：
+    # 寫法要是單純檔名（有目錄的可能是別份），"" include 不能被原始檔同目錄的同名檔案搶先
+    if len(incs) < len(seq):
+        return False
+    here = os.path.dirname(path)
+    for (name, quoted), want in zip(incs, seq):
+        if name != want:
+            return False
+        if quoted and os.path.isfile(os.path.join(here, name)):
+            return False
+    return True
+
+def choose(srcs, headers):
+    # 從 srcs 開頭的 include 區塊挑 PCH 的 header 順序：由 headers 組成、最多檔案能共用的前綴
+    # （分數 = 檔案數 × header 數）；回傳 headers 裡的路徑，沒有可用的就是 []
+    by_name = {os.path.basename(h): h for h in headers}
+    counts = {}
+    for s in srcs:
+        if not s.endswith(".c"):
+            continue
+        incs = leading_includes(s)
+        seq = []
+        for name, _ in incs:
+            if name not in by_name or name in seq:
+                break
+            seq.append(name)
+        while seq and not _matches(s, incs, seq):
+            seq.pop()
+        for n in range(1, len(seq) + 1):
+            counts[tuple(seq[:n])] = counts.get(tuple(seq[:n]), 0) + 1
+    if not counts:
+        return []
+    best = max(counts, key=lambda k: (counts[k] * len(k), counts[k]))
+    return [by_name[n] for n in best]
+
+def eligible(path, headers):
+    # 開頭的 include 區塊正好以 PCH 的 header 順序開始，且在那之前沒有 #define / #if 之類的指令
+    return _matches(path, leading_includes(path), [os.path.basename(h) for h in headers])
+
+def header_text(prefix, headers):
+    lines = ["/* generated by the AmebaPro2 builder; do not edit */"]
+    lines += [f'#include "{p}"' for p in prefix + headers]
+    return "\n".join(lines) + "\n"
+
+def write_header(out_dir, prefix, headers):
+    # 內容沒變就不重寫，避免 .gch 因為時間戳無謂重建
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, HEADER)
+    text = header_text(prefix, headers)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == text:
+                return path
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+def flags_key(flags):
+    return hashlib.sha256(flags.encode()).hexdigest()[:12]
@@ -0,0 +1,63 @@
+# 產物發佈（build_dir -> output/、firmware.bin -> application.bin、VOE / NN 檔案複製...）
+# 內容相同就不寫；同一個檔案系統用 hardlink / reflink，最後才退回真的複製
+import filecmp
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+    _FICLONE = 0x40049409  # Linux ioctl：btrfs / xfs / bcachefs 的 copy-on-write clone
+except ImportError:
+    fcntl = None
+
+def same_content(src, dst):
+    try:
+        if os.path.samefile(src, dst):
+            return True
+        if os.path.getsize(src) != os.path.getsize(dst):
+            return False
+    except OSError:
+        return False
+    return filecmp.cmp(src, dst, shallow=False)
+
+def _reflink(src, dst):
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+def publish(src, dst, mutable=False):
+    # mutable=True：目的檔之後會被就地改寫（例如 checksum 直接改 ota.bin），不能跟來源共用 inode，
+    # 只用 reflink 或複製。回傳 "same" / "link" / "reflink" / "copy"
+    if same_content(src, dst):
+        return "same"
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    tmp = dst + f".{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        how = None
+        if not mutable:
+            try:
+                os.link(src, tmp)
+                how = "link"
+            except OSError:
+                pass
+        if how is None and _reflink(src, tmp):
+            how = "reflink"
+        if how is None:
+            shutil.copy2(src, tmp)
+            how = "copy"
+        os.replace(tmp, dst)
+        return how
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -0,0 +1,86 @@
+# 外部工具執行器：逐行即時輸出（加前綴）、每個指令有 timeout、逾時砍掉整個 process tree；
+# submit() / wait() 讓同一個 action 一次丟多個工作並一起等。併發上限跟 -j 一致，但只管經過 run() 的工具
+# （elf2bin / checksum / uartfwburn ...）；SCons 自己的編譯 job 另外算，最多同時約 2×j 個 process
+import contextlib
+import os
+import signal
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+TIMEOUT_EXIT = -9
+
+_slots = threading.BoundedSemaphore(os.cpu_count() or 1)
+_pool = None
+_pool_lock = threading.Lock()
+_jobs = os.cpu_count() or 1
+
+def configure(jobs):
+    # SCons 的 -j；只在還沒有指令執行前呼叫
+    global _slots, _jobs
+    _jobs = max(1, int(jobs))
+    _slots = threading.BoundedSemaphore(_jobs)
+
+def _kill_tree(proc):
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def run(cmd, cwd=None, timeout=None, prefix="", log=print, limit=True):
+    # 回傳 (exit code, 輸出 bytes)；逾時回傳 TIMEOUT_EXIT。cmd 是字串時交給 shell
+    # limit=False 不佔 -j 名額（例如批次燒錄，瓶頸在 serial port 不在 CPU）
+    shell = isinstance(cmd, str)
+    kw = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == "nt" else {"start_new_session": True}
+    with _slots if limit else contextlib.nullcontext():
+        proc = subprocess.Popen(cmd, shell=shell, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL, text=True, errors="replace", bufsize=1, **kw)
+        timed_out = threading.Event()
+
+        def _expire():
+            timed_out.set()
+            _kill_tree(proc)
+        timer = threading.Timer(timeout, _expire) if timeout else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+        nbytes = 0
+        try:
+            for line in proc.stdout:
+                nbytes += len(line)
+                log(prefix + line.rstrip("\n"))
+            rc = proc.wait()
+        finally:
+            if timer:
+                timer.cancel()
+            if proc.poll() is None:
+                _kill_tree(proc)
+                proc.wait()
+    if timed_out.is_set():
+        log(f"{prefix}!!! timed out after {timeout}s; killed")
+        return TIMEOUT_EXIT, nbytes
+    return rc, nbytes
+
+def submit(fn, *args, **kwargs):
+    # 丟到共用的背景 pool；實際跑外部指令時仍受 _slots（-j）限制
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(4, _jobs * 2), thread_name_prefix="amebapro2-run")
+    return _pool.submit(fn, *args, **kwargs)
+
+def wait(futures):
+    # 全部等完才回傳；有例外時等其他的也結束再丟第一個例外
+    results, error = [], None
+    for f in futures:
+        try:
+            results.append(f.result())
+        except Exception as e:
+            results.append(None)
+            error = error or e
+    if error is not None:
+        raise error
+    return results
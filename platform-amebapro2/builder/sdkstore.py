@@ -0,0 +1,242 @@
+# AmebaPro2 SDK 佈建：跨專案共用的 SDK store（以 commit / 版本 / 壓縮檔雜湊為 key）
+# 專案內的 .pio/framework-ameba-rtos-pro2 只是 store 的 hardlink checkout（跨磁碟時退回複製）
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import time
+import zipfile
+
+SDK_REPO = "https://github.com/Ameba-AIoT/ameba-rtos-pro2.git"
+MARKER = ".amebapro2_sdk.json"
+
+def read_marker(d):
+    try:
+        with open(os.path.join(d, MARKER), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_marker(d, info):
+    with open(os.path.join(d, MARKER), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=1, sort_keys=True)
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _safe_key(s):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", s)
+
+class _Lock:
+    # 用 mkdir 當跨 process 的鎖（多個 CI job 同時佈建同一個 store）；太久沒放就當作殘留
+    def __init__(self, path, stale=1800):
+        self.path = path
+        self.stale = stale
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        while True:
+            try:
+                os.mkdir(self.path)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(self.path).st_mtime > self.stale:
+                        os.rmdir(self.path)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.5)
+
+    def __exit__(self, *exc):
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+class SDKStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def has(self, key):
+        return read_marker(self.path(key)) is not None
+
+    def _archive_key(self, archive, sha256=None):
+        # 沒給 sha256 時記住 (size, mtime) -> 雜湊，大壓縮檔不用每次重算
+        memo_path = os.path.join(self.root, "archives.json")
+        try:
+            with open(memo_path, "r", encoding="utf-8") as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+        st = os.stat(archive)
+        entry = memo.get(os.path.abspath(archive))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            digest = entry[2]
+        else:
+            digest = _sha256(archive)
+            memo[os.path.abspath(archive)] = [st.st_size, st.st_mtime_ns, digest]
+            os.makedirs(self.root, exist_ok=True)
+            with open(memo_path, "w", encoding="utf-8") as f:
+                json.dump(memo, f, indent=1, sort_keys=True)
+        if sha256 and digest.lower() != sha256.lower():
+            raise RuntimeError(f"SDK archive {archive} sha256 mismatch: {digest} != {sha256}")
+        return "sha256-" + digest[:16], digest
+
+    def _commit(self, tmp, key, info):
+        # 在 tmp 準備好整棵樹後才換名進 store，半成品不會被其他 job 看到
+        _write_marker(tmp, dict(info, key=key))
+        dst = self.path(key)
+        if self.has(key):
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            shutil.rmtree(dst, ignore_errors=True)
+            os.replace(tmp, dst)
+        return read_marker(dst)
+
+    def install_archive(self, archive, sha256=None):
+        key, digest = self._archive_key(archive, sha256)
+        with _Lock(self.path(key) + ".lock"):
+            if self.has(key):
+                return read_marker(self.path(key))
+            print(f">>> Installing Ameba Pro2 SDK from {archive} ...")
+            tmp = self.path(key) + f".{os.getpid()}.tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            if zipfile.is_zipfile(archive):
+                with zipfile.ZipFile(archive) as z:
+                    z.extractall(tmp)
+            else:
+                with tarfile.open(archive, "r:*") as t:
+                    if hasattr(tarfile, "data_filter"):
+                        t.extractall(tmp, filter="data")
+                    else:
+                        t.extractall(tmp)
+            # GitHub 的壓縮檔多包一層 <repo>-<rev>/，拿掉
+            entries = os.listdir(tmp)
+            if len(entries) == 1 and os.path.isdir(os.path.join(tmp, entries[0])):
+                inner = os.path.join(tmp, entries[0])
+                for name in os.listdir(inner):
+                    os.replace(os.path.join(inner, name), os.path.join(tmp, name))
+                os.rmdir(inner)
+            return self._commit(tmp, key, {"source": os.path.abspath(archive), "sha256": digest})
+
+    def install_git(self, source, revision=None, offline=False):
+        local = os.path.isdir(source)
+        if offline and not local:
+            raise RuntimeError(f"SDK revision {revision or 'HEAD'} not in {self.root} and offline mode forbids fetching {source}")
+        key = "git-" + _safe_key(revision) if revision else None
+        with _Lock(os.path.join(self.root, (key or "git-head") + ".lock")):
+            if key and self.has(key):
+                return read_marker(self.path(key))
+            print(f">>> Fetching Ameba Pro2 SDK {revision or 'HEAD'} from {source} ...")
+            tmp = os.path.join(self.root, f"{key or 'git-head'}.{os.getpid()}.tmp")
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(self.root, exist_ok=True)
+            if local:
+                # 本地 mirror：clone 走 hardlink，不需要網路
+                subprocess.check_call(["git", "clone", "-q", "--no-checkout", source, tmp])
+                subprocess.check_call(["git", "-C", tmp, "checkout", "-q", revision or "HEAD"])
+            else:
+                subprocess.check_call(["git", "init", "-q", tmp])
+                subprocess.check_call(["git", "-C", tmp, "fetch", "-q", "--depth=1", source, revision or "HEAD"])
+                subprocess.check_call(["git", "-C", tmp, "checkout", "-q", "FETCH_HEAD"])
+            commit = subprocess.run(["git", "-C", tmp, "rev-parse", "HEAD"],
+                                    capture_output=True, text=True).stdout.strip()
+            shutil.rmtree(os.path.join(tmp, ".git"), ignore_errors=True)
+            return self._commit(tmp, key or "git-" + commit,
+                                {"source": source, "revision": revision or "", "commit": commit})
+
+    def checkout(self, key, dst):
+        # dst 是 store 的 hardlink 樹；hardlink 不行（跨磁碟 / 權限）時退回複製
+        src = self.path(key)
+        tmp = dst + f".{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        link = True
+        for root, dirs, files in os.walk(src):
+            out = os.path.join(tmp, os.path.relpath(root, src))
+            os.makedirs(out, exist_ok=True)
+            for name in files:
+                s, d = os.path.join(root, name), os.path.join(out, name)
+                if link:
+                    try:
+                        os.link(s, d)
+                        continue
+                    except OSError:
+                        link = False
+                shutil.copy2(s, d)
+        if os.path.isdir(dst):
+            if read_marker(dst) is not None:
+                shutil.rmtree(dst)
+            else:
+                # 舊版 `git clone` 出來的 SDK 可能有本地修改，搬開不要刪
+                legacy = dst + ".legacy"
+                shutil.rmtree(legacy, ignore_errors=True)
+                os.replace(dst, legacy)
+                print(f">>> Moved previous SDK checkout to {legacy}")
+        os.replace(tmp, dst)
+        return read_marker(dst)
+
+def wanted_key(revision=None, archive_sha256=None):
+    # 不跑任何 subprocess 就能算出來的 key；None 表示「有佈建過的就好」
+    if archive_sha256:
+        return "sha256-" + archive_sha256.lower()[:16]
+    if revision:
+        return "git-" + _safe_key(revision)
+    return None
+
+def read_pin(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _record_pin(pin_file, info):
+    if pin_file and info.get("commit"):
+        with open(pin_file, "w", encoding="utf-8") as f:
+            f.write(info["commit"] + "\n")
+        print(f">>> Pinned Ameba Pro2 SDK to {info['commit']} in {pin_file} (commit it, or set sdk_revision)")
+
+def provision(sdk_dir, store_root, revision=None, archive=None, archive_sha256=None,
+              mirror=None, offline=False, pin_file=None):
+    # 快速路徑：專案 checkout 的 marker 符合就直接用（沒有 subprocess、不走訪整棵樹）
+    # 沒指定 sdk_revision 時用 pin_file 記下的 commit；第一次抓 HEAD 後把 commit 寫進 pin_file，之後都固定同一版
+    store = SDKStore(store_root)
+    if not revision and not archive and pin_file:
+        revision = read_pin(pin_file)
+    if archive and not archive_sha256:
+        want, _ = store._archive_key(archive)
+    else:
+        want = wanted_key(revision, archive_sha256)
+    marker = read_marker(sdk_dir)
+    if marker is not None and (want is None or marker.get("key") == want):
+        if want is None:
+            _record_pin(pin_file, marker)
+        return marker
+    if marker is None and want is None and os.path.isdir(sdk_dir):
+        # 沒有指定版本，沿用舊版 git clone 的 SDK
+        return {"key": "", "source": sdk_dir}
+
+    if archive:
+        info = store.install_archive(archive, archive_sha256)
+    elif want and store.has(want):
+        info = read_marker(store.path(want))
+    else:
+        info = store.install_git(mirror or SDK_REPO, revision, offline)
+        if not revision:
+            _record_pin(pin_file, info)
+    if marker is not None and marker.get("key") == info["key"]:
+        return marker
+    print(f">>> Checking out Ameba Pro2 SDK {info['key']} -> {sdk_dir}")
+    return store.checkout(info["key"], sdk_dir)
@@ -0,0 +1,67 @@
+# elf2bin secure（hash / sign / sign_enc）的簽章快取：key = (輸入 image 內容, key 指紋, secure 模式, elf2bin, 其他輸入)，
+# 所有 environment 共用；沒變的 image（例如 bootloader、certificate）不會重簽，同一份輸入的簽章結果也固定
+import hashlib
+import os
+import threading
+
+from publish import publish
+from stampdb import file_digest
+
+class SigCache:
+    def __init__(self, root, keep=256):
+        self.root = root
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def key(self, op, image, keys, tool, extra=()):
+        h = hashlib.sha256()
+        h.update(f"op:{op}\nimage:{file_digest(image)}\ntool:{file_digest(tool)}\n".encode())
+        for k in keys:
+            h.update(f"key:{os.path.basename(k)}:{file_digest(k)}\n".encode())
+        for x in extra:
+            h.update(f"extra:{os.path.basename(x)}:{file_digest(x)}\n".encode())
+        return h.hexdigest()
+
+    def _blob(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, key, dst):
+        # 命中就還原到 dst 並回傳 True；更新 blob 時間給 prune 判斷最近用過
+        blob = self._blob(key)
+        if not os.path.exists(blob):
+            return False
+        publish(blob, dst, mutable=True)
+        try:
+            os.utime(blob)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, src):
+        try:
+            publish(src, self._blob(key), mutable=True)
+        except OSError as e:
+            # 共用目錄沒有寫入權限之類的狀況不影響這次簽章
+            print(">>> WARN: signature cache store failed:", e)
+            return
+        self._prune()
+
+    def _prune(self):
+        # 只留最近用過的 keep 份
+        with self._lock:
+            blobs = []
+            for d in os.listdir(self.root):
+                sub = os.path.join(self.root, d)
+                if os.path.isdir(sub):
+                    for name in os.listdir(sub):
+                        if not name.endswith(".tmp"):
+                            p = os.path.join(sub, name)
+                            try:
+                                blobs.append((os.path.getmtime(p), p))
+                            except OSError:
+                                pass
+            for _, p in sorted(blobs, reverse=True)[self.keep:]:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
@@ -0,0 +1,60 @@
+# 各 image 的 section 大小對照板子的 maximum_size / maximum_ram_size，並記住每個最佳化 profile 最近一次的結果，
+# 換 profile 時可以直接看到 flash / RAM 差多少
+import json
+import os
+
+import elfreader
+
+def measure(elfs):
+    # {name: {"text", "data", "bss"}}；flash 佔用 = text + data，RAM 只算 application（bootloader 開機後就不在了）
+    return {name: elfreader.load(path).size_summary() for name, path in elfs.items()}
+
+def build(profile, overrides, images, max_flash, max_ram, ram_image="application"):
+    flash = sum(s["text"] + s["data"] for s in images.values())
+    ram = images[ram_image]["data"] + images[ram_image]["bss"] if ram_image in images else 0
+    return {"profile": profile, "overrides": overrides, "images": images,
+            "flash": flash, "ram": ram, "maximum_size": max_flash, "maximum_ram_size": max_ram}
+
+def _pct(used, limit):
+    return f"{used * 100.0 / limit:.1f}%" if limit else "n/a"
+
+def lines(report, history):
+    out = [f"profile {report['profile']}: "
+           f"flash {report['flash']} / {report['maximum_size']} bytes ({_pct(report['flash'], report['maximum_size'])}), "
+           f"RAM {report['ram']} / {report['maximum_ram_size']} bytes ({_pct(report['ram'], report['maximum_ram_size'])})"]
+    for name, other in sorted(history.items()):
+        if name == report["profile"]:
+            continue
+        out.append(f"  vs {name}: flash {report['flash'] - other['flash']:+d}, RAM {report['ram'] - other['ram']:+d} bytes")
+    return out
+
+def over(report):
+    # 超過上限的項目名稱
+    out = []
+    if report["maximum_size"] and report["flash"] > report["maximum_size"]:
+        out.append("flash")
+    if report["maximum_ram_size"] and report["ram"] > report["maximum_ram_size"]:
+        out.append("RAM")
+    return out
+
+def load_history(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write(report, report_path, history_path):
+    # 回傳更新前的歷史（給 lines() 比較用）；兩個檔案都是 tmp + replace
+    history = load_history(history_path)
+    _dump(report, report_path)
+    _dump(dict(history, **{report["profile"]: {"flash": report["flash"], "ram": report["ram"],
+                                               "overrides": report["overrides"]}}), history_path)
+    return history
+
+def _dump(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + f".{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
@@ -0,0 +1,95 @@
+# 稀疏 flash image：只存非 0xFF（未抹除）的 4 KiB sector，格式為 (offset, length, data) chunk 串列
+#   檔頭  : magic "AP2SPRS\0", version(u32), 原始大小(u32), chunk 數(u32)
+#   chunk : offset(u32), length(u32), data[length]
+# 另外輸出 <sparse>.json manifest（每個 chunk 的 offset / length / sha256 與原 image 的 sha256），
+# 給 uploader 與 artifact 保存使用；`python sparseimage.py expand in.sparse out.bin` 可還原成原本的 image
+import hashlib
+import json
+import os
+import struct
+import sys
+
+MAGIC = b"AP2SPRS\0"
+VERSION = 1
+SECTOR = 4096
+ERASED = 0xFF
+
+def chunks(data, sector=SECTOR):
+    # 連續的非抹除 sector 合併成一個 chunk
+    out, start = [], None
+    for off in range(0, len(data), sector):
+        block = data[off:off + sector]
+        erased = block.count(ERASED) == len(block)
+        if not erased and start is None:
+            start = off
+        elif erased and start is not None:
+            out.append((start, off - start))
+            start = None
+    if start is not None:
+        out.append((start, len(data) - start))
+    return out
+
+def write(image, sparse_path, manifest_path):
+    with open(image, "rb") as f:
+        data = f.read()
+    parts = chunks(data)
+    tmp = sparse_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<III", VERSION, len(data), len(parts)))
+        for off, length in parts:
+            f.write(struct.pack("<II", off, length))
+            f.write(data[off:off + length])
+    os.replace(tmp, sparse_path)
+
+    manifest = {
+        "image": os.path.basename(image),
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "sector": SECTOR,
+        "chunks": [{"offset": off, "length": length,
+                    "sha256": hashlib.sha256(data[off:off + length]).hexdigest()} for off, length in parts],
+    }
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, manifest_path)
+    return manifest
+
+def current(image, manifest_path):
+    # manifest 還對得上現在的 flat image 就回傳，否則 None（image 被 hash / sign 重新 combine 過等情況）
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            m = json.load(f)
+        with open(image, "rb") as f:
+            data = f.read()
+    except (OSError, ValueError):
+        return None
+    return m if m.get("size") == len(data) and m.get("sha256") == hashlib.sha256(data).hexdigest() else None
+
+def read(sparse_path):
+    # 回傳 (原始大小, [(offset, data)])
+    with open(sparse_path, "rb") as f:
+        head = f.read(len(MAGIC) + 12)
+        if head[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{sparse_path}: not a sparse flash image")
+        version, size, count = struct.unpack_from("<III", head, len(MAGIC))
+        if version != VERSION:
+            raise ValueError(f"{sparse_path}: unsupported sparse version {version}")
+        out = []
+        for _ in range(count):
+            off, length = struct.unpack("<II", f.read(8))
+            out.append((off, f.read(length)))
+    return size, out
+
+def expand(sparse_path, image):
+    size, parts = read(sparse_path)
+    buf = bytearray([ERASED]) * size
+    for off, data in parts:
+        buf[off:off + len(data)] = data
+    with open(image, "wb") as f:
+        f.write(buf)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "expand":
+        sys.exit("usage: sparseimage.py expand <in.sparse> <out.bin>")
+    expand(sys.argv[2], sys.argv[3])
@@ -0,0 +1,164 @@
+# 後處理（elf2bin / objdump / nm / copy）的內容雜湊 stamp 資料庫
+# 每個步驟以「輸入內容的雜湊」為 key；key 沒變就略過並從 blob 快取還原輸出
+import hashlib
+import json
+import os
+import struct
+import threading
+
+from publish import publish
+import buildtrace
+
+# 不影響 elf2bin / nm / objdump 產物的 section
+_ELF_SKIP_PREFIXES = (".debug", ".comment", ".ARM.attributes")
+_SHT_NOBITS = 8
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def elf_digest(path):
+    # 只雜湊 ELF 的 section 內容（含 symtab），忽略 debug 資訊與檔頭以外的雜訊；
+    # 非 ELF32 little-endian 的檔案退回整檔雜湊
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < 52 or data[:4] != b"\x7fELF" or data[4] != 1 or data[5] != 1:
+        return hashlib.sha256(data).hexdigest()
+    (_, _, _, _, e_entry, _, e_shoff, _, _, _, _,
+     e_shentsize, e_shnum, e_shstrndx) = struct.unpack_from("<16sHHIIIIIHHHHHH", data, 0)
+    if e_shoff == 0 or e_shnum == 0 or e_shoff + e_shnum * e_shentsize > len(data):
+        return hashlib.sha256(data).hexdigest()
+
+    shdrs = [struct.unpack_from("<10I", data, e_shoff + i * e_shentsize) for i in range(e_shnum)]
+    strtab = shdrs[e_shstrndx] if e_shstrndx < e_shnum else None
+
+    def _name(off):
+        if strtab is None:
+            return ""
+        base = strtab[4] + off
+        end = data.find(b"\0", base)
+        return data[base:end].decode("ascii", "replace")
+
+    h = hashlib.sha256()
+    h.update(struct.pack("<I", e_entry))
+    for sh_name, sh_type, sh_flags, sh_addr, sh_offset, sh_size, _, _, _, _ in shdrs:
+        name = _name(sh_name)
+        if name.startswith(_ELF_SKIP_PREFIXES):
+            continue
+        h.update(name.encode() + b"\0")
+        h.update(struct.pack("<IIII", sh_type, sh_flags, sh_addr, sh_size))
+        if sh_type != _SHT_NOBITS:
+            h.update(data[sh_offset:sh_offset + sh_size])
+    return h.hexdigest()
+
+class StampDB:
+    def __init__(self, root):
+        self.root = root
+        self.db_path = os.path.join(root, "stamps.json")
+        self.blob_dir = os.path.join(root, "blobs")
+        self._lock = threading.Lock()
+        try:
+            with open(self.db_path, "r", encoding="utf-8") as f:
+                self._db = json.load(f)
+        except (OSError, ValueError):
+            self._db = {}
+        self._db.setdefault("steps", {})
+        # path -> [size, mtime_ns, kind, digest]；tool binary 與大檔案不用每次重算
+        self._db.setdefault("files", {})
+
+    # ---- 輸入雜湊 ----
+    def _cached_digest(self, path, kind):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return "missing"
+        with self._lock:
+            memo = self._db["files"].get(path)
+        if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns and memo[2] == kind:
+            return memo[3]
+        digest = elf_digest(path) if kind == "elf" else file_digest(path)
+        with self._lock:
+            self._db["files"][path] = [st.st_size, st.st_mtime_ns, kind, digest]
+        return digest
+
+    def digest(self, files=(), elfs=(), extra=()):
+        h = hashlib.sha256()
+        for p in files:
+            h.update(f"F:{os.path.basename(p)}:{self._cached_digest(p, 'file')}\n".encode())
+        for p in elfs:
+            h.update(f"E:{os.path.basename(p)}:{self._cached_digest(p, 'elf')}\n".encode())
+        for x in extra:
+            h.update(f"X:{x}\n".encode())
+        return h.hexdigest()
+
+    # ---- 步驟狀態 ----
+    def fresh(self, name, key, outputs):
+        with self._lock:
+            entry = self._db["steps"].get(name)
+        if not entry or entry.get("key") != key:
+            return False
+        recorded = entry.get("outputs", {})
+        if set(recorded) != set(outputs):
+            return False
+        for dst, sha in recorded.items():
+            if not os.path.exists(os.path.join(self.blob_dir, sha)):
+                return False
+        for dst, sha in recorded.items():
+            self._restore(sha, dst)
+        return True
+
+    def record(self, name, key, outputs):
+        recorded = {}
+        for dst in outputs:
+            if not os.path.exists(dst):
+                # 步驟沒產出預期檔案就不記錄，下次照常重跑
+                return
+            sha = self._cached_digest(dst, "file")
+            self._store(dst, sha)
+            recorded[dst] = sha
+        with self._lock:
+            old = self._db["steps"].get(name, {}).get("outputs", {})
+            self._db["steps"][name] = {"key": key, "outputs": recorded}
+            live = {s for e in self._db["steps"].values() for s in e.get("outputs", {}).values()}
+        for sha in set(old.values()) - live:
+            try:
+                os.remove(os.path.join(self.blob_dir, sha))
+            except OSError:
+                pass
+        self.save()
+
+    def step(self, name, key, outputs, fn):
+        # key 相同且快取齊全 -> 還原輸出並略過；否則執行 fn 後記錄
+        with buildtrace.span(name, "stamp") as ev:
+            ev["hit"] = self.fresh(name, key, outputs)
+            if ev["hit"]:
+                print(f">>> [stamp] {name} up to date, restored {len(outputs)} file(s)")
+            else:
+                fn()
+                self.record(name, key, outputs)
+            ev["bytes"] = buildtrace.file_bytes(outputs)
+        return not ev["hit"]
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.db_path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._db, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.db_path)
+
+    # ---- blob ----
+    # blob 不可以跟輸出檔共用 inode（輸出可能被工具就地改寫），所以一律 mutable=True：reflink 或複製
+    def _store(self, src, sha):
+        blob = os.path.join(self.blob_dir, sha)
+        if os.path.exists(blob):
+            return
+        publish(src, blob, mutable=True)
+
+    def _restore(self, sha, dst):
+        if os.path.exists(dst) and self._cached_digest(dst, "file") == sha:
+            return
+        publish(os.path.join(self.blob_dir, sha), dst, mutable=True)
@@ -0,0 +1,83 @@
+# unity (jumbo) build：把同一個 SDK 元件的 .c 分批 #include 進產生的 translation unit 一起編，
+# header 只 parse 一次。檔案層級的 static / 型別 / 巨集同名會互相打架，這些檔案退回單獨編譯；
+# 開頭先 #define 再 include 的檔案（用巨集調整 header 行為）也單獨編譯
+import fnmatch
+import os
+import re
+
+_COMMENT = re.compile(r"/\*.*?\*/|//[^\n]*", re.S)
+_STATIC = re.compile(r"^static\b[^;{}()=\[]*?\b(\w+)\s*[(\[=;,]", re.M)
+_STATIC_FNPTR = re.compile(r"^static\b[^;{}=]*?\(\s*\*\s*(\w+)\s*\)", re.M)
+_TAG = re.compile(r"^(?:typedef\s+)?(?:struct|union|enum)\s+(\w+)\s*\{", re.M)
+_TYPEDEF = re.compile(r"^typedef\b[^;{]*?(\w+)\s*;", re.M)
+_TYPEDEF_BODY = re.compile(r"^typedef\s+(?:struct|union|enum)\b[^{;]*\{.*?\}\s*(\w+)\s*;|^}\s*(\w+)\s*;", re.M | re.S)
+_DEFINE = re.compile(r"^[ \t]*#[ \t]*define[ \t]+(\w+)", re.M)
+_UNDEF = re.compile(r"^[ \t]*#[ \t]*undef[ \t]+(\w+)", re.M)
+_FIRST_DIRECTIVE = re.compile(r"^[ \t]*#[ \t]*(\w+)", re.M)
+
+# _STATIC 會把函式指標的型別名稱抓進來；這些不算
+_KEYWORDS = {
+    "void", "char", "short", "int", "long", "float", "double", "signed", "unsigned", "const", "volatile",
+    "inline", "__inline", "__inline__", "struct", "union", "enum", "register", "restrict",
+}
+
+_IDENT = re.compile(r"\b[A-Za-z_]\w*\b")
+_scanned = {}
+
+def scan(path):
+    # 回傳 {"names": {(種類, 名稱)}, "idents": 用到的識別字, "configures": 開頭是否先 #define 再 include}
+    if path in _scanned:
+        return _scanned[path]
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = _COMMENT.sub("", f.read())
+    except OSError:
+        return {"names": set(), "idents": set(), "configures": True}
+    names = {("static", n) for n in _STATIC.findall(text) + _STATIC_FNPTR.findall(text) if n not in _KEYWORDS}
+    names |= {("type", n) for n in _TAG.findall(text) + _TYPEDEF.findall(text)}
+    names |= {("type", a or b) for a, b in _TYPEDEF_BODY.findall(text)}
+    undone = set(_UNDEF.findall(text))
+    names |= {("macro", n) for n in _DEFINE.findall(text) if n not in undone}
+    first = _FIRST_DIRECTIVE.search(text)
+    _scanned[path] = {"names": names, "idents": set(_IDENT.findall(text)),
+                      "configures": bool(first) and first.group(1) not in ("include", "import")}
+    return _scanned[path]
+
+def conflicts(srcs):
+    # {(種類, 名稱): [檔案]}：同名定義出現在兩個以上檔案；巨集只要在別的檔案被用到也算（合併後會漏過去）
+    seen = {}
+    for s in srcs:
+        for n in scan(s)["names"]:
+            seen.setdefault(n, []).append(s)
+    for (kind, name), files in seen.items():
+        if kind == "macro":
+            files += [s for s in srcs if s not in files and name in scan(s)["idents"]]
+    return {n: files for n, files in seen.items() if len(files) > 1}
+
+def plan(srcs, batch, exclude=(), rel=lambda p: p):
+    # 回傳 (groups, singles, clashes)：groups 是要合併編譯的 .c 分組，singles 照常一個一個編
+    # exclude 是相對路徑的 glob（手動指定一定要單獨編的檔案）
+    srcs = sorted(srcs)
+    clashes = conflicts(srcs)
+    standalone = {f for files in clashes.values() for f in files}
+    standalone |= {s for s in srcs if scan(s)["configures"]}
+    standalone |= {s for s in srcs if any(fnmatch.fnmatch(rel(s), pat) for pat in exclude)}
+    pooled = [s for s in srcs if s not in standalone]
+    groups = [pooled[i:i + batch] for i in range(0, len(pooled), max(1, batch))]
+    singles = [s for s in srcs if s in standalone] + [g[0] for g in groups if len(g) == 1]
+    return [g for g in groups if len(g) > 1], singles, clashes
+
+def write(path, members):
+    # 內容沒變就不重寫，避免產生的 .c 時間戳讓整組重編
+    text = "/* generated by the AmebaPro2 builder (unity build); do not edit */\n"
+    text += "".join(f'#include "{m.replace(os.sep, "/")}"\n' for m in members)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == text:
+                return path
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
@@ -0,0 +1,103 @@
+# 每個 upload port 記住上次成功燒錄的分區雜湊，下次只燒有變的分區；也記住可用的最高 baud rate
+# 分區資訊取自 flashimage 的 <image>.manifest.json（offset / size / sha256）
+import json
+import os
+import re
+
+class DeviceState:
+    def __init__(self, root, port):
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]", "_", port) + ".json")
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, layout_key, parts):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"layout_key": layout_key, "parts": parts}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def forget(self):
+        # 燒錄失敗 / 中斷時裝置內容不明，下次一定要整包燒
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def changed_partitions(image_manifest, device):
+    # 回傳要重燒的分區名稱；None 表示無法比較（沒有紀錄、分區表不同），只能整包燒
+    if not image_manifest or not device or device.get("layout_key") != image_manifest.get("layout_key"):
+        return None
+    now, last = image_manifest.get("parts", {}), device.get("parts", {})
+    if set(now) != set(last):
+        return None
+    out = []
+    for name, p in sorted(now.items(), key=lambda e: e[1]["offset"]):
+        q = last[name]
+        if (p["offset"], p["size"], p["sha"]) != (q["offset"], q["size"], q["sha"]):
+            out.append(name)
+    return out
+
+def region(image_manifest, device, name):
+    # 要寫入的範圍：新內容；裝置上舊內容比較長時，多出來的部分也要寫（image 裡那段本來就是 0xFF）
+    p, q = image_manifest["parts"][name], device["parts"][name]
+    return p["offset"], max(p["size"], q["size"])
+
+# 由快到慢的 baud rate 階梯；每個 port 記住上次成功的最高速率，下次直接從那裡開始
+BAUD_LADDER = (3000000, 2000000, 1500000, 921600, 460800, 230400, 115200)
+
+class BaudCache:
+    def __init__(self, root, port, keep=20, probe_after=5):
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]", "_", port) + ".baud.json")
+        self.keep = keep
+        self.probe_after = probe_after
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def ladder(self, rates=BAUD_LADDER):
+        # 從已知可用的最高速率開始往下試；沒紀錄就從最快的開始
+        # 在 best 連續成功 probe_after 次後，先試高一階（一次的線材 / 接觸不良不會永遠把速率壓低）
+        data = self.load()
+        best = data.get("best")
+        rates = sorted(set(rates), reverse=True)
+        if not best:
+            return rates
+        out = [r for r in rates if r <= best] or rates[-1:]
+        higher = [r for r in rates if r > best]
+        if higher and data.get("streak", 0) >= self.probe_after:
+            out.insert(0, higher[-1])
+        return out
+
+    def record(self, rate, ok, nbytes, seconds, learn=True):
+        # 每次嘗試都記（速率、成功與否、bytes/s、耗時），只留最近 keep 筆；learn=False（固定速率）不更新 best
+        data = self.load()
+        data.setdefault("attempts", []).append({
+            "baud": rate, "ok": ok, "bytes": nbytes, "seconds": round(seconds, 3),
+            "bytes_per_sec": int(nbytes / seconds) if ok and seconds > 0 else 0,
+        })
+        data["attempts"] = data["attempts"][-self.keep:]
+        if learn:
+            best = data.get("best")
+            if ok and rate == best:
+                data["streak"] = data.get("streak", 0) + 1
+            elif ok:
+                # 第一次成功、往高一階試成功，或降速後成功
+                data["best"], data["streak"] = rate, 0
+            elif best and rate >= best:
+                # 試高一階失敗（或 best 本身失敗）：重新累積次數，不會每次都先浪費一輪
+                data["streak"] = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
@@ -0,0 +1,5 @@
+# builder/ 底下的模組是以 SCons script 的方式載入（不是 package），測試直接把目錄加進 sys.path
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "builder"))
@@ -0,0 +1,30 @@
+# 假的 uartfwburn：參數格式相同（-p port -b baud -f image ... -U -v pro2 -r [-d p2m]），
+# 把 image 原封不動寫到 port；FAKE_BURN_STATE 目錄裡有 <port>.fail 時刪掉它並失敗一次（測重試）
+import os
+import re
+import sys
+
+def main(argv):
+    args = dict(zip(argv[::2], argv[1::2]))
+    port, image = args["-p"], args["-f"]
+    marker = os.path.join(os.environ.get("FAKE_BURN_STATE", ""), re.sub(r"[^A-Za-z0-9._-]", "_", port) + ".fail")
+    if os.path.exists(marker):
+        os.remove(marker)
+        print("download fail: no response")
+        return 1
+    try:
+        fd = os.open(port, os.O_WRONLY | os.O_NOCTTY)
+    except OSError as e:
+        print(f"open port {port} fail: {e}")
+        return 1
+    with open(image, "rb") as f:
+        data = f.read()
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+    os.close(fd)
+    print(f"download image {len(data)} bytes ok")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,87 @@
+import os
+import re
+import select
+import sys
+import threading
+import tty
+
+import pytest
+
+import batchflash
+import runner
+
+FAKE_TOOL = os.path.join(os.path.dirname(__file__), "fixtures", "fake_uartfwburn.py")
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "openpty"), reason="needs ptys")
+
+class Board:
+    # 一個 pty：slave 當成板子的 serial port，master 收燒錄工具寫進來的 bytes
+    def __init__(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.received = bytearray()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        while not self._stop.is_set():
+            if select.select([self.master], [], [], 0.05)[0]:
+                self.received += os.read(self.master, 65536)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+@pytest.fixture
+def boards():
+    made = [Board() for _ in range(3)]
+    yield made
+    for b in made:
+        b.close()
+
+def _flasher(image):
+    # 跟 main.py 的 _burn 一樣經 runner 執行燒錄工具（不佔 -j 名額）
+    def flash_one(port, log):
+        cmd = [sys.executable, FAKE_TOOL, "-p", port, "-b", "1500000", "-f", image, "-U", "-v", "pro2", "-r"]
+        return runner.run(cmd, log=log, limit=False)[0] == 0
+    return flash_one
+
+def test_all_boards_receive_full_image(tmp_path, boards):
+    image = tmp_path / "flash_ntz.bin"
+    payload = bytes(range(256)) * 512
+    image.write_bytes(payload)
+    results = batchflash.run([b.port for b in boards], _flasher(str(image)), str(tmp_path / "logs"), jobs=2)
+    assert [r.port for r in results] == [b.port for b in boards]
+    assert all(r.ok and r.attempts == 1 for r in results)
+    for b in boards:
+        for _ in range(100):
+            if len(b.received) >= len(payload):
+                break
+            threading.Event().wait(0.02)
+        assert bytes(b.received) == payload
+
+def test_retry_and_missing_port(tmp_path, boards, monkeypatch):
+    image = tmp_path / "flash_ntz.bin"
+    image.write_bytes(b"\x5a" * 4096)
+    monkeypatch.setenv("FAKE_BURN_STATE", str(tmp_path))
+    flaky = boards[0].port
+    (tmp_path / (re.sub(r"[^A-Za-z0-9._-]", "_", flaky) + ".fail")).write_text("")
+    missing = str(tmp_path / "ttyUSB99")
+    results = batchflash.run([flaky, missing], _flasher(str(image)), str(tmp_path / "logs"), jobs=2, retries=1)
+    by_port = {r.port: r for r in results}
+    assert by_port[flaky].ok and by_port[flaky].attempts == 2
+    assert not by_port[missing].ok and by_port[missing].attempts == 2
+    with open(by_port[missing].log_path, encoding="utf-8") as f:
+        assert "open port" in f.read()
+    table = batchflash.table(results)
+    assert "1/2 passed" in table
+
+def test_expand_ports(tmp_path):
+    for n in ("ttyUSB1", "ttyUSB0", "ttyACM0"):
+        (tmp_path / n).write_text("")
+    spec = f"{tmp_path}/ttyUSB*,{tmp_path}/ttyACM0 {tmp_path}/ttyUSB0"
+    assert batchflash.expand_ports(spec) == [str(tmp_path / n) for n in ("ttyUSB0", "ttyUSB1", "ttyACM0")]
@@ -0,0 +1,24 @@
+import shutil
+
+import pytest
+
+import components
+
+def test_probe_missing_compiler_returns_none(tmp_path):
+    assert components.probe_macros([str(tmp_path / "no-such-gcc")]) is None
+
+def test_probe_reads_project_config(tmp_path):
+    if not shutil.which("gcc"):
+        pytest.skip("gcc not available")
+    (tmp_path / "platform_opts.h").write_text("#define CONFIG_BT 1\n#define LWIP_IPV6 0\n")
+    macros = components.probe_macros(["gcc", f"-I{tmp_path}"])
+    assert macros["CONFIG_BT"] == "1" and macros["LWIP_IPV6"] == "0"
+    off = {g["name"] for g in components.disabled_groups(macros)}
+    assert "bt" not in off and "lwip_ipv6" in off
+
+def test_prune_by_source_pattern():
+    macros = {"CONFIG_BT": "0", "LWIP_IPV6": "1"}
+    srcs = ["component/bluetooth/a.c", "component/lwip/lwip_v2.1.2/src/core/ipv6/ip6.c", "component/x.c"]
+    kept, dropped = components.prune(srcs, lambda s: s, macros)
+    assert "component/bluetooth/a.c" not in kept and "component/x.c" in kept
+    assert "bt" in dropped
@@ -0,0 +1,67 @@
+import shutil
+import subprocess
+
+import pytest
+
+import elfreader
+
+SOURCE = r"""
+int g_data = 3;
+const int g_ro = 4;
+int g_bss;
+int g_common;
+static int s_data = 5;
+static int s_bss;
+extern int ext_var;
+extern int ext_func(int);
+__attribute__((weak)) int weak_func(void) { return 1; }
+extern int weak_undef(void) __attribute__((weak));
+static int helper(int x) { return x + s_data + s_bss++; }
+int api(int x) { return helper(x) + ext_func(ext_var) + g_ro + (weak_undef ? weak_undef() : 0); }
+"""
+
+@pytest.fixture(scope="module")
+def elf32(tmp_path_factory):
+    # 主機 gcc -m32 產生的 ELF32 little-endian（跟 ARM 的 image 同樣格式），拿 binutils 的 nm / size 對照
+    if not all(shutil.which(t) for t in ("gcc", "nm", "size")):
+        pytest.skip("gcc / nm / size not available")
+    d = tmp_path_factory.mktemp("elf")
+    src = d / "t.c"
+    src.write_text(SOURCE)
+    obj, exe = str(d / "t.o"), str(d / "t.elf")
+    r = subprocess.run(["gcc", "-m32", "-fcommon", "-O1", "-c", str(src), "-o", obj], capture_output=True)
+    if r.returncode != 0:
+        pytest.skip("gcc -m32 not available")
+    r = subprocess.run(["gcc", "-m32", "-nostdlib", "-Wl,-e,api", "-Wl,--unresolved-symbols=ignore-all",
+                        "-o", exe, obj], capture_output=True)
+    return [obj] + ([exe] if r.returncode == 0 else [])
+
+def _nm(path):
+    return subprocess.run(["nm", "-n", path], capture_output=True, text=True, check=True).stdout
+
+def _size(path):
+    out = subprocess.run(["size", path], capture_output=True, text=True, check=True).stdout
+    text, data, bss = out.splitlines()[1].split()[:3]
+    return {"text": int(text), "data": int(data), "bss": int(bss)}
+
+def test_nm_matches_binutils(elf32):
+    for path in elf32:
+        assert "".join(elfreader.load(path).nm_lines()) == _nm(path), path
+
+def test_size_matches_binutils(elf32):
+    for path in elf32:
+        assert elfreader.load(path).size_summary() == _size(path), path
+
+def test_write_sizes_and_nm(elf32, tmp_path):
+    elf = elfreader.load(elf32[0])
+    elf.write_nm(str(tmp_path / "t.nm.map"))
+    elf.write_sizes(str(tmp_path / "t.sections.txt"))
+    assert (tmp_path / "t.nm.map").read_text() == _nm(elf32[0])
+    s = _size(elf32[0])
+    assert f"text={s['text']} data={s['data']} bss={s['bss']}" in (tmp_path / "t.sections.txt").read_text()
+
+def test_rejects_non_elf(tmp_path):
+    bad = tmp_path / "bad.elf"
+    bad.write_bytes(b"not an elf file at all" * 4)
+    with pytest.raises(elfreader.ELFError):
+        elfreader.load(str(bad))
@@ -0,0 +1,86 @@
+import json
+
+from flashimage import FlashImage, load_layout
+
+LAYOUT = {"boot": (0x0, 0x100), "app": (0x200, 0x300)}
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _combine(image, parts):
+    # 假的 elf2bin combine：0xFF 底，分區放在 LAYOUT 位址上，長度到最後一個分區的內容為止
+    def _run():
+        blobs = {name: open(path, "rb").read() for name, path in parts}
+        end = max(LAYOUT[n][0] + len(b) for n, b in blobs.items())
+        buf = bytearray(b"\xff") * end
+        for name, data in blobs.items():
+            buf[LAYOUT[name][0]:LAYOUT[name][0] + len(data)] = data
+        _write(image, bytes(buf))
+        _run.calls += 1
+    _run.calls = 0
+    return _run
+
+def _setup(tmp_path):
+    boot, app = str(tmp_path / "boot.bin"), str(tmp_path / "app.bin")
+    _write(boot, b"B" * 0x80)
+    _write(app, b"A" * 0x100)
+    parts = [("boot", boot), ("app", app)]
+    image = str(tmp_path / "flash.bin")
+    return image, parts, _combine(image, parts)
+
+def test_full_then_unchanged(tmp_path):
+    image, parts, combine = _setup(tmp_path)
+    fi = FlashImage(image, "k1")
+    assert fi.assemble(parts, LAYOUT, combine) == "full"
+    assert fi.valid_manifest()["parts"]["boot"] == {
+        "offset": 0, "length": 0x100, "size": 0x80, "sha": fi.manifest()["parts"]["boot"]["sha"]}
+    assert fi.assemble(parts, LAYOUT, combine) == "unchanged"
+    assert combine.calls == 1
+
+def test_patch_matches_full_combine(tmp_path):
+    image, parts, combine = _setup(tmp_path)
+    fi = FlashImage(image, "k1")
+    fi.assemble(parts, LAYOUT, combine)
+    _write(parts[0][1], b"b" * 0x40)
+    assert fi.assemble(parts, LAYOUT, combine) == "patched: boot"
+    assert combine.calls == 1
+    patched = open(image, "rb").read()
+    combine()
+    assert patched == open(image, "rb").read()
+
+def test_falls_back_to_full(tmp_path):
+    image, parts, combine = _setup(tmp_path)
+    fi = FlashImage(image, "k1")
+    fi.assemble(parts, LAYOUT, combine)
+    # 最後一個分區大小改變：image 總長不同
+    _write(parts[1][1], b"a" * 0x120)
+    assert fi.assemble(parts, LAYOUT, combine) == "full"
+    # layout key 改變
+    assert FlashImage(image, "k2").assemble(parts, LAYOUT, combine) == "full"
+    # image 被 assembler 以外的流程改過
+    _write(image, open(image, "rb").read() + b"\0")
+    assert fi.valid_manifest() is None
+    assert combine.calls == 3
+
+def test_verify_rejects_non_erased_gap(tmp_path):
+    image, parts, combine = _setup(tmp_path)
+
+    def _dirty():
+        combine()
+        data = bytearray(open(image, "rb").read())
+        data[0x150] = 0
+        _write(image, bytes(data))
+
+    fi = FlashImage(image, "k1")
+    assert fi.assemble(parts, LAYOUT, _dirty) == "full"
+    assert fi.manifest() is None
+
+def test_load_layout(tmp_path):
+    path = str(tmp_path / "partitiontable.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"partitions": [{"type": "boot", "start_addr": "0x4000", "length": "0x10000"},
+                                  {"type": "fw1", "start_addr": 81920, "length": "0x200000"}],
+                   "nn": {"offset": "0x770000", "size": "0x700000"},
+                   "bogus": {"start": "xyz", "len": 1}}, f)
+    assert load_layout(path) == {"boot": (0x4000, 0x10000), "fw1": (81920, 0x200000), "nn": (0x770000, 0x700000)}
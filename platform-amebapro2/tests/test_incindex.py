@@ -0,0 +1,32 @@
+import os
+
+import incindex
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+
+def test_prune_only_drops_sdk_dirs(tmp_path):
+    sdk = str(tmp_path / "sdk")
+    proj = str(tmp_path / "proj" / "include")
+    build = str(tmp_path / "build" / "gen")
+    _touch(os.path.join(sdk, "a", "x.h"))
+    _touch(os.path.join(sdk, "b", "x.h"))
+    os.makedirs(os.path.join(sdk, "empty"))
+    os.makedirs(proj)
+    index = incindex.HeaderIndex([sdk, proj], str(tmp_path / "cache" / "index.json"), "rev", sdk)
+    dirs = [proj, build, os.path.join(sdk, "a"), os.path.join(sdk, "b"), os.path.join(sdk, "empty"),
+            os.path.join(sdk, "missing")]
+    kept, dropped = index.prune(dirs)
+    assert kept == [proj, build, os.path.join(sdk, "a")]
+    assert sorted(r for _, r in dropped) == ["empty", "missing", "shadowed"]
+
+def test_generated_project_header_is_found(tmp_path):
+    sdk = str(tmp_path / "sdk")
+    proj = str(tmp_path / "proj" / "include")
+    _touch(os.path.join(sdk, "inc", "build_info.h"))
+    os.makedirs(proj)
+    index = incindex.HeaderIndex([sdk, proj], str(tmp_path / "index.json"), "rev", sdk)
+    _touch(os.path.join(proj, "build_info.h"))
+    dirs = (proj, os.path.join(sdk, "inc"))
+    assert index.resolve("build_info.h", dirs) == os.path.join(proj, "build_info.h")
@@ -0,0 +1,45 @@
+import os
+import threading
+
+from keystore import KeyStore, PRIVATE, PUBLIC
+
+def test_concurrent_ensure_uses_one_key(tmp_path):
+    cfg = str(tmp_path / "key_cfg.json")
+    with open(cfg, "w") as f:
+        f.write('{"alg": "ecc"}')
+    store = KeyStore(str(tmp_path / "keys"))
+    start = threading.Barrier(8)
+    results = []
+
+    def keygen(cwd):
+        # 每次產生的 key 都不一樣，併發時只能有一份生效
+        for name in (PUBLIC, PRIVATE):
+            with open(os.path.join(cwd, name), "w") as f:
+                f.write(f"{name}:{threading.get_ident()}")
+        with open(os.path.join(cwd, "log.txt"), "w") as f:
+            f.write("noise")
+
+    def run():
+        start.wait()
+        public, private, created = store.ensure(cfg, keygen)
+        with open(public) as f, open(private) as g:
+            results.append((f.read(), g.read(), created))
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 8 and len({r[:2] for r in results}) == 1
+    assert sum(r[2] for r in results) == 1
+    assert sorted(os.listdir(store.slot(cfg))) == ["key_cfg.json", PRIVATE, PUBLIC]
+    assert [n for n in os.listdir(store.root) if n.startswith(".keygen-")] == []
+    assert store.ensure(cfg, keygen)[2] is False
+
+def test_slot_per_cfg_content(tmp_path):
+    store = KeyStore(str(tmp_path / "keys"))
+    a, b = str(tmp_path / "a.json"), str(tmp_path / "b.json")
+    for p, text in ((a, "1"), (b, "2")):
+        with open(p, "w") as f:
+            f.write(text)
+    assert store.slot(a) != store.slot(b)
@@ -0,0 +1,39 @@
+import os
+
+from objcache import ObjCache
+
+def _put(path, size, mtime):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (mtime, mtime))
+
+def test_prune_removes_least_recently_used(tmp_path):
+    root = str(tmp_path)
+    cache = ObjCache(root, "/sdk")
+    old = os.path.join(root, "aa", "aa01.o")
+    mid = os.path.join(root, "archives", "libsdk_lwip-0123456789abcdef.a")
+    new = os.path.join(root, "bb", "bb02.o")
+    _put(old, 100, 1000)
+    _put(mid, 100, 2000)
+    _put(new, 100, 3000)
+    _put(os.path.join(root, "cc", "cc03.o.1.2.tmp"), 500, 0)
+    assert cache.prune(250) == (1, 100)
+    assert not os.path.exists(old) and os.path.exists(mid) and os.path.exists(new)
+    assert cache.prune(1000) == (0, 0)
+
+def test_archive_hit_is_counted_and_touched(tmp_path):
+    root = str(tmp_path)
+    cache = ObjCache(root, "/sdk")
+    assert cache.report() is None
+    src = str(tmp_path / "lib.a")
+    _put(src, 10, 1000)
+    key = "0123456789abcdef" * 4
+    cache.store_archive(src, "lwip", key)
+    path = cache.archive("lwip", key)
+    os.utime(path, (1000, 1000))
+    assert cache.archive("lwip", key) == path
+    assert os.path.getmtime(path) > 1000
+    assert cache.archive("lwip", "f" * 64) is None
+    assert cache.archive_hits == 2 and cache.archive_stores == 1
+    assert "archives: 2 reused, 1 stored" in cache.report()
@@ -0,0 +1,47 @@
+import os
+
+import pch
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+def _headers(tmp_path, names):
+    return [_write(str(tmp_path / "inc" / n), "") for n in names]
+
+def test_eligible_requires_exact_leading_sequence(tmp_path):
+    headers = _headers(tmp_path, ["FreeRTOS.h", "task.h"])
+    ok = _write(str(tmp_path / "src" / "ok.c"), '/* x */\n#include "FreeRTOS.h"\n#include <task.h>\n#include "x.h"\n')
+    order = _write(str(tmp_path / "src" / "order.c"), '#include "task.h"\n#include "FreeRTOS.h"\n')
+    define = _write(str(tmp_path / "src" / "define.c"), '#define X 1\n#include "FreeRTOS.h"\n#include "task.h"\n')
+    other = _write(str(tmp_path / "src" / "other.c"), '#include "x.h"\n#include "FreeRTOS.h"\n#include "task.h"\n')
+    subdir = _write(str(tmp_path / "src" / "subdir.c"), '#include "rtos/FreeRTOS.h"\n#include "task.h"\n')
+    assert pch.eligible(ok, headers)
+    assert not pch.eligible(order, headers)
+    assert not pch.eligible(define, headers)
+    assert not pch.eligible(other, headers)
+    assert not pch.eligible(subdir, headers)
+
+def test_eligible_rejects_shadowing_quote_include(tmp_path):
+    headers = _headers(tmp_path, ["diag.h"])
+    src = _write(str(tmp_path / "src" / "a.c"), '#include "diag.h"\n')
+    assert pch.eligible(src, headers)
+    _write(str(tmp_path / "src" / "diag.h"), "")
+    assert not pch.eligible(src, headers)
+    angle = _write(str(tmp_path / "src" / "b.c"), "#include <diag.h>\n")
+    assert pch.eligible(angle, headers)
+
+def test_choose_most_shared_prefix(tmp_path):
+    headers = _headers(tmp_path, ["platform_opts.h", "FreeRTOS.h", "task.h", "cmsis.h"])
+    srcs = []
+    for i in range(3):
+        srcs.append(_write(str(tmp_path / "src" / f"rtos{i}.c"),
+                           '#include "platform_opts.h"\n#include "FreeRTOS.h"\n#include "task.h"\n'))
+    srcs.append(_write(str(tmp_path / "src" / "hal.c"), '#include "cmsis.h"\n'))
+    srcs.append(_write(str(tmp_path / "src" / "opts.c"), '#include "platform_opts.h"\n#include "cmsis.h"\n'))
+    chosen = pch.choose(srcs, headers)
+    assert [os.path.basename(h) for h in chosen] == ["platform_opts.h", "FreeRTOS.h", "task.h"]
+    assert [s for s in srcs if pch.eligible(s, chosen)] == srcs[:3]
+    assert pch.choose([srcs[3]], headers[:3]) == []
@@ -0,0 +1,32 @@
+import os
+
+from sigcache import SigCache
+
+def _file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def test_key_depends_on_contents(tmp_path):
+    cache = SigCache(str(tmp_path / "cache"))
+    image = _file(str(tmp_path / "fw.bin"), b"image")
+    tool = _file(str(tmp_path / "elf2bin"), b"tool")
+    key = _file(str(tmp_path / "key_private.json"), b"k1")
+    k1 = cache.key("sign", image, [key], tool)
+    assert k1 == cache.key("sign", image, [key], tool)
+    assert k1 != cache.key("hash", image, [key], tool)
+    _file(key, b"k2")
+    assert k1 != cache.key("sign", image, [key], tool)
+
+def test_store_fetch_and_prune(tmp_path):
+    cache = SigCache(str(tmp_path / "cache"), keep=2)
+    src = _file(str(tmp_path / "signed.bin"), b"signed")
+    dst = str(tmp_path / "out.bin")
+    assert cache.fetch("aa" + "0" * 62, dst) is False
+    for i, key in enumerate(("aa" + "0" * 62, "bb" + "1" * 62, "cc" + "2" * 62)):
+        cache.store(key, src)
+        os.utime(cache._blob(key), (1000 + i, 1000 + i))
+    cache.store("cc" + "2" * 62, src)
+    assert not os.path.exists(cache._blob("aa" + "0" * 62))
+    assert cache.fetch("bb" + "1" * 62, dst) is True
+    assert open(dst, "rb").read() == b"signed"
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+import sparseimage
+
+def _image():
+    s = sparseimage.SECTOR
+    data = bytearray(b"\xff") * (s * 8 + 100)
+    data[0:10] = b"0123456789"
+    data[s + 5] = 0           # 跟第 0 個 sector 連在一起
+    data[s * 4:s * 5] = b"\x5a" * s
+    data[s * 8 + 99] = 1      # 最後一個不滿 sector 的區塊
+    return bytes(data)
+
+def test_chunks():
+    s = sparseimage.SECTOR
+    assert sparseimage.chunks(_image()) == [(0, 2 * s), (4 * s, s), (8 * s, 100)]
+    assert sparseimage.chunks(b"\xff" * s * 2) == []
+
+def test_round_trip(tmp_path):
+    image, sparse, manifest = (str(tmp_path / n) for n in ("flash.bin", "flash.bin.sparse", "flash.bin.sparse.json"))
+    with open(image, "wb") as f:
+        f.write(_image())
+    m = sparseimage.write(image, sparse, manifest)
+    assert [(c["offset"], c["length"]) for c in m["chunks"]] == sparseimage.chunks(_image())
+    assert os.path.getsize(sparse) < len(_image())
+    size, chunks = sparseimage.read(sparse)
+    assert size == len(_image()) and [off for off, _ in chunks] == [c["offset"] for c in m["chunks"]]
+    out = str(tmp_path / "out.bin")
+    sparseimage.expand(sparse, out)
+    assert open(out, "rb").read() == _image()
+
+def test_current_tracks_image(tmp_path):
+    image, sparse, manifest = (str(tmp_path / n) for n in ("flash.bin", "flash.bin.sparse", "flash.bin.sparse.json"))
+    with open(image, "wb") as f:
+        f.write(_image())
+    sparseimage.write(image, sparse, manifest)
+    assert sparseimage.current(image, manifest) is not None
+    with open(image, "r+b") as f:
+        f.seek(20)
+        f.write(b"x")
+    assert sparseimage.current(image, manifest) is None
+
+def test_read_rejects_bad_magic(tmp_path):
+    bad = str(tmp_path / "bad.sparse")
+    with open(bad, "wb") as f:
+        f.write(b"\0" * 32)
+    with pytest.raises(ValueError):
+        sparseimage.read(bad)
@@ -0,0 +1,40 @@
+import os
+
+from stampdb import StampDB
+
+def test_step_skips_and_restores(tmp_path):
+    out = str(tmp_path / "out.bin")
+    calls = []
+
+    def build():
+        calls.append(1)
+        with open(out, "wb") as f:
+            f.write(b"result")
+
+    db = StampDB(str(tmp_path / "stamps"))
+    assert db.step("elf2bin", "k1", [out], build) is True
+    os.remove(out)
+    # 新的 process（重新載入 stamps.json）也要能命中並還原輸出
+    db = StampDB(str(tmp_path / "stamps"))
+    assert db.step("elf2bin", "k1", [out], build) is False
+    assert open(out, "rb").read() == b"result" and len(calls) == 1
+    assert db.step("elf2bin", "k2", [out], build) is True and len(calls) == 2
+
+def test_missing_output_is_not_recorded(tmp_path):
+    db = StampDB(str(tmp_path / "stamps"))
+    out = str(tmp_path / "never.bin")
+    assert db.step("broken", "k", [out], lambda: None) is True
+    assert db.fresh("broken", "k", [out]) is False
+
+def test_digest_tracks_content(tmp_path):
+    db = StampDB(str(tmp_path / "stamps"))
+    src = str(tmp_path / "a.c")
+    with open(src, "w") as f:
+        f.write("int a;")
+    d1 = db.digest(files=[src], extra=["-Os"])
+    assert d1 == db.digest(files=[src], extra=["-Os"])
+    assert d1 != db.digest(files=[src], extra=["-O2"])
+    with open(src, "w") as f:
+        f.write("int b;")
+    os.utime(src, ns=(1, 1))
+    assert d1 != db.digest(files=[src], extra=["-Os"])
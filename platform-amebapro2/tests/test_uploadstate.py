@@ -0,0 +1,58 @@
+from uploadstate import BaudCache, DeviceState, changed_partitions, region
+
+RATES = [3000000, 1500000, 921600, 115200]
+
+def _manifest(key="k", **parts):
+    return {"layout_key": key, "parts": {n: {"offset": o, "length": 0x1000, "size": sz, "sha": sha}
+                                         for n, (o, sz, sha) in parts.items()}}
+
+def test_changed_partitions(tmp_path):
+    device = DeviceState(str(tmp_path), "/dev/ttyUSB0")
+    assert changed_partitions(_manifest(boot=(0, 10, "a")), device.load()) is None
+    last = _manifest(boot=(0, 10, "a"), app=(0x1000, 20, "b"), nn=(0x2000, 30, "c"))
+    device.save(last["layout_key"], last["parts"])
+    assert changed_partitions(last, device.load()) == []
+    now = _manifest(boot=(0, 10, "a"), app=(0x1000, 16, "x"), nn=(0x2000, 30, "y"))
+    assert changed_partitions(now, device.load()) == ["app", "nn"]
+    # 分區表或分區集合不同就無法比較
+    assert changed_partitions(_manifest("k2", **{n: (p["offset"], p["size"], p["sha"])
+                                                for n, p in last["parts"].items()}), device.load()) is None
+    assert changed_partitions(_manifest(boot=(0, 10, "a")), device.load()) is None
+    device.forget()
+    assert device.load() is None
+
+def test_region_covers_longer_old_content():
+    last = _manifest(app=(0x1000, 20, "b"))
+    assert region(_manifest(app=(0x1000, 16, "x")), last, "app") == (0x1000, 20)
+    assert region(_manifest(app=(0x1000, 32, "x")), last, "app") == (0x1000, 32)
+
+def test_ladder_starts_at_best(tmp_path):
+    bauds = BaudCache(str(tmp_path), "/dev/ttyUSB0")
+    assert bauds.ladder(RATES) == RATES
+    bauds.record(3000000, False, 100, 1.0)
+    bauds.record(1500000, True, 100, 1.0)
+    assert bauds.ladder(RATES) == [1500000, 921600, 115200]
+
+def test_probe_one_step_higher_after_clean_runs(tmp_path):
+    bauds = BaudCache(str(tmp_path), "COM3", probe_after=3)
+    bauds.record(921600, True, 100, 1.0)
+    for _ in range(3):
+        assert bauds.ladder(RATES)[0] == 921600
+        bauds.record(921600, True, 100, 1.0)
+    assert bauds.ladder(RATES) == [1500000, 921600, 115200]
+
+    # 高一階失敗：回到 best，重新累積
+    bauds.record(1500000, False, 100, 1.0)
+    assert bauds.ladder(RATES)[0] == 921600
+    for _ in range(3):
+        bauds.record(921600, True, 100, 1.0)
+
+    # 高一階成功：best 往上
+    bauds.record(1500000, True, 100, 1.0)
+    assert bauds.ladder(RATES) == [1500000, 921600, 115200]
+
+def test_fixed_rate_does_not_learn(tmp_path):
+    bauds = BaudCache(str(tmp_path), "COM4")
+    bauds.record(115200, True, 100, 1.0, learn=False)
+    assert bauds.ladder(RATES) == RATES
+    assert bauds.load()["attempts"][0]["bytes_per_sec"] == 100